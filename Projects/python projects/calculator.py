@@ -1,21 +1,68 @@
 from __future__ import annotations
 
 import ast
+import atexit
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import itertools
+import json
+import multiprocessing
 import operator
 import math
+import mmap
+import os
+import struct
 import sys
-from typing import Any, Dict, Callable, Optional
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Callable, Iterable, Iterator, Optional, Sequence
 
-# Optional Tkinter GUI
+
+def _lazy_module(name: str) -> Any:
+    """Import *name* on first attribute access instead of now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# asyncio costs more to import than the rest of the module; only the
+# async evaluator needs it.
+asyncio = _lazy_module("asyncio")
+
+# Optional Tkinter GUI, imported by _load_gui() so the CLI paths never pay
+# for Tk.
+tk = None  # type: ignore
+ttk = None  # type: ignore
+_GUI_AVAILABLE = importlib.util.find_spec("tkinter") is not None
+
+# Optional NumPy for vectorized evaluation
 try:
-    import tkinter as tk
-    from tkinter import ttk
+    import numpy as np
 
-    _GUI_AVAILABLE = True
+    _NUMPY_AVAILABLE = True
 except Exception:
-    tk = None  # type: ignore
-    ttk = None  # type: ignore
-    _GUI_AVAILABLE = False
+    np = None  # type: ignore
+    _NUMPY_AVAILABLE = False
+
+# fcntl is POSIX-only; without it the disk cache index is updated unlocked.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
 
 
 # ---------------------------
@@ -45,13 +92,68 @@ _MATH_FUNCS: Dict[str, Callable[..., Any]] = {
 }
 
 
+_CONSTANTS: Dict[str, float] = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+if _NUMPY_AVAILABLE:
+
+    def _np_log(x: Any, base: Any = None) -> Any:
+        if base is None:
+            return np.log(x)
+        return np.log(x) / np.log(base)
+
+    _NUMPY_FUNCS: Dict[str, Callable[..., Any]] = {
+        "sqrt": np.sqrt,
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "log": _np_log,
+        "ln": np.log,
+        "log10": np.log10,
+        "abs": np.abs,
+        "pow": np.power,
+    }
+
+
 class CalcError(Exception):
     """Raised for calculator evaluation errors."""
 
 
-def _eval_node(node: ast.AST) -> float:
+def _apply_binary(op: ast.operator, left: Any, right: Any) -> Any:
+    op_type = type(op)
+    if op_type in _OPERATORS:
+        try:
+            return _OPERATORS[op_type](left, right)
+        except Exception as e:
+            raise CalcError(str(e))
+    raise CalcError("Unsupported binary operator")
+
+
+def _call_target(
+    node: ast.Call, funcs: Dict[str, Callable[..., Any]] = _MATH_FUNCS
+) -> Callable[..., Any]:
+    if isinstance(node.func, ast.Name) and node.func.id in funcs:
+        return funcs[node.func.id]
+    raise CalcError("Unsupported function call")
+
+
+def _apply_call(func: Callable[..., Any], args: list[Any]) -> Any:
+    try:
+        return func(*args)
+    except Exception as e:
+        raise CalcError(str(e))
+
+
+def _eval_node(
+    node: ast.AST,
+    env: Optional[Dict[str, Any]] = None,
+    funcs: Dict[str, Callable[..., Any]] = _MATH_FUNCS,
+) -> float:
     if isinstance(node, ast.Expression):
-        return _eval_node(node.body)
+        return _eval_node(node.body, env, funcs)
 
     if isinstance(node, ast.Num):  # Py <3.8
         return node.n
@@ -61,48 +163,39 @@ def _eval_node(node: ast.AST) -> float:
         raise CalcError("Unsupported constant")
 
     if isinstance(node, ast.BinOp):
-        left = _eval_node(node.left)
-        right = _eval_node(node.right)
-        op_type = type(node.op)
-        if op_type in _OPERATORS:
-            try:
-                return _OPERATORS[op_type](left, right)
-            except Exception as e:
-                raise CalcError(str(e))
-        raise CalcError("Unsupported binary operator")
+        left = _eval_node(node.left, env, funcs)
+        right = _eval_node(node.right, env, funcs)
+        return _apply_binary(node.op, left, right)
 
     if isinstance(node, ast.UnaryOp):
         op_type = type(node.op)
         if op_type in _OPERATORS:
-            return _OPERATORS[op_type](_eval_node(node.operand))
+            return _OPERATORS[op_type](_eval_node(node.operand, env, funcs))
         raise CalcError("Unsupported unary operator")
 
     if isinstance(node, ast.Call):
-        if isinstance(node.func, ast.Name):
-            func_name = node.func.id
-            if func_name in _MATH_FUNCS:
-                args = [_eval_node(arg) for arg in node.args]
-                try:
-                    return _MATH_FUNCS[func_name](*args)
-                except Exception as e:
-                    raise CalcError(str(e))
-        raise CalcError("Unsupported function call")
+        func = _call_target(node, funcs)
+        return _apply_call(func, [_eval_node(arg, env, funcs) for arg in node.args])
 
     if isinstance(node, ast.Name):
-        if node.id == "pi":
-            return math.pi
-        if node.id == "e":
-            return math.e
+        if node.id in _CONSTANTS:
+            return _CONSTANTS[node.id]
+        if env is not None and node.id in env:
+            return env[node.id]
         raise CalcError(f"Unknown identifier: {node.id}")
 
     raise CalcError("Unsupported expression")
 
 
-def evaluate_expression(expr: str) -> float:
+def _normalize_operators(expr: str) -> str:
+    return expr.replace("×", "*").replace("÷", "/").replace("−", "-")
+
+
+def _parse_expression(expr: str) -> ast.Expression:
     if not expr or expr.strip() == "":
         raise CalcError("Empty expression")
 
-    expr = expr.replace("×", "*").replace("÷", "/").replace("−", "-")
+    expr = _normalize_operators(expr)
 
     try:
         parsed = ast.parse(expr, mode="eval")
@@ -123,283 +216,4910 @@ def evaluate_expression(expr: str) -> float:
         ):
             raise CalcError("Disallowed expression")
 
-    return float(_eval_node(parsed))
+    return parsed
 
 
-# ---------------------------
-# GUI
-# ---------------------------
+def _free_variables(tree: ast.AST) -> frozenset[str]:
+    # ast.walk yields a Call before its func, so one pass is enough.
+    callees: set[int] = set()
+    names: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            callees.add(id(node.func))
+        elif isinstance(node, ast.Name) and id(node) not in callees and node.id not in _CONSTANTS:
+            names.add(node.id)
+    return frozenset(names)
 
-if _GUI_AVAILABLE:
 
-    class CalculatorUI(ttk.Frame):
-        def __init__(self, master: tk.Tk | tk.Widget):
-            super().__init__(master, padding=12)
-            self.master = master
-            self._make_style()
-            self.pack(expand=True, fill=tk.BOTH)
-            self._create_widgets()
-            self.history: list[str] = []
+def _check_supported(tree: ast.AST, variables: frozenset[str]) -> None:
+    """Raise the CalcError _eval_node would raise for structural problems.
 
-        def _make_style(self) -> None:
-            style = ttk.Style()
-            try:
-                style.theme_use("clam")
-            except Exception:
-                pass
-            style.configure("TButton", font=("Segoe UI", 12), padding=8)
-            style.configure("Display.TEntry", font=("Segoe UI", 18))
+    Used by the vectorized paths, where an error raised for one point would
+    otherwise be indistinguishable from a domain error such as sqrt(-1).
+    """
+    callees = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise CalcError("Unsupported constant")
+        if isinstance(node, ast.BinOp) and type(node.op) not in _OPERATORS:
+            raise CalcError("Unsupported binary operator")
+        if isinstance(node, ast.UnaryOp) and type(node.op) not in _OPERATORS:
+            raise CalcError("Unsupported unary operator")
+        if isinstance(node, ast.Call):
+            _call_target(node)
+            callees.add(id(node.func))
+        if isinstance(node, ast.Name):
+            if id(node) in callees:
+                continue
+            if node.id not in _CONSTANTS and node.id not in variables:
+                raise CalcError(f"Unknown identifier: {node.id}")
+        elif not isinstance(
+            node,
+            (
+                ast.Expression,
+                ast.Constant,
+                ast.BinOp,
+                ast.UnaryOp,
+                ast.Call,
+                ast.expr_context,
+                ast.operator,
+                ast.unaryop,
+            ),
+        ):
+            raise CalcError("Unsupported expression")
 
-        def _create_widgets(self) -> None:
-            self.display_var = tk.StringVar()
-            self.display = ttk.Entry(
-                self,
-                textvariable=self.display_var,
-                justify="right",
-                style="Display.TEntry",
-            )
-            self.display.grid(row=0, column=0, columnspan=4, sticky="nsew", pady=(0, 8))
 
-            # Bind key events to Entry only
-            self.display.bind("<Key>", self._on_keypress)
+class CompiledExpression:
+    """A parsed and validated expression that can be evaluated many times."""
 
-            buttons = [
-                ("C", "C"),
-                ("←", "back"),
-                ("%", "%"),
-                ("÷", "/"),
-                ("7", "7"),
-                ("8", "8"),
-                ("9", "9"),
-                ("×", "*"),
-                ("4", "4"),
-                ("5", "5"),
-                ("6", "6"),
-                ("−", "-"),
-                ("1", "1"),
-                ("2", "2"),
-                ("3", "3"),
-                ("+", "+"),
-                ("±", "neg"),
-                ("0", "0"),
-                (".", "."),
-                ("=", "equal"),
-            ]
+    def __init__(self, source: str, tree: ast.Expression, text: Optional[bytes] = None):
+        self.source = source
+        self.tree = tree
+        # The UTF-8 text the tree's node positions index into, or None when
+        # the tree was not parsed from ``source`` (e.g. loaded from cache).
+        self.text = text
+        self.variables = _free_variables(tree)
 
-            r, c = 1, 0
-            for label, action in buttons:
-                ttk.Button(
-                    self, text=label, command=lambda a=action: self._on_press(a)
-                ).grid(row=r, column=c, sticky="nsew", padx=4, pady=4)
-                c += 1
-                if c > 3:
-                    c = 0
-                    r += 1
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.source!r})"
 
-            for i in range(6):
-                self.rowconfigure(i, weight=1)
-            for i in range(4):
-                self.columnconfigure(i, weight=1)
+    def evaluate(self, env: Optional[Dict[str, Any]] = None) -> float:
+        return float(_eval_node(self.tree, env))
 
-        # Insert text at cursor position
-        def _insert_text(self, text: str) -> None:
-            pos = int(self.display.index(tk.INSERT))
-            self.display.insert(pos, text)
+    def evaluate_vectorized(self, env: Dict[str, Any]) -> Any:
+        """Evaluate over NumPy arrays in one pass.
 
-        # Delete character before cursor
-        def _delete_back(self) -> None:
-            pos = int(self.display.index(tk.INSERT))
-            if pos > 0:
-                self.display.delete(pos - 1, pos)
+        Follows NumPy semantics for points outside a function's domain:
+        they come out as ``nan`` (or ``inf``) instead of raising.
+        """
+        if not _NUMPY_AVAILABLE:
+            raise CalcError("NumPy is required for vectorized evaluation")
+        _check_supported(self.tree, frozenset(env))
+        arrays = {name: np.asarray(value, dtype=float) for name, value in env.items()}
+        with np.errstate(all="ignore"):
+            result = _eval_node(self.tree, arrays, _NUMPY_FUNCS)
+        shape = np.broadcast_shapes(*(a.shape for a in arrays.values())) if arrays else ()
+        return np.broadcast_to(np.asarray(result, dtype=float), shape).copy()
 
-        def _on_press(self, action: str) -> None:
-            if action == "C":
-                self.display_var.set("")
-                self.display.icursor(tk.END)
-                return
-            if action == "back":
-                self._delete_back()
-                return
-            if action == "neg":
-                text = self.display_var.get()
-                if text.startswith("-"):
-                    self.display_var.set(text[1:])
-                else:
-                    self.display_var.set("-" + text)
-                self.display.icursor(tk.END)
-                return
-            if action == "equal":
-                self._on_equal()
-                return
-            self._insert_text(action)
 
-        def _on_keypress(self, event: tk.Event) -> Optional[str]:
-            key = event.keysym
-            char = event.char
+def _compile_tree(expr: str) -> tuple[ast.Expression, Optional[bytes]]:
+    tree = _parse_expression(expr)
+    inlined = False
+    if _USER_FUNCS:
+        inliner = _Inliner()
+        tree = inliner.visit(tree)
+        inlined = inliner.inlined
+    if _free_variables(tree):
+        # Constant-only expressions are evaluated once anyway; folding them
+        # would only do the same work twice.
+        tree = _fold_constants(tree)
+    if inlined:
+        ast.fix_missing_locations(tree)
+        # Inlined nodes carry positions from the function body, not ``expr``.
+        return tree, None
+    return tree, _normalize_operators(expr).encode("utf-8")
 
-            # Enter evaluates
-            if key in ("Return", "KP_Enter"):
-                self._on_equal()
-                return "break"
 
-            # Escape clears
-            if key == "Escape":
-                self.display_var.set("")
-                return "break"
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expr: str) -> CompiledExpression:
+    cache = _DISK_CACHE
+    if cache is None:
+        return CompiledExpression(expr, *_compile_tree(expr))
 
-            # Allow navigation keys
-            if key in (
-                "Left", "Right", "Up", "Down",
-                "Home", "End", "Tab",
-                "Shift_L", "Shift_R",
-                "Control_L", "Control_R"
-            ):
-                return None
+    key = _normalize_source(expr) + _definitions_suffix()
+    tree = cache.load(key)
+    if tree is not None:
+        return CompiledExpression(expr, tree)
+    start = time.perf_counter()
+    tree, text = _compile_tree(expr)
+    cache.store(key, tree, time.perf_counter() - start)
+    return CompiledExpression(expr, tree, text)
 
-            # Allow Backspace/Delete default behavior
-            if key in ("BackSpace", "Delete"):
-                return None
 
-            # Only allow calculator characters
-            allowed = "0123456789.+-*/()%"
-            if char in allowed:
-                self._insert_text(char)
-                return "break"
+def evaluate_expression(expr: str) -> float:
+    return compile_expression(expr).evaluate()
 
-            # Block all other characters
-            return "break"
 
-        def _on_equal(self) -> None:
-            expr = self.display_var.get()
-            try:
-                result = evaluate_expression(expr)
-            except CalcError:
-                self._show_error("Error")
-                return
-            out = str(int(result)) if result.is_integer() else str(result)
-            self.history.append(f"{expr} = {out}")
-            self.display_var.set(out)
-            self.display.icursor(tk.END)
+# ---------------------------
+# User-defined functions
+# ---------------------------
 
-        def _show_error(self, msg: str) -> None:
-            self.display_var.set("Error")
-            self.after(1000, lambda: self.display_var.set(""))
+# Subtrees estimated to cost more than this are left for evaluation time
+# rather than folded, so compiling 9**9**9 does not hang.
+_FOLD_MAX_COST = 10_000.0
 
 
-# ---------------------------
-# CLI
-# ---------------------------
+class UserFunction:
+    """A named expression-level function such as ``hyp(a, b) = sqrt(a**2 + b**2)``."""
 
-def _evaluate_lines(lines: list[str]) -> None:
-    for line in lines:
-        s = line.strip()
-        if not s:
-            continue
-        try:
-            print(evaluate_expression(s))
-        except CalcError as e:
-            print("Error:", e)
+    def __init__(self, name: str, params: tuple[str, ...], body: ast.expr, source: str):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.source = source
 
+    def __repr__(self) -> str:
+        return f"UserFunction({self.source!r})"
 
-def cli_repl(non_interactive_fallback: Optional[list[str]] = None) -> None:
-    if non_interactive_fallback:
-        _evaluate_lines(non_interactive_fallback)
-        return
 
-    try:
-        if not sys.stdin.isatty():
-            data = sys.stdin.read()
-            if data:
-                _evaluate_lines(data.splitlines())
-                return
-    except Exception:
-        pass
+_USER_FUNCS: Dict[str, UserFunction] = {}
 
-    if sys.stdin.isatty():
-        print("Calculator CLI. Type 'quit' or 'exit' to leave.")
-        while True:
-            try:
-                expr = input("> ")
-            except (EOFError, KeyboardInterrupt, OSError):
-                print()
-                return
 
-            if expr is None:
-                return
-            if expr.lower().strip() in ("quit", "exit"):
-                return
+def _instantiate(node: ast.AST, mapping: Dict[str, ast.expr]) -> ast.AST:
+    # A fresh copy of ``node`` with parameter names replaced by fresh copies
+    # of the argument subtrees; much cheaper than copy.deepcopy on ASTs.
+    if isinstance(node, ast.Name) and node.id in mapping:
+        return _instantiate(mapping[node.id], {})
+    new = node.__class__()
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(node, ast.Call) and field == "func":
+            pass
+        elif isinstance(value, ast.AST):
+            value = _instantiate(value, mapping)
+        elif isinstance(value, list):
+            value = [_instantiate(v, mapping) if isinstance(v, ast.AST) else v for v in value]
+        setattr(new, field, value)
+    for attr in node._attributes:
+        if hasattr(node, attr):
+            setattr(new, attr, getattr(node, attr))
+    return new
 
-            expr = expr.strip()
-            if not expr:
-                continue
 
-            try:
-                print(evaluate_expression(expr))
-            except CalcError as e:
-                print("Error:", e)
-        return
+class _Inliner(ast.NodeTransformer):
+    """Replaces calls to user functions with their bodies."""
 
-    print("No interactive stdin available and no expressions provided.")
+    def __init__(self) -> None:
+        self.stack: list[str] = []
+        self.inlined = False
 
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        node.args = [self.visit(arg) for arg in node.args]
+        if not isinstance(node.func, ast.Name) or node.func.id not in _USER_FUNCS:
+            return node
+        func = _USER_FUNCS[node.func.id]
+        if func.name in self.stack:
+            raise CalcError(f"Recursive function: {func.name}")
+        if len(node.args) != len(func.params) or node.keywords:
+            raise CalcError(f"{func.name}() takes {len(func.params)} argument(s)")
+        body = _instantiate(func.body, dict(zip(func.params, node.args)))
+        self.stack.append(func.name)
+        try:
+            body = self.visit(body)
+        finally:
+            self.stack.pop()
+        self.inlined = True
+        return body
 
-# ---------------------------
-# Tests
-# ---------------------------
 
-import unittest
+def _fold_constants(node: ast.AST) -> ast.AST:
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            setattr(node, field, _fold_constants(value))
+        elif isinstance(value, list):
+            setattr(node, field, [_fold_constants(v) if isinstance(v, ast.AST) else v for v in value])
 
+    if isinstance(node, ast.BinOp):
+        operands = [node.left, node.right]
+    elif isinstance(node, ast.UnaryOp):
+        operands = [node.operand]
+    elif isinstance(node, ast.Call):
+        operands = list(node.args)
+    else:
+        return node
+    if not all(
+        isinstance(operand, ast.Constant)
+        or (isinstance(operand, ast.Name) and operand.id in _CONSTANTS)
+        for operand in operands
+    ):
+        return node
+    if _estimate_cost(node) > _FOLD_MAX_COST:
+        return node
+    try:
+        value = _eval_node(node)
+    except CalcError:
+        # Left in place so the error surfaces when the expression is evaluated.
+        return node
+    if type(value) not in (int, float):
+        return node
+    return ast.copy_location(ast.Constant(value=value), node)
 
-class TestEvaluateExpression(unittest.TestCase):
-    def test_simple_add(self):
-        self.assertEqual(evaluate_expression("2+3"), 5.0)
 
-    def test_precedence(self):
-        self.assertEqual(evaluate_expression("2+3*4"), 14.0)
+def define_function(definition: str) -> UserFunction:
+    """Register a function from ``"name(a, b) = expression"``.
 
-    def test_parentheses(self):
-        self.assertEqual(evaluate_expression("(2+3)*4"), 20.0)
+    Calls to it are inlined into every expression compiled afterwards.
+    The body may only use its parameters, constants and functions that are
+    already defined; recursion, direct or through other functions, is
+    rejected.
+    """
+    head, sep, body_source = definition.partition("=")
+    if not sep:
+        raise CalcError("Definition must look like name(a, b) = expression")
+    try:
+        signature = ast.parse(head.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise CalcError("Syntax error") from e
+    if (
+        not isinstance(signature, ast.Call)
+        or not isinstance(signature.func, ast.Name)
+        or signature.keywords
+        or not all(isinstance(arg, ast.Name) for arg in signature.args)
+    ):
+        raise CalcError("Definition must look like name(a, b) = expression")
 
-    def test_functions(self):
-        self.assertEqual(evaluate_expression("sqrt(25)"), 5.0)
+    name = signature.func.id
+    params = tuple(arg.id for arg in signature.args)
+    reserved = set(_CONSTANTS) | set(_MATH_FUNCS)
+    if name in reserved:
+        raise CalcError(f"Cannot redefine built-in: {name}")
+    if len(set(params)) != len(params) or reserved & set(params):
+        raise CalcError(f"Invalid parameters for {name}")
 
-    def test_pow_operator_and_func(self):
-        self.assertEqual(evaluate_expression("2**3"), 8.0)
-        self.assertEqual(evaluate_expression("pow(2,3)"), 8.0)
+    body_source = body_source.strip()
+    body = _parse_expression(body_source).body
+    unknown = _free_variables(body) - set(params)
+    if unknown:
+        raise CalcError(f"Unknown identifier: {sorted(unknown)[0]}")
+    for node in ast.walk(body):
+        if isinstance(node, ast.Call):
+            callee = node.func.id if isinstance(node.func, ast.Name) else None
+            if callee != name and callee not in _MATH_FUNCS and callee not in _USER_FUNCS:
+                raise CalcError("Unsupported function call")
 
-    def test_pi_constant(self):
-        self.assertAlmostEqual(evaluate_expression("pi"), math.pi)
+    func = UserFunction(name, params, body, f"{head.strip()} = {body_source}")
+    previous = _USER_FUNCS.get(name)
+    _USER_FUNCS[name] = func
+    try:
+        # Expanding the body fully catches recursion through other functions.
+        _Inliner().visit(ast.Expression(body=_instantiate(body, {})))
+    except CalcError:
+        if previous is None:
+            del _USER_FUNCS[name]
+        else:
+            _USER_FUNCS[name] = previous
+        raise
+    compile_expression.cache_clear()
+    return func
 
-    def test_unary_minus(self):
-        self.assertEqual(evaluate_expression("-5 + 2"), -3.0)
 
-    def test_invalid_syntax(self):
-        with self.assertRaises(CalcError):
-            evaluate_expression("2+*3")
+def undefine_function(name: str) -> None:
+    if _USER_FUNCS.pop(name, None) is not None:
+        compile_expression.cache_clear()
 
-    def test_disallowed_name(self):
-        with self.assertRaises(CalcError):
-            evaluate_expression('__import__("os")')
 
-    def test_empty(self):
-        with self.assertRaises(CalcError):
-            evaluate_expression("")
+def clear_functions() -> None:
+    _USER_FUNCS.clear()
+    compile_expression.cache_clear()
 
-    def test_modulo(self):
-        self.assertEqual(evaluate_expression("10 % 3"), 1.0)
 
-    def test_log10(self):
-        self.assertAlmostEqual(evaluate_expression("log10(100)"), 2.0)
+def load_definitions(path: str) -> list[UserFunction]:
+    """Define every function in ``path``: one per line, ``#`` starts a comment."""
+    funcs = []
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                funcs.append(define_function(line))
+    return funcs
 
-    def test_sin_zero(self):
-        self.assertAlmostEqual(evaluate_expression("sin(0)"), 0.0)
 
-    def test_abs(self):
-        self.assertEqual(evaluate_expression("abs(-7)"), 7.0)
+def _definitions_suffix() -> str:
+    # Part of the disk cache key: inlined trees depend on the definitions.
+    if not _USER_FUNCS:
+        return ""
+    joined = "\n".join(sorted(func.source for func in _USER_FUNCS.values()))
+    return "\n#defs:" + hashlib.sha256(joined.encode("utf-8")).hexdigest()
 
 
-def run_tests() -> int:
+# ---------------------------
+# Persistent compile cache
+# ---------------------------
+
+# Bump whenever the compiled form or evaluation semantics change; entries
+# written by other versions live in a separate directory and are ignored.
+_EVALUATOR_VERSION = "1"
+
+_DISK_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+_OPS_BY_NAME: Dict[str, type] = {op.__name__: op for op in _OPERATORS}
+
+
+def _normalize_source(expr: str) -> str:
+    return _normalize_operators(expr).strip()
+
+
+def _tree_to_data(node: ast.AST) -> Any:
+    if isinstance(node, ast.Expression):
+        return ["expr", _tree_to_data(node.body)]
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return ["num", node.value]
+    if isinstance(node, ast.Name):
+        return ["name", node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return ["bin", type(node.op).__name__, _tree_to_data(node.left), _tree_to_data(node.right)]
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return ["unary", type(node.op).__name__, _tree_to_data(node.operand)]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        return ["call", node.func.id, [_tree_to_data(arg) for arg in node.args]]
+    raise ValueError(f"cannot serialize {type(node).__name__}")
+
+
+def _tree_from_data(data: Any) -> ast.AST:
+    # Only rebuilds node types _eval_node understands, so a tampered cache
+    # entry cannot smuggle in anything the parser-side checks would reject.
+    kind = data[0]
+    if kind == "expr":
+        return ast.fix_missing_locations(ast.Expression(body=_tree_from_data(data[1])))
+    if kind == "num" and type(data[1]) in (int, float):
+        return ast.Constant(value=data[1])
+    if kind == "name" and isinstance(data[1], str):
+        return ast.Name(id=data[1], ctx=ast.Load())
+    if kind == "bin":
+        op = _OPS_BY_NAME[data[1]]()
+        return ast.BinOp(left=_tree_from_data(data[2]), op=op, right=_tree_from_data(data[3]))
+    if kind == "unary":
+        op = _OPS_BY_NAME[data[1]]()
+        return ast.UnaryOp(op=op, operand=_tree_from_data(data[2]))
+    if kind == "call" and isinstance(data[1], str):
+        return ast.Call(
+            func=ast.Name(id=data[1], ctx=ast.Load()),
+            args=[_tree_from_data(arg) for arg in data[2]],
+            keywords=[],
+        )
+    raise ValueError(f"bad cache entry node: {kind!r}")
+
+
+@contextlib.contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    with open(path, "a+") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _atomic_write(path: str, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def _default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "calculator")
+
+
+class _DiskCache:
+    """Compiled expressions shared between processes through the filesystem.
+
+    Entries are content-addressed JSON files written with an atomic rename,
+    so readers never need a lock. Recency and sizes live in ``index.json``,
+    which each process merges into once, under ``fcntl`` locking, when it
+    flushes; that is also when least-recently-used entries are evicted to
+    keep the cache under ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = _DISK_CACHE_MAX_BYTES):
+        self.directory = os.path.join(directory, f"v{_EVALUATOR_VERSION}")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.saved_seconds = 0.0
+        self._used: Dict[str, int] = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    @staticmethod
+    def _key(source: str) -> str:
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def load(self, source: str) -> Optional[ast.Expression]:
+        start = time.perf_counter()
+        key = self._key(source)
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as handle:
+                text = handle.read()
+            entry = json.loads(text)
+            if entry["source"] != source:
+                raise ValueError("hash collision")
+            tree = _tree_from_data(entry["tree"])
+            compile_seconds = float(entry["compile_seconds"])
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_seconds += compile_seconds - (time.perf_counter() - start)
+        self._used[key] = len(text)
+        return tree
+
+    def store(self, source: str, tree: ast.Expression, compile_seconds: float) -> None:
+        try:
+            data = _tree_to_data(tree)
+        except ValueError:
+            return
+        key = self._key(source)
+        text = json.dumps({"source": source, "tree": data, "compile_seconds": compile_seconds})
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, text)
+        except OSError:
+            return
+        self.writes += 1
+        self._used[key] = len(text)
+
+    def flush(self) -> None:
+        if not self._used:
+            return
+        index_path = os.path.join(self.directory, "index.json")
+        with _file_lock(os.path.join(self.directory, "index.lock")):
+            try:
+                with open(index_path, "r", encoding="utf-8") as handle:
+                    index: Dict[str, list] = json.load(handle)
+            except (OSError, ValueError):
+                index = {}
+            now = time.time()
+            for key, size in self._used.items():
+                index[key] = [size, now]
+            total = sum(size for size, _ in index.values())
+            for key in sorted(index, key=lambda k: index[k][1]):
+                if total <= self.max_bytes:
+                    break
+                size, _ = index.pop(key)
+                total -= size
+                with contextlib.suppress(OSError):
+                    os.remove(self._path(key))
+            _atomic_write(index_path, json.dumps(index))
+        self._used.clear()
+
+
+_DISK_CACHE: Optional[_DiskCache] = None
+
+
+def enable_disk_cache(
+    directory: Optional[str] = None, max_bytes: int = _DISK_CACHE_MAX_BYTES
+) -> bool:
+    """Share compiled expressions with other processes through ``directory``.
+
+    Defaults to ``$XDG_CACHE_HOME/calculator`` (``~/.cache/calculator``).
+    Returns False, leaving the cache off, if the directory can't be created.
+    """
+    global _DISK_CACHE
+    disable_disk_cache()
+    try:
+        _DISK_CACHE = _DiskCache(directory or _default_cache_dir(), max_bytes)
+    except OSError:
+        return False
+    compile_expression.cache_clear()
+    return True
+
+
+def disable_disk_cache() -> None:
+    global _DISK_CACHE
+    if _DISK_CACHE is not None:
+        with contextlib.suppress(OSError):
+            _DISK_CACHE.flush()
+        _DISK_CACHE = None
+        compile_expression.cache_clear()
+
+
+atexit.register(disable_disk_cache)
+
+
+# ---------------------------
+# Range and grid sweeps
+# ---------------------------
+
+# Points evaluated per chunk on the pure-Python fallback path.
+_SWEEP_CHUNK = 4096
+
+
+def _linspace(start: float, stop: float, num: int) -> array:
+    if num == 1:
+        return array("d", [float(start)])
+    step = (stop - start) / (num - 1)
+    points = array("d", (start + i * step for i in range(num)))
+    points[-1] = float(stop)
+    return points
+
+
+def _ieee_binary(op_type: type, left: Any, right: Any) -> Any:
+    # Where Python raises, the value NumPy gives instead: x/0 is ±inf (0/0
+    # nan), x%0 nan, 0**-n ±inf, an overflow inf and a complex power nan.
+    try:
+        result = _OPERATORS[op_type](left, right)
+    except ZeroDivisionError:
+        if op_type is ast.Div and left != 0 and left == left:
+            return math.copysign(math.inf, left) * math.copysign(1.0, right)
+        if op_type is not ast.Pow:
+            return math.nan
+        odd = float(right).is_integer() and int(right) % 2 == 1
+        return -math.inf if odd and math.copysign(1.0, left) < 0 else math.inf
+    except OverflowError:
+        return math.inf
+    except (TypeError, ValueError):
+        return math.nan
+    return math.nan if isinstance(result, complex) else result
+
+
+def _ieee_call(name: str, func: Callable[..., Any], args: list[Any]) -> Any:
+    if name == "pow" and len(args) == 2:
+        return _ieee_binary(ast.Pow, float(args[0]), float(args[1]))
+    if name == "log" and len(args) == 2:
+        return _ieee_binary(ast.Div, _ieee_call("ln", math.log, args[:1]),
+                            _ieee_call("ln", math.log, args[1:]))
+    try:
+        result = func(*args)
+    except ValueError:
+        # log of 0 is -inf; every other domain error is nan
+        return -math.inf if name in ("log", "ln", "log10") and args == [0] else math.nan
+    except OverflowError:
+        return math.inf
+    except TypeError:
+        return math.nan
+    return math.nan if isinstance(result, complex) else result
+
+
+def _ieee_eval(node: ast.AST, env: Dict[str, Any]) -> Any:
+    if isinstance(node, ast.Expression):
+        return _ieee_eval(node.body, env)
+    if isinstance(node, ast.BinOp):
+        return _ieee_binary(type(node.op), _ieee_eval(node.left, env), _ieee_eval(node.right, env))
+    if isinstance(node, ast.UnaryOp):
+        return -_ieee_eval(node.operand, env)
+    if isinstance(node, ast.Call):
+        func = _call_target(node)
+        return _ieee_call(node.func.id, func, [_ieee_eval(arg, env) for arg in node.args])
+    return _eval_node(node, env)
+
+
+def _point_value(tree: ast.Expression, env: Dict[str, Any]) -> float:
+    """``tree`` at one point, giving nan or inf where the vectorized path would.
+
+    Evaluated as usual first; only a point that fails or comes out complex
+    is re-evaluated with NumPy's rules for division by zero, overflow and
+    results outside the real domain.
+    """
+    try:
+        value = _eval_node(tree, env)
+        if not isinstance(value, complex):
+            return float(value)
+    except (CalcError, OverflowError, TypeError):
+        pass
+    value = _ieee_eval(tree, env)
+    try:
+        return float(value)
+    except OverflowError:
+        return math.copysign(math.inf, value)
+
+
+def _iter_point_chunks(
+    compiled: CompiledExpression,
+    names: Sequence[str],
+    points: Iterator[tuple[float, ...]],
+    chunk: int = _SWEEP_CHUNK,
+) -> Iterator[array]:
+    # Per-point evaluation; points outside the domain become nan or inf to
+    # match the vectorized path.
+    tree = compiled.tree
+    out = array("d")
+    env: Dict[str, Any] = {}
+    for point in points:
+        env.update(zip(names, point))
+        out.append(_point_value(tree, env))
+        if len(out) >= chunk:
+            yield out
+            out = array("d")
+    if out:
+        yield out
+
+
+def evaluate_range(
+    expr: str, start: float, stop: float, num: int = 50, *, var: str = "x"
+) -> tuple[Any, Any]:
+    """Evaluate ``expr`` at ``num`` evenly spaced values of ``var``.
+
+    Returns ``(xs, ys)``: NumPy arrays when NumPy is installed, otherwise
+    ``array('d')`` buffers filled chunk by chunk.
+    """
+    if num < 1:
+        raise CalcError("num must be at least 1")
+    compiled = compile_expression(expr)
+    _check_supported(compiled.tree, frozenset([var]))
+
+    if _NUMPY_AVAILABLE:
+        xs = np.linspace(start, stop, num)
+        return xs, compiled.evaluate_vectorized({var: xs})
+
+    xs = _linspace(start, stop, num)
+    ys = array("d")
+    for chunk in _iter_point_chunks(compiled, [var], ((x,) for x in xs)):
+        ys.extend(chunk)
+    return xs, ys
+
+
+def evaluate_grid(
+    expr: str, axes: Dict[str, tuple[float, float, int]]
+) -> tuple[list[Any], Any]:
+    """Evaluate ``expr`` over the grid spanned by ``axes``.
+
+    ``axes`` maps each variable to ``(start, stop, num)``. With NumPy this
+    returns ``(grids, values)`` where ``grids`` come from an ``ij``-indexed
+    ``meshgrid`` and ``values`` has one dimension per axis. Without NumPy
+    ``grids`` holds the 1-D axes and ``values`` is a flat ``array('d')`` in
+    row-major order.
+    """
+    names = list(axes)
+    if any(num < 1 for _, _, num in axes.values()):
+        raise CalcError("num must be at least 1")
+    compiled = compile_expression(expr)
+    _check_supported(compiled.tree, frozenset(names))
+
+    if _NUMPY_AVAILABLE:
+        lines = [np.linspace(*axes[name]) for name in names]
+        grids = list(np.meshgrid(*lines, indexing="ij"))
+        return grids, compiled.evaluate_vectorized(dict(zip(names, grids)))
+
+    lines = [_linspace(*axes[name]) for name in names]
+    values = array("d")
+    for chunk in _iter_point_chunks(compiled, names, itertools.product(*lines)):
+        values.extend(chunk)
+    return lines, values
+
+
+# ---------------------------
+# Binary column evaluation
+# ---------------------------
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _as_float64(buffer: Any) -> Any:
+    """View a buffer of little-endian float64 values without copying it."""
+    view = memoryview(buffer).cast("B")
+    if len(view) % 8:
+        raise CalcError("Column length is not a multiple of 8 bytes")
+    if _NUMPY_AVAILABLE:
+        return np.frombuffer(view, dtype="<f8")
+    if _LITTLE_ENDIAN:
+        return view.cast("d")
+    values = array("d", view.tobytes())
+    values.byteswap()
+    return values
+
+
+def evaluate_columns(
+    expr: str | CompiledExpression, columns: Dict[str, Any]
+) -> tuple[Any, bytearray]:
+    """Evaluate ``expr`` row by row over float64 column buffers.
+
+    ``columns`` maps variable names to buffers of little-endian float64
+    (``bytes``, ``mmap``, ``memoryview``, arrays, ...), which are viewed in
+    place. Returns ``(results, errors)``: a float64 buffer with one value per
+    row and a little-endian bitmap with bit ``i`` set when row ``i`` did not
+    produce a finite number.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    if not columns:
+        raise CalcError("At least one column is required")
+    _check_supported(compiled.tree, frozenset(columns))
+    views = {name: _as_float64(buffer) for name, buffer in columns.items()}
+    lengths = {len(view) for view in views.values()}
+    if len(lengths) != 1:
+        raise CalcError("Columns have different lengths")
+    (rows,) = lengths
+
+    if _NUMPY_AVAILABLE:
+        results = compiled.evaluate_vectorized(views)
+        errors = bytearray(np.packbits(~np.isfinite(results), bitorder="little").data)
+        return results, errors
+
+    results = array("d", bytes(8 * rows))
+    errors = bytearray((rows + 7) // 8)
+    tree = compiled.tree
+    names = list(views)
+    env: Dict[str, Any] = {}
+    for i, row in enumerate(zip(*views.values())):
+        env.update(zip(names, row))
+        value = _point_value(tree, env)
+        results[i] = value
+        if not math.isfinite(value):
+            errors[i >> 3] |= 1 << (i & 7)
+    return results, errors
+
+
+def _write_float64(stream: Any, values: Any) -> None:
+    if not _LITTLE_ENDIAN and not _NUMPY_AVAILABLE:
+        values = array("d", values)
+        values.byteswap()
+    stream.write(memoryview(values).cast("B"))
+
+
+def _open_column(path: str) -> Any:
+    if path == "-":
+        return sys.stdin.buffer.read()
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def binary_batch(argv: list[str]) -> int:
+    usage = (
+        "Usage: --binary 'EXPR' --var NAME=PATH [--var ...] [--out PATH] [--errors PATH]\n"
+        "       [--reduce sum,mean,min,max,count,errors,pNN]\n"
+        "Columns are raw little-endian float64; PATH '-' is stdin. Results go to\n"
+        "--out (default stdout) as float64, followed by the error bitmap unless\n"
+        "--errors names a separate file. --reduce prints only the reductions."
+    )
+    try:
+        reductions = _parse_reductions(argv)
+    except CalcError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+    try:
+        expr = argv[argv.index("--binary") + 1]
+        columns: Dict[str, Any] = {}
+        out_path = errors_path = None
+        for flag, value in zip(argv, argv[1:]):
+            if flag == "--var":
+                name, path = value.split("=", 1)
+                columns[name] = _open_column(path)
+            elif flag == "--out":
+                out_path = value
+            elif flag == "--errors":
+                errors_path = value
+    except (IndexError, ValueError):
+        print(usage, file=sys.stderr)
+        return 1
+    except OSError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    try:
+        if reductions:
+            _print_reductions(reduce_expression(expr, columns, reductions))
+            return 0
+        results, errors = evaluate_columns(expr, columns)
+    except CalcError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    out = open(out_path, "wb") if out_path else sys.stdout.buffer
+    try:
+        _write_float64(out, results)
+        if errors_path:
+            with open(errors_path, "wb") as handle:
+                handle.write(errors)
+        else:
+            out.write(errors)
+        out.flush()
+    finally:
+        if out_path:
+            out.close()
+    return 0
+
+
+# ---------------------------
+# Streaming reductions
+# ---------------------------
+
+_REDUCTIONS = ("count", "sum", "mean", "min", "max", "errors")
+_REDUCE_CHUNK = 65_536
+
+
+class StreamingStats:
+    """Constant-memory, mergeable summary of a stream of numbers.
+
+    Keeps a compensated sum, min/max and a log-bucketed sketch whose
+    quantiles are within ``relative_accuracy`` of the true value. Values
+    that are not finite are counted as errors and otherwise ignored. Two
+    summaries built on different workers combine with :meth:`merge`.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.count = 0
+        self.errors = 0
+        self._sum = 0.0
+        self._compensation = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._zeros = 0
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+
+    def _add_to_sum(self, value: float) -> None:
+        # Neumaier summation: error stays O(eps) however long the stream.
+        total = self._sum + value
+        if abs(self._sum) >= abs(value):
+            self._compensation += (self._sum - total) + value
+        else:
+            self._compensation += (value - total) + self._sum
+        self._sum = total
+
+    def _bucket(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        # Fold the smallest magnitudes together so memory stays bounded.
+        if len(store) <= self.max_buckets:
+            return
+        keys = sorted(store)
+        excess = keys[: len(keys) - self.max_buckets + 1]
+        store[excess[-1]] = sum(store.pop(key) for key in excess)
+
+    def add(self, value: float) -> None:
+        value = float(value)
+        if not math.isfinite(value):
+            self.errors += 1
+            return
+        self.count += 1
+        self._add_to_sum(value)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value > 0:
+            key = self._bucket(value)
+            self._positive[key] = self._positive.get(key, 0) + 1
+            self._collapse(self._positive)
+        elif value < 0:
+            key = self._bucket(-value)
+            self._negative[key] = self._negative.get(key, 0) + 1
+            self._collapse(self._negative)
+        else:
+            self._zeros += 1
+
+    def update(self, values: Any) -> None:
+        """Add every value of an iterable, array or float64 buffer."""
+        if not _NUMPY_AVAILABLE:
+            for value in values:
+                self.add(value)
+            return
+        values = np.asarray(values, dtype=float).ravel()
+        finite = values[np.isfinite(values)]
+        self.errors += len(values) - len(finite)
+        if not len(finite):
+            return
+        self.count += len(finite)
+        self._add_to_sum(float(np.sum(finite)))
+        self.min = min(self.min, float(finite.min()))
+        self.max = max(self.max, float(finite.max()))
+        self._zeros += int(np.count_nonzero(finite == 0))
+        for store, magnitudes in ((self._positive, finite[finite > 0]), (self._negative, -finite[finite < 0])):
+            if not len(magnitudes):
+                continue
+            keys = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+            for key, n in zip(*(a.tolist() for a in np.unique(keys, return_counts=True))):
+                store[key] = store.get(key, 0) + n
+            self._collapse(store)
+
+    def merge(self, other: "StreamingStats") -> "StreamingStats":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise CalcError("Cannot merge sketches with different accuracies")
+        self.count += other.count
+        self.errors += other.errors
+        self._add_to_sum(other._sum)
+        self._add_to_sum(other._compensation)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._zeros += other._zeros
+        for store, incoming in ((self._positive, other._positive), (self._negative, other._negative)):
+            for key, n in incoming.items():
+                store[key] = store.get(key, 0) + n
+            self._collapse(store)
+        return self
+
+    @property
+    def sum(self) -> float:
+        return self._sum + self._compensation
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def quantile(self, q: float) -> float:
+        if not 0 <= q <= 1:
+            raise CalcError("Quantile must be between 0 and 1")
+        if not self.count:
+            return math.nan
+        if q in (0, 1):
+            return self.min if q == 0 else self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return self._clamp(-self._value(key))
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._clamp(self._value(key))
+        return self.max
+
+    def _value(self, key: int) -> float:
+        return 2 * self._gamma**key / (self._gamma + 1)
+
+    def _clamp(self, value: float) -> float:
+        return min(max(value, self.min), self.max)
+
+    def result(self, name: str) -> float:
+        """One of ``count``, ``sum``, ``mean``, ``min``, ``max``, ``errors`` or ``pNN``."""
+        if name in ("count", "errors", "sum", "mean"):
+            return getattr(self, name)
+        if name in ("min", "max"):
+            return getattr(self, name) if self.count else math.nan
+        if name.startswith("p"):
+            try:
+                percent = float(name[1:])
+            except ValueError:
+                percent = -1.0
+            if 0 <= percent <= 100:
+                return self.quantile(percent / 100)
+        raise CalcError(f"Unknown reduction: {name}")
+
+    def results(self, names: tuple[str, ...] | list[str] = _REDUCTIONS) -> Dict[str, float]:
+        return {name: self.result(name) for name in names}
+
+
+def _reduce_column_chunk(
+    compiled: CompiledExpression, views: Dict[str, Any], start: int, stop: int
+) -> StreamingStats:
+    stats = StreamingStats()
+    results, _ = evaluate_columns(compiled, {name: view[start:stop] for name, view in views.items()})
+    stats.update(results)
+    return stats
+
+
+def reduce_expression(
+    expr: str | CompiledExpression,
+    data: Any,
+    reductions: tuple[str, ...] | list[str] = _REDUCTIONS,
+    *,
+    chunk_size: int = _REDUCE_CHUNK,
+    parallel: bool = False,
+) -> Dict[str, float]:
+    """Reduce ``expr`` evaluated over ``data`` without keeping the results.
+
+    ``data`` is either a mapping of variable names to float64 columns
+    (arrays or buffers, as for :func:`evaluate_columns`), evaluated in
+    chunks of ``chunk_size`` rows, or an iterable of environments evaluated
+    one at a time. With ``parallel=True`` column chunks run on the thread
+    pool and their summaries are merged.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    for name in reductions:
+        StreamingStats().result(name)
+    stats = StreamingStats()
+
+    if isinstance(data, dict):
+        if not data:
+            raise CalcError("At least one column is required")
+        views = {name: _as_float64(buffer) for name, buffer in data.items()}
+        lengths = {len(view) for view in views.values()}
+        if len(lengths) != 1:
+            raise CalcError("Columns have different lengths")
+        (rows,) = lengths
+        bounds = [(start, min(start + chunk_size, rows)) for start in range(0, rows, chunk_size)]
+        if parallel and len(bounds) > 1:
+            pool = _get_pool("thread")
+            futures = [pool.submit(_reduce_column_chunk, compiled, views, a, b) for a, b in bounds]
+            for future in futures:
+                stats.merge(future.result())
+        else:
+            for a, b in bounds:
+                stats.merge(_reduce_column_chunk(compiled, views, a, b))
+        return stats.results(reductions)
+
+    for env in data:
+        try:
+            stats.add(compiled.evaluate(env))
+        except (CalcError, OverflowError, TypeError):
+            stats.errors += 1
+    return stats.results(reductions)
+
+
+def _parse_reductions(argv: list[str]) -> Optional[list[str]]:
+    if "--reduce" not in argv:
+        return None
+    idx = argv.index("--reduce")
+    names = argv[idx + 1].split(",") if idx + 1 < len(argv) else []
+    del argv[idx : idx + 2]
+    names = [name.strip() for name in names if name.strip()]
+    if not names:
+        raise CalcError("Usage: --reduce sum,mean,min,max,count,errors,pNN")
+    for name in names:
+        StreamingStats().result(name)
+    return names
+
+
+def _print_reductions(results: Dict[str, float]) -> None:
+    for name, value in results.items():
+        print(f"{name}: {value}")
+
+
+# ---------------------------
+# Automatic differentiation
+# ---------------------------
+
+# Partial derivatives for every operator and function the evaluator knows.
+# Each rule gets the backend functions ``F`` (math or NumPy), the argument
+# values and the already computed result, and returns one partial per
+# argument. Forward and reverse mode share these rules.
+_PARTIALS: Dict[Any, Callable[..., tuple]] = {
+    ast.Add: lambda F, a, b, y: (1.0, 1.0),
+    ast.Sub: lambda F, a, b, y: (1.0, -1.0),
+    ast.Mult: lambda F, a, b, y: (b, a),
+    ast.Div: lambda F, a, b, y: (1.0 / b, -y / b),
+    # a % b == a - b * floor(a / b), and floor(a / b) == (a - y) / b
+    ast.Mod: lambda F, a, b, y: (1.0, (y - a) / b),
+    ast.Pow: lambda F, a, b, y: (b * a ** (b - 1), y * F["log_pos"](a)),
+    ast.USub: lambda F, a, y: (-1.0,),
+    "sqrt": lambda F, a, y: (0.5 / y,),
+    "sin": lambda F, a, y: (F["cos"](a),),
+    "cos": lambda F, a, y: (-F["sin"](a),),
+    "tan": lambda F, a, y: (1.0 + y * y,),
+    "log": lambda F, a, *rest: (
+        (1.0 / a,) if len(rest) == 1 else (1.0 / (a * F["ln"](rest[0])), -rest[1] / (rest[0] * F["ln"](rest[0])))
+    ),
+    "ln": lambda F, a, y: (1.0 / a,),
+    "log10": lambda F, a, y: (1.0 / (a * math.log(10)),),
+    "abs": lambda F, a, y: ((a > 0) * 1.0 - (a < 0) * 1.0,),
+    "pow": lambda F, a, b, y: (b * a ** (b - 1), y * F["log_pos"](a)),
+}
+
+# d(a**b)/db is y*ln(a); it is taken as 0 where ln(a) is undefined, which is
+# right for the common constant-exponent case and for a == 0.
+_DIFF_MATH: Dict[str, Callable[..., Any]] = dict(
+    _MATH_FUNCS, log_pos=lambda a: math.log(a) if a > 0 else 0.0
+)
+
+if _NUMPY_AVAILABLE:
+    _DIFF_NUMPY: Dict[str, Callable[..., Any]] = dict(
+        _NUMPY_FUNCS, log_pos=lambda a: np.where(a > 0, np.log(np.where(a > 0, a, 1.0)), 0.0)
+    )
+
+
+class Dual:
+    """A value with its tangents, one per differentiated variable.
+
+    Arithmetic on duals applies the chain rule, so running the ordinary
+    evaluator over them (with :func:`_dual_funcs`) is forward-mode
+    differentiation.
+    """
+
+    __slots__ = ("value", "tangent")
+    F: Dict[str, Callable[..., Any]] = _DIFF_MATH
+
+    def __init__(self, value: Any, tangent: tuple):
+        self.value = value
+        self.tangent = tangent
+
+    def __repr__(self) -> str:
+        return f"Dual({self.value!r}, {self.tangent!r})"
+
+    def _apply(self, key: Any, func: Callable[..., Any], args: tuple) -> "Dual":
+        values = [a.value if isinstance(a, Dual) else a for a in args]
+        y = func(*values)
+        partials = _PARTIALS[key](self.F, *values, y)
+        tangent: Any = None
+        for arg, partial in zip(args, partials):
+            if isinstance(arg, Dual):
+                term = [partial * t for t in arg.tangent]
+                tangent = term if tangent is None else [s + t for s, t in zip(tangent, term)]
+        return type(self)(y, tuple(tangent))
+
+    def __add__(self, other: Any) -> "Dual":
+        return self._apply(ast.Add, operator.add, (self, other))
+
+    def __radd__(self, other: Any) -> "Dual":
+        return self._apply(ast.Add, operator.add, (other, self))
+
+    def __sub__(self, other: Any) -> "Dual":
+        return self._apply(ast.Sub, operator.sub, (self, other))
+
+    def __rsub__(self, other: Any) -> "Dual":
+        return self._apply(ast.Sub, operator.sub, (other, self))
+
+    def __mul__(self, other: Any) -> "Dual":
+        return self._apply(ast.Mult, operator.mul, (self, other))
+
+    def __rmul__(self, other: Any) -> "Dual":
+        return self._apply(ast.Mult, operator.mul, (other, self))
+
+    def __truediv__(self, other: Any) -> "Dual":
+        return self._apply(ast.Div, operator.truediv, (self, other))
+
+    def __rtruediv__(self, other: Any) -> "Dual":
+        return self._apply(ast.Div, operator.truediv, (other, self))
+
+    def __mod__(self, other: Any) -> "Dual":
+        return self._apply(ast.Mod, operator.mod, (self, other))
+
+    def __rmod__(self, other: Any) -> "Dual":
+        return self._apply(ast.Mod, operator.mod, (other, self))
+
+    def __pow__(self, other: Any) -> "Dual":
+        return self._apply(ast.Pow, operator.pow, (self, other))
+
+    def __rpow__(self, other: Any) -> "Dual":
+        return self._apply(ast.Pow, operator.pow, (other, self))
+
+    def __neg__(self) -> "Dual":
+        return self._apply(ast.USub, operator.neg, (self,))
+
+
+if _NUMPY_AVAILABLE:
+
+    class _NumpyDual(Dual):
+        __slots__ = ()
+        F = _DIFF_NUMPY
+        # Keep NumPy from treating a dual as a scalar in mixed expressions
+        __array_ufunc__ = None
+
+
+@functools.lru_cache(maxsize=None)
+def _dual_funcs(cls: type) -> Dict[str, Callable[..., Any]]:
+    return {
+        name: functools.partial(_dual_call, name, func)
+        for name, func in cls.F.items()
+        if name in _PARTIALS
+    }
+
+
+def _dual_call(name: str, func: Callable[..., Any], *args: Any) -> Any:
+    for arg in args:
+        if isinstance(arg, Dual):
+            return arg._apply(name, func, args)
+    return func(*args)
+
+
+def _reverse(
+    tree: ast.AST, env: Dict[str, Any], F: Dict[str, Callable[..., Any]], wrt: Sequence[str]
+) -> tuple[Any, list[Any]]:
+    """Evaluate ``tree`` recording a tape, then sweep it backwards."""
+    values: list[Any] = []
+    # tape[i] lists (input index, partial) pairs for node i
+    tape: list[tuple[tuple[int, Any], ...]] = []
+    leaves = {name: None for name in wrt}
+
+    def record(value: Any, inputs: tuple[tuple[int, Any], ...] = ()) -> int:
+        values.append(value)
+        tape.append(inputs)
+        return len(values) - 1
+
+    def visit(node: ast.AST) -> int:
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, (int, float)):
+                return record(node.value)
+            raise CalcError("Unsupported constant")
+        if isinstance(node, ast.Name):
+            if node.id in _CONSTANTS:
+                return record(_CONSTANTS[node.id])
+            if node.id in leaves:
+                if leaves[node.id] is None:
+                    leaves[node.id] = record(env[node.id])
+                return leaves[node.id]
+            if node.id in env:
+                return record(env[node.id])
+            raise CalcError(f"Unknown identifier: {node.id}")
+        if isinstance(node, ast.BinOp):
+            key: Any = type(node.op)
+            args = (visit(node.left), visit(node.right))
+            y = _apply_binary(node.op, values[args[0]], values[args[1]])
+        elif isinstance(node, ast.UnaryOp):
+            key = type(node.op)
+            if key not in _OPERATORS:
+                raise CalcError("Unsupported unary operator")
+            args = (visit(node.operand),)
+            y = _OPERATORS[key](values[args[0]])
+        elif isinstance(node, ast.Call):
+            func = _call_target(node, F)
+            key = node.func.id  # type: ignore[attr-defined]
+            args = tuple(visit(arg) for arg in node.args)
+            y = _apply_call(func, [values[i] for i in args])
+        else:
+            raise CalcError("Unsupported expression")
+        try:
+            partials = _PARTIALS[key](F, *(values[i] for i in args), y)
+        except Exception as e:
+            raise CalcError(str(e))
+        return record(y, tuple(zip(args, partials)))
+
+    out = visit(tree)
+    adjoints: list[Any] = [0.0] * len(values)
+    adjoints[out] = 1.0
+    for i in range(out, -1, -1):
+        adjoint = adjoints[i]
+        for j, partial in tape[i]:
+            adjoints[j] = adjoints[j] + adjoint * partial
+    return values[out], [0.0 if leaves[name] is None else adjoints[leaves[name]] for name in wrt]
+
+
+def value_and_grad(
+    expr: str | CompiledExpression,
+    env: Dict[str, Any],
+    wrt: Optional[Sequence[str]] = None,
+    mode: Optional[str] = None,
+) -> tuple[Any, Dict[str, Any]]:
+    """Return ``f(env)`` and its partial derivatives in a single evaluation.
+
+    ``wrt`` names the variables to differentiate by (default: every free
+    variable). ``mode`` is ``"forward"`` (dual numbers, one pass carrying a
+    tangent per variable) or ``"reverse"`` (a recorded tape swept
+    backwards); by default forward is used for one variable and reverse
+    for several. NumPy arrays in ``env`` are differentiated elementwise,
+    with NumPy's ``nan``/``inf`` semantics as in ``evaluate_vectorized``.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    names = sorted(compiled.variables) if wrt is None else list(wrt)
+    for name in names:
+        if name not in env:
+            raise CalcError(f"No value for {name}")
+    if mode is None:
+        mode = "forward" if len(names) == 1 else "reverse"
+    if mode not in ("forward", "reverse"):
+        raise CalcError(f"Unknown differentiation mode: {mode}")
+
+    vectorized = any(not isinstance(v, (int, float)) for v in env.values())
+    if not vectorized:
+        value, grads = _differentiate(compiled.tree, env, names, mode, Dual, _DIFF_MATH)
+        return float(value), dict(zip(names, map(float, grads)))
+
+    if not _NUMPY_AVAILABLE:
+        raise CalcError("NumPy is required for vectorized differentiation")
+    _check_supported(compiled.tree, frozenset(env))
+    arrays = {name: np.asarray(value, dtype=float) for name, value in env.items()}
+    with np.errstate(all="ignore"):
+        value, grads = _differentiate(compiled.tree, arrays, names, mode, _NumpyDual, _DIFF_NUMPY)
+    shape = np.broadcast_shapes(*(a.shape for a in arrays.values()))
+
+    def full(x: Any) -> Any:
+        return np.broadcast_to(np.asarray(x, dtype=float), shape).copy()
+
+    return full(value), {name: full(g) for name, g in zip(names, grads)}
+
+
+def _differentiate(
+    tree: ast.AST,
+    env: Dict[str, Any],
+    names: list[str],
+    mode: str,
+    dual: type,
+    F: Dict[str, Callable[..., Any]],
+) -> tuple[Any, list[Any]]:
+    if mode == "reverse":
+        return _reverse(tree, env, F, names)
+    seeded = dict(env)
+    for i, name in enumerate(names):
+        seeded[name] = dual(env[name], tuple(float(i == j) for j in range(len(names))))
+    result = _eval_node(tree, seeded, _dual_funcs(dual))
+    if isinstance(result, Dual):
+        return result.value, list(result.tangent)
+    return result, [0.0] * len(names)
+
+
+def derivative(expr: str | CompiledExpression, var: str, env: Dict[str, Any]) -> tuple[Any, Any]:
+    """``(f, df/dvar)`` at ``env``; shorthand for forward-mode :func:`value_and_grad`."""
+    value, grads = value_and_grad(expr, env, [var], mode="forward")
+    return value, grads[var]
+
+
+# ---------------------------
+# Root finding
+# ---------------------------
+
+_SOLVE_XTOL = 2e-12
+_SOLVE_RTOL = 4 * sys.float_info.epsilon
+_SOLVE_MAXITER = 100
+_SOLVE_METHODS = ("bisect", "brent", "newton")
+
+
+class RootResult:
+    """Outcome of :func:`solve`, or of :func:`solve_many` with one array entry per problem."""
+
+    __slots__ = ("root", "iterations", "converged", "method")
+
+    def __init__(self, root: Any, iterations: Any, converged: Any, method: str):
+        self.root = root
+        self.iterations = iterations
+        self.converged = converged
+        self.method = method
+
+    def __repr__(self) -> str:
+        return (
+            f"RootResult(root={self.root!r}, iterations={self.iterations!r}, "
+            f"converged={self.converged!r}, method={self.method!r})"
+        )
+
+
+def _solve_method(method: Optional[str], bracket: Any, x0: Any) -> str:
+    if method is None:
+        method = "newton" if bracket is None else "brent"
+    if method not in _SOLVE_METHODS:
+        raise CalcError(f"Unknown method: {method} (expected one of {', '.join(_SOLVE_METHODS)})")
+    if bracket is None and (method != "newton" or x0 is None):
+        raise CalcError(f"{method} needs a bracket" if method != "newton" else "newton needs x0 or a bracket")
+    return method
+
+
+def _bisect(
+    f: Callable[[float], float], a: float, b: float, xtol: float, rtol: float, maxiter: int
+) -> tuple[float, int, bool]:
+    fa, fb = f(a), f(b)
+    if fa == 0:
+        return a, 0, True
+    if fb == 0:
+        return b, 0, True
+    if (fa > 0) == (fb > 0):
+        raise CalcError("f(a) and f(b) must have opposite signs")
+    m = a
+    for i in range(1, maxiter + 1):
+        m = a + (b - a) / 2
+        fm = f(m)
+        if fm == 0 or abs(b - a) / 2 < xtol + rtol * abs(m):
+            return m, i, True
+        if (fm > 0) == (fa > 0):
+            a, fa = m, fm
+        else:
+            b = m
+    return m, maxiter, False
+
+
+def _brent(
+    f: Callable[[float], float], a: float, b: float, xtol: float, rtol: float, maxiter: int
+) -> tuple[float, int, bool]:
+    # Brent's method as in scipy's brentq: inverse quadratic interpolation
+    # or secant steps, falling back to bisection when they do not shrink
+    # the bracket fast enough.
+    xpre, xcur = a, b
+    fpre, fcur = f(xpre), f(xcur)
+    if fpre == 0:
+        return xpre, 0, True
+    if fcur == 0:
+        return xcur, 0, True
+    if (fpre > 0) == (fcur > 0):
+        raise CalcError("f(a) and f(b) must have opposite signs")
+    xblk = fblk = spre = scur = 0.0
+    for i in range(1, maxiter + 1):
+        if fpre != 0 and fcur != 0 and (fpre < 0) != (fcur < 0):
+            xblk, fblk = xpre, fpre
+            spre = scur = xcur - xpre
+        if abs(fblk) < abs(fcur):
+            xpre, xcur, xblk = xcur, xblk, xcur
+            fpre, fcur, fblk = fcur, fblk, fcur
+        delta = (xtol + rtol * abs(xcur)) / 2
+        sbis = (xblk - xcur) / 2
+        if fcur == 0 or abs(sbis) < delta:
+            return xcur, i, True
+        if abs(spre) > delta and abs(fcur) < abs(fpre):
+            if xpre == xblk:
+                stry = -fcur * (xcur - xpre) / (fcur - fpre)
+            else:
+                dpre = (fpre - fcur) / (xpre - xcur)
+                dblk = (fblk - fcur) / (xblk - xcur)
+                stry = -fcur * (fblk * dblk - fpre * dpre) / (dblk * dpre * (fblk - fpre))
+            if 2 * abs(stry) < min(abs(spre), 3 * abs(sbis) - delta):
+                spre, scur = scur, stry
+            else:
+                spre = scur = sbis
+        else:
+            spre = scur = sbis
+        xpre, fpre = xcur, fcur
+        xcur += scur if abs(scur) > delta else (delta if sbis > 0 else -delta)
+        fcur = f(xcur)
+    return xcur, maxiter, False
+
+
+def _newton(
+    fd: Callable[[float], tuple[float, float]], x: float, xtol: float, rtol: float, maxiter: int
+) -> tuple[float, int, bool]:
+    for i in range(1, maxiter + 1):
+        y, dy = fd(x)
+        if y == 0:
+            return x, i, True
+        if dy == 0 or not math.isfinite(y / dy):
+            return x, i, False
+        step = y / dy
+        x -= step
+        if abs(step) < xtol + rtol * abs(x):
+            return x, i, True
+    return x, maxiter, False
+
+
+def solve(
+    expr: str | CompiledExpression,
+    var: str = "x",
+    bracket: Optional[tuple[float, float]] = None,
+    x0: Optional[float] = None,
+    *,
+    method: Optional[str] = None,
+    env: Optional[Dict[str, float]] = None,
+    xtol: float = _SOLVE_XTOL,
+    rtol: float = _SOLVE_RTOL,
+    maxiter: int = _SOLVE_MAXITER,
+) -> RootResult:
+    """Find ``var`` with ``expr == 0``; other variables come from ``env``.
+
+    ``method`` is ``"bisect"``, ``"brent"`` (the default with a bracket) or
+    ``"newton"`` (the default with ``x0``; derivatives come from
+    :func:`value_and_grad`). Running out of iterations is reported through
+    ``converged``, not raised.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    method = _solve_method(method, bracket, x0)
+    base = dict(env or {})
+
+    def f(x: float) -> float:
+        base[var] = x
+        return compiled.evaluate(base)
+
+    if method == "newton":
+        start = float(x0) if x0 is not None else (bracket[0] + bracket[1]) / 2  # type: ignore[index]
+
+        def fd(x: float) -> tuple[float, float]:
+            base[var] = x
+            return derivative(compiled, var, base)
+
+        root, iterations, converged = _newton(fd, start, xtol, rtol, maxiter)
+    else:
+        a, b = (float(v) for v in bracket)  # type: ignore[union-attr]
+        search = _bisect if method == "bisect" else _brent
+        root, iterations, converged = search(f, a, b, xtol, rtol, maxiter)
+    return RootResult(root, iterations, converged, method)
+
+
+def _bisect_many(
+    f: Callable[[Any, Any], Any], a: Any, b: Any, xtol: float, rtol: float, maxiter: int
+) -> tuple[Any, Any, Any]:
+    n = len(a)
+    root = np.full(n, np.nan)
+    iterations = np.zeros(n, dtype=np.int64)
+    converged = np.zeros(n, dtype=bool)
+    idx = np.arange(n)
+    fa, fb = f(a, idx), f(b, idx)
+    for x, fx in ((b, fb), (a, fa)):
+        hit = fx == 0
+        root[hit], converged[hit] = x[hit], True
+    keep = ~converged & (np.sign(fa) * np.sign(fb) < 0)
+    idx, a, b, fa = idx[keep], a[keep], b[keep], fa[keep]
+    for i in range(1, maxiter + 1):
+        if not idx.size:
+            break
+        m = a + (b - a) / 2
+        fm = f(m, idx)
+        done = (fm == 0) | (np.abs(b - a) / 2 < xtol + rtol * np.abs(m))
+        failed = ~np.isfinite(fm)
+        stop = done | failed
+        root[idx[stop]] = m[stop]
+        iterations[idx[stop]] = i
+        converged[idx[done & ~failed]] = True
+        left = np.sign(fm) == np.sign(fa)
+        a, fa = np.where(left, m, a), np.where(left, fm, fa)
+        b = np.where(left, b, m)
+        keep = ~stop
+        idx, a, b, fa, m = idx[keep], a[keep], b[keep], fa[keep], m[keep]
+    root[idx] = a + (b - a) / 2
+    iterations[idx] = maxiter
+    return root, iterations, converged
+
+
+def _brent_many(
+    f: Callable[[Any, Any], Any], a: Any, b: Any, xtol: float, rtol: float, maxiter: int
+) -> tuple[Any, Any, Any]:
+    # _brent with every branch taken under a mask; problems leave the
+    # working arrays as soon as they converge.
+    n = len(a)
+    root = np.full(n, np.nan)
+    iterations = np.zeros(n, dtype=np.int64)
+    converged = np.zeros(n, dtype=bool)
+    idx = np.arange(n)
+    xpre, xcur = a.copy(), b.copy()
+    fpre, fcur = f(xpre, idx), f(xcur, idx)
+    for x, fx in ((xcur, fcur), (xpre, fpre)):
+        hit = fx == 0
+        root[hit], converged[hit] = x[hit], True
+    keep = ~converged & (np.sign(fpre) * np.sign(fcur) < 0)
+    idx, xpre, xcur, fpre, fcur = idx[keep], xpre[keep], xcur[keep], fpre[keep], fcur[keep]
+    xblk = np.zeros_like(xcur)
+    fblk, spre, scur = xblk.copy(), xblk.copy(), xblk.copy()
+    for i in range(1, maxiter + 1):
+        if not idx.size:
+            break
+        flip = (fpre != 0) & (fcur != 0) & (np.signbit(fpre) != np.signbit(fcur))
+        xblk, fblk = np.where(flip, xpre, xblk), np.where(flip, fpre, fblk)
+        spre = scur = np.where(flip, xcur - xpre, spre)
+        swap = np.abs(fblk) < np.abs(fcur)
+        xpre, xcur, xblk = np.where(swap, xcur, xpre), np.where(swap, xblk, xcur), np.where(swap, xcur, xblk)
+        fpre, fcur, fblk = np.where(swap, fcur, fpre), np.where(swap, fblk, fcur), np.where(swap, fcur, fblk)
+        delta = (xtol + rtol * np.abs(xcur)) / 2
+        sbis = (xblk - xcur) / 2
+        done = (fcur == 0) | (np.abs(sbis) < delta)
+        failed = ~np.isfinite(fcur)
+        stop = done | failed
+        root[idx[stop]] = xcur[stop]
+        iterations[idx[stop]] = i
+        converged[idx[done & ~failed]] = True
+        keep = ~stop
+        idx, xpre, xcur, xblk = idx[keep], xpre[keep], xcur[keep], xblk[keep]
+        fpre, fcur, fblk = fpre[keep], fcur[keep], fblk[keep]
+        spre, scur, delta, sbis = spre[keep], scur[keep], delta[keep], sbis[keep]
+
+        secant = -fcur * (xcur - xpre) / (fcur - fpre)
+        dpre = (fpre - fcur) / (xpre - xcur)
+        dblk = (fblk - fcur) / (xblk - xcur)
+        quadratic = -fcur * (fblk * dblk - fpre * dpre) / (dblk * dpre * (fblk - fpre))
+        stry = np.where(xpre == xblk, secant, quadratic)
+        good = (
+            (np.abs(spre) > delta)
+            & (np.abs(fcur) < np.abs(fpre))
+            & (2 * np.abs(stry) < np.minimum(np.abs(spre), 3 * np.abs(sbis) - delta))
+        )
+        spre, scur = np.where(good, scur, sbis), np.where(good, stry, sbis)
+        xpre, fpre = xcur, fcur
+        xcur = xcur + np.where(np.abs(scur) > delta, scur, np.where(sbis > 0, delta, -delta))
+        fcur = f(xcur, idx)
+    root[idx] = xcur
+    iterations[idx] = maxiter
+    return root, iterations, converged
+
+
+def _newton_many(
+    fd: Callable[[Any, Any], tuple[Any, Any]], x: Any, xtol: float, rtol: float, maxiter: int
+) -> tuple[Any, Any, Any]:
+    n = len(x)
+    root = x.copy()
+    iterations = np.full(n, maxiter, dtype=np.int64)
+    converged = np.zeros(n, dtype=bool)
+    idx = np.arange(n)
+    for i in range(1, maxiter + 1):
+        if not idx.size:
+            break
+        y, dy = fd(x, idx)
+        step = y / dy
+        zero = y == 0
+        failed = ~zero & ~np.isfinite(step)
+        x = np.where(zero | failed, x, x - step)
+        done = zero | (np.abs(step) < xtol + rtol * np.abs(x))
+        stop = done | failed
+        root[idx] = x
+        iterations[idx[stop]] = i
+        converged[idx[done & ~failed]] = True
+        keep = ~stop
+        idx, x = idx[keep], x[keep]
+    return root, iterations, converged
+
+
+def _broadcast_columns(values: Sequence[Any]) -> list[list[float]]:
+    # np.broadcast_to for scalars and flat sequences, as the NumPy path of
+    # solve_many broadcasts its inputs.
+    lengths = {len(v) for v in values if not isinstance(v, (int, float))}
+    if not lengths:
+        raise CalcError("solve_many expects one-dimensional arrays of problems")
+    if len(lengths - {1}) > 1:
+        raise CalcError("solve_many arrays have different lengths")
+    n = max(lengths - {1}, default=1)
+    columns = []
+    for value in values:
+        try:
+            column = [float(value)] if isinstance(value, (int, float)) else [float(v) for v in value]
+        except TypeError:
+            raise CalcError("solve_many expects one-dimensional arrays of problems") from None
+        columns.append(column * n if len(column) == 1 else column)
+    return columns
+
+
+def solve_many(
+    expr: str | CompiledExpression,
+    var: str = "x",
+    bracket: Optional[tuple[Any, Any]] = None,
+    x0: Any = None,
+    *,
+    method: Optional[str] = None,
+    env: Optional[Dict[str, Any]] = None,
+    xtol: float = _SOLVE_XTOL,
+    rtol: float = _SOLVE_RTOL,
+    maxiter: int = _SOLVE_MAXITER,
+) -> RootResult:
+    """Solve many independent problems ``expr == 0`` at once.
+
+    ``bracket`` is a pair of lower and upper bounds and ``x0`` the starting
+    points; these and the ``env`` values are arrays with one entry per
+    problem or scalars shared by every problem. The expression is compiled once
+    and each iteration evaluates all unfinished problems as NumPy arrays.
+    The result holds arrays: ``root``, ``iterations`` and ``converged``.
+    Problems whose bracket does not change sign, or that reach a point where
+    ``expr`` is not finite, stop with ``converged`` False.
+
+    Without NumPy the problems are solved one by one with :func:`solve`.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    method = _solve_method(method, bracket, x0)
+    env = dict(env or {})
+
+    if not _NUMPY_AVAILABLE:
+        # Like evaluate_vectorized, a variable missing from env is an error
+        # for the whole call, not a problem that fails to converge.
+        missing = compiled.variables - env.keys() - {var}
+        if missing:
+            raise CalcError(f"Unknown identifier: {sorted(missing)[0]}")
+        inputs = [*(bracket if bracket is not None else ()), *(() if x0 is None else (x0,))]
+        columns = _broadcast_columns([*inputs, *env.values()])
+        results = []
+        for row in zip(*columns):
+            point = dict(zip(env, row[len(inputs):]))
+            try:
+                results.append(
+                    solve(
+                        compiled, var,
+                        row[:2] if bracket is not None else None,
+                        row[len(inputs) - 1] if x0 is not None else None,
+                        method=method, env=point, xtol=xtol, rtol=rtol, maxiter=maxiter,
+                    )
+                )
+            except CalcError:
+                # A point outside the domain, or a bracket without a sign change
+                results.append(RootResult(math.nan, 0, False, method))
+        return RootResult(
+            [r.root for r in results], [r.iterations for r in results], [r.converged for r in results], method
+        )
+
+    try:
+        if bracket is not None:
+            lo, hi = (np.asarray(v, dtype=float) for v in bracket)
+            shape = np.broadcast_shapes(lo.shape, hi.shape, *(np.shape(v) for v in env.values()))
+        else:
+            shape = np.broadcast_shapes(np.shape(x0), *(np.shape(v) for v in env.values()))
+    except ValueError:
+        raise CalcError("solve_many arrays have different lengths") from None
+    if len(shape) != 1:
+        raise CalcError("solve_many expects one-dimensional arrays of problems")
+    params = {name: np.broadcast_to(np.asarray(value, dtype=float), shape) for name, value in env.items()}
+
+    def point_env(x: Any, idx: Any) -> Dict[str, Any]:
+        local = {name: value[idx] for name, value in params.items()}
+        local[var] = x
+        return local
+
+    with np.errstate(all="ignore"):
+        if method == "newton":
+            if x0 is not None:
+                start = np.broadcast_to(np.asarray(x0, dtype=float), shape).copy()
+            else:
+                start = np.broadcast_to((lo + hi) / 2, shape).copy()
+
+            def fd(x: Any, idx: Any) -> tuple[Any, Any]:
+                value, grads = value_and_grad(compiled, point_env(x, idx), [var], mode="forward")
+                return value, grads[var]
+
+            root, iterations, converged = _newton_many(fd, start, xtol, rtol, maxiter)
+        else:
+
+            def f(x: Any, idx: Any) -> Any:
+                return compiled.evaluate_vectorized(point_env(x, idx))
+
+            search = _bisect_many if method == "bisect" else _brent_many
+            lo, hi = np.broadcast_to(lo, shape).copy(), np.broadcast_to(hi, shape).copy()
+            root, iterations, converged = search(f, lo, hi, xtol, rtol, maxiter)
+    return RootResult(root, iterations, converged, method)
+
+
+# ---------------------------
+# JIT backend
+# ---------------------------
+
+# numba takes ~0.4s to import, so it is only loaded when a kernel is built.
+_NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+
+_JIT_FUNCS: Dict[str, tuple[str, int]] = {
+    "sqrt": ("math.sqrt", 1),
+    "sin": ("math.sin", 1),
+    "cos": ("math.cos", 1),
+    "tan": ("math.tan", 1),
+    "ln": ("math.log", 1),
+    "log10": ("math.log10", 1),
+    "abs": ("abs", 1),
+    "pow": ("math.pow", 2),
+}
+_JIT_OPERATORS: Dict[type, str] = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+    ast.Mod: "%",
+    ast.Pow: "**",
+}
+
+# Kernels by tree and column order; None marks trees that cannot be lowered.
+_JIT_KERNELS: Dict[tuple[str, tuple[str, ...]], Optional[Callable[..., None]]] = {}
+
+_KERNEL_TEMPLATE = """\
+import math
+
+import numba
+
+
+@numba.njit(cache=True, error_model="numpy")
+def kernel(out, flags{params}):
+    for i in range(out.shape[0]):
+{body}
+        out[i] = {result}
+        flags[i] = ({probe}) != 0.0
+"""
+
+
+class _Unlowerable(Exception):
+    pass
+
+
+class _KernelWriter:
+    """Lower an expression tree to the loop body of a numba kernel.
+
+    Every intermediate gets a local. A point is flagged when any of them is
+    nan or inf (``t * 0.0`` is 0.0 only for finite ``t``): those are exactly
+    the points where the interpreter might raise or where NumPy-style
+    arithmetic and Python's differ, and they are re-evaluated with
+    _eval_node afterwards.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = {name: f"c{i}" for i, name in enumerate(columns)}
+        self.lines: list[str] = []
+        self.temps: list[str] = []
+
+    def temp(self, expr: str) -> str:
+        name = f"t{len(self.temps)}"
+        self.temps.append(name)
+        self.lines.append(f"        {name} = {expr}")
+        return name
+
+    def constant(self, node: ast.AST) -> str:
+        if _estimate_cost(node) > _FOLD_MAX_COST:
+            raise _Unlowerable
+        try:
+            value = _eval_node(node)
+            if not isinstance(value, (int, float)):
+                raise _Unlowerable
+            value = float(value)
+        except (CalcError, OverflowError) as e:
+            raise _Unlowerable from e
+        if math.isnan(value):
+            return "math.nan"
+        if math.isinf(value):
+            # repr() would give the bare name inf
+            return "math.inf" if value > 0 else "(-math.inf)"
+        return repr(value)
+
+    def visit(self, node: ast.AST) -> str:
+        if isinstance(node, ast.Expression):
+            return self.visit(node.body)
+        if not _free_variables(node):
+            # Python evaluates constant subtrees with exact integers
+            return self.constant(node)
+        if isinstance(node, ast.Name):
+            if node.id not in self.columns:
+                raise _Unlowerable
+            return self.temp(f"{self.columns[node.id]}[i]")
+        if isinstance(node, ast.BinOp) and type(node.op) in _JIT_OPERATORS:
+            left, right = self.visit(node.left), self.visit(node.right)
+            return self.temp(f"{left} {_JIT_OPERATORS[type(node.op)]} {right}")
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return self.temp(f"-{self.visit(node.operand)}")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            args = [self.visit(arg) for arg in node.args]
+            if node.func.id == "log" and len(args) in (1, 2):
+                # math.log(x, b) is computed as log(x) / log(b)
+                if len(args) == 1:
+                    return self.temp(f"math.log({args[0]})")
+                return self.temp(f"math.log({args[0]}) / math.log({args[1]})")
+            name, arity = _JIT_FUNCS.get(node.func.id, (None, 0))
+            if name is not None and len(args) == arity:
+                return self.temp(f"{name}({', '.join(args)})")
+        raise _Unlowerable
+
+    def source(self, tree: ast.AST) -> str:
+        result = self.visit(tree)
+        return _KERNEL_TEMPLATE.format(
+            params="".join(f", {column}" for column in self.columns.values()),
+            body="\n".join(self.lines) or "        pass",
+            result=result,
+            probe=" + ".join(f"{t} * 0.0" for t in self.temps) or "0.0",
+        )
+
+
+def _load_kernel(source: str) -> Optional[Callable[..., None]]:
+    # Kernels live in files named by their hash so numba's own on-disk
+    # cache can skip compilation in later processes.
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:32]
+    directory = os.path.join(_default_cache_dir(), "jit")
+    path = os.path.join(directory, f"kernel_{digest}.py")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(path):
+            _atomic_write(path, source)
+        spec = importlib.util.spec_from_file_location(f"_calculator_kernel_{digest}", path)
+        module = importlib.util.module_from_spec(spec)
+        # numba's cache re-imports the defining module by name
+        sys.modules[spec.name] = module  # type: ignore[union-attr]
+        spec.loader.exec_module(module)  # type: ignore[union-attr]
+    except (OSError, ImportError):
+        return None
+    return module.kernel
+
+
+def _jit_kernel(compiled: CompiledExpression, columns: tuple[str, ...]) -> Optional[Callable[..., None]]:
+    key = (ast.dump(compiled.tree), columns)
+    if key not in _JIT_KERNELS:
+        try:
+            source = _KernelWriter(columns).source(compiled.tree)
+        except _Unlowerable:
+            _JIT_KERNELS[key] = None
+        else:
+            _JIT_KERNELS[key] = _load_kernel(source)
+    return _JIT_KERNELS[key]
+
+
+def evaluate_jit(expr: str | CompiledExpression, env: Dict[str, Any]) -> Any:
+    """Evaluate over one-dimensional columns with a fused numba kernel.
+
+    The result, and any CalcError, is what evaluating each point in turn
+    with :meth:`CompiledExpression.evaluate` would give: the kernel runs the
+    whole loop without intermediate arrays, and points it flags are redone
+    with _eval_node. Without numba and NumPy, or for expressions the kernel
+    writer does not handle, every point goes through _eval_node. Values
+    are taken as float64; scalars in ``env`` apply to every point.
+    """
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    if _NUMPY_AVAILABLE:
+        shape = np.broadcast_shapes(*(np.shape(v) for v in env.values())) if env else ()
+        if len(shape) != 1:
+            raise CalcError("evaluate_jit expects one-dimensional columns")
+        columns = {k: np.broadcast_to(np.asarray(v, dtype=float), shape) for k, v in env.items()}
+        n = shape[0]
+    else:
+        columns = {k: v if isinstance(v, (list, tuple, array)) else [v] for k, v in env.items()}
+        lengths = {len(v) for v in columns.values() if len(v) != 1} or {min(map(len, columns.values()), default=0)}
+        if len(lengths) != 1:
+            raise CalcError("Columns have different lengths")
+        (n,) = lengths
+
+    def point(i: int) -> Dict[str, float]:
+        return {k: float(v[i] if len(v) > 1 else v[0]) for k, v in columns.items()}
+
+    if _NUMPY_AVAILABLE and _NUMBA_AVAILABLE and compiled.variables and n:
+        names = tuple(sorted(compiled.variables))
+        kernel = _jit_kernel(compiled, names) if all(name in columns for name in names) else None
+        if kernel is not None:
+            out = np.empty(n)
+            flags = np.empty(n, dtype=np.bool_)
+            try:
+                kernel(out, flags, *(columns[name] for name in names))
+            except Exception:
+                # numba compiles on the first call; a kernel it rejects is
+                # dropped and every point goes through _eval_node instead.
+                _JIT_KERNELS[ast.dump(compiled.tree), names] = None
+            else:
+                for i in np.flatnonzero(flags):
+                    out[i] = compiled.evaluate(point(int(i)))
+                return out
+
+    out = np.empty(n) if _NUMPY_AVAILABLE else array("d", bytes(8 * n))
+    for i in range(n):
+        out[i] = compiled.evaluate(point(i))
+    return out
+
+
+# ---------------------------
+# Shared-memory block evaluation
+# ---------------------------
+
+# float64 elements per block: 256 KiB per buffer, small enough that a
+# block's operands and scratch buffers stay in cache.
+_BLOCK_SIZE = 32_768
+
+if _NUMPY_AVAILABLE:
+    _BINARY_UFUNCS: Dict[type, Any] = {
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Div: np.true_divide,
+        ast.Mod: np.remainder,
+        ast.Pow: np.power,
+    }
+
+    _CALL_UFUNCS: Dict[str, Any] = {
+        "sqrt": np.sqrt,
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "log": np.log,
+        "ln": np.log,
+        "log10": np.log10,
+        "abs": np.absolute,
+        "pow": np.power,
+    }
+
+
+class _BlockEvaluator:
+    """Evaluates a tree block by block without allocating temporaries.
+
+    Subtrees that do not depend on a variable are folded to scalars once.
+    Every other intermediate is written with a ufunc ``out=`` into a
+    block-sized scratch buffer taken from a pool and returned to it as soon
+    as its consumer has run, reusing an operand's buffer where possible, so
+    the pool only grows to the tree's register pressure.
+    """
+
+    def __init__(self, tree: ast.Expression, variables: frozenset[str], block_size: int):
+        self.root = tree.body
+        self.block_size = block_size
+        self.free: list[Any] = []
+        self.varying: set[int] = set()
+        self.constants: Dict[int, Any] = {}
+        self._prepare(self.root, variables)
+
+    def _prepare(self, node: ast.AST, variables: frozenset[str]) -> bool:
+        children = list(ast.iter_child_nodes(node))
+        varying = isinstance(node, ast.Name) and node.id in variables
+        for child in children:
+            if isinstance(child, ast.expr) and not (
+                isinstance(node, ast.Call) and child is node.func
+            ):
+                varying = self._prepare(child, variables) or varying
+        if varying:
+            self.varying.add(id(node))
+        else:
+            self.constants[id(node)] = _eval_node(node)
+        return varying
+
+    def _take(self, n: int) -> tuple[Any, Any]:
+        base = self.free.pop() if self.free else np.empty(self.block_size)
+        return base[:n], base
+
+    def _release(self, *bases: Any) -> None:
+        self.free.extend(base for base in bases if base is not None)
+
+    def run(self, env: Dict[str, Any], out: Any) -> None:
+        value, owned = self._eval(self.root, env, len(out), out)
+        if value is not out:
+            np.copyto(out, value)
+        self._release(owned)
+
+    def _eval(self, node: ast.AST, env: Dict[str, Any], n: int, target: Any = None) -> tuple[Any, Any]:
+        # Returns (value, scratch base owned by the caller or None).
+        if id(node) not in self.varying:
+            return self.constants[id(node)], None
+        if isinstance(node, ast.Name):
+            return env[node.id], None
+
+        if isinstance(node, ast.BinOp):
+            operands = [self._eval(node.left, env, n), self._eval(node.right, env, n)]
+            ufunc = _BINARY_UFUNCS[type(node.op)]
+        elif isinstance(node, ast.UnaryOp):
+            operands = [self._eval(node.operand, env, n)]
+            ufunc = np.negative
+        else:
+            operands = [self._eval(arg, env, n) for arg in node.args]
+            ufunc = _CALL_UFUNCS[node.func.id]
+
+        owned = [base for _, base in operands if base is not None]
+        if target is not None:
+            dest, dest_base = target, None
+        elif owned:
+            dest_base = owned.pop(0)
+            dest = dest_base[:n]
+        else:
+            dest, dest_base = self._take(n)
+
+        args = [value for value, _ in operands]
+        try:
+            if isinstance(node, ast.Call) and node.func.id == "log" and len(args) == 2:
+                base_log, base_owned = self._take(n)
+                np.log(args[1], out=base_log)
+                np.log(args[0], out=dest)
+                np.true_divide(dest, base_log, out=dest)
+                owned.append(base_owned)
+            else:
+                ufunc(*args, out=dest)
+        except Exception as e:
+            raise CalcError(str(e))
+        self._release(*owned)
+        return dest, dest_base
+
+
+class SharedColumn:
+    """A float64 column that worker processes can map without copying.
+
+    Backed either by ``multiprocessing.shared_memory`` (:meth:`create`,
+    :meth:`from_values`) or by a memory-mapped file of raw little-endian
+    float64 (:meth:`from_file`, :meth:`create_file`). Close it when done;
+    closing a column this process created in shared memory also frees it.
+    """
+
+    def __init__(self, array: Any, spec: tuple, handle: Any = None, owner: bool = False):
+        self.array = array
+        self.spec = spec
+        self._handle = handle
+        self._owner = owner
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __enter__(self) -> SharedColumn:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @classmethod
+    def create(cls, length: int) -> SharedColumn:
+        _require_numpy()
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(create=True, size=max(length * 8, 1))
+        array = np.ndarray((length,), dtype="<f8", buffer=shm.buf)
+        return cls(array, ("shm", shm.name, length), shm, owner=True)
+
+    @classmethod
+    def from_values(cls, values: Any) -> SharedColumn:
+        values = np.asarray(values, dtype="<f8")
+        column = cls.create(len(values))
+        column.array[:] = values
+        return column
+
+    @classmethod
+    def from_file(cls, path: str, *, writable: bool = False) -> SharedColumn:
+        _require_numpy()
+        array = np.memmap(path, dtype="<f8", mode="r+" if writable else "r")
+        return cls(array, ("file", os.path.abspath(path), len(array), writable), array)
+
+    @classmethod
+    def create_file(cls, path: str, length: int) -> SharedColumn:
+        _require_numpy()
+        array = np.memmap(path, dtype="<f8", mode="w+", shape=(length,))
+        return cls(array, ("file", os.path.abspath(path), length, True), array)
+
+    @classmethod
+    def attach(cls, spec: tuple) -> SharedColumn:
+        if spec[0] == "file":
+            _, path, length, writable = spec
+            array = np.memmap(path, dtype="<f8", mode="r+" if writable else "r", shape=(length,))
+            return cls(array, spec, array)
+
+        from multiprocessing import shared_memory
+
+        # Pool workers share the creator's resource tracker (see _get_pool),
+        # so attaching does not hand them ownership of the block.
+        _, name, length = spec
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray((length,), dtype="<f8", buffer=shm.buf)
+        return cls(array, spec, shm)
+
+    def close(self) -> None:
+        handle, self._handle = self._handle, None
+        self.array = None
+        if handle is None:
+            return
+        if isinstance(handle, np.memmap):
+            handle.flush()
+            return
+        handle.close()
+        if self._owner:
+            handle.unlink()
+
+
+def _require_numpy() -> None:
+    if not _NUMPY_AVAILABLE:
+        raise CalcError("NumPy is required for array evaluation")
+
+
+def _evaluate_blocks(
+    tree: ast.Expression,
+    columns: Dict[str, Any],
+    out: Any,
+    start: int,
+    stop: int,
+    block_size: int,
+) -> None:
+    evaluator = _BlockEvaluator(tree, frozenset(columns), block_size)
+    with np.errstate(all="ignore"):
+        for lo in range(start, stop, block_size):
+            hi = min(lo + block_size, stop)
+            env = {name: array[lo:hi] for name, array in columns.items()}
+            evaluator.run(env, out[lo:hi])
+
+
+def _evaluate_block_range(
+    tree: ast.Expression,
+    specs: Dict[str, tuple],
+    out_spec: tuple,
+    start: int,
+    stop: int,
+    block_size: int,
+) -> None:
+    # Pool worker entry point: map the columns, evaluate, unmap.
+    columns = {name: SharedColumn.attach(spec) for name, spec in specs.items()}
+    out = SharedColumn.attach(out_spec)
+    try:
+        arrays = {name: column.array for name, column in columns.items()}
+        _evaluate_blocks(tree, arrays, out.array, start, stop, block_size)
+        del arrays
+    finally:
+        for column in columns.values():
+            column.close()
+        out.close()
+
+
+def evaluate_shared(
+    expr: str | CompiledExpression,
+    columns: Dict[str, SharedColumn],
+    out: Optional[SharedColumn] = None,
+    *,
+    workers: Optional[int] = None,
+    block_size: int = _BLOCK_SIZE,
+) -> SharedColumn:
+    """Evaluate ``expr`` over shared columns on a pool of processes.
+
+    The rows are split into one contiguous range per worker; each worker
+    maps the columns, evaluates its range block by block and writes into
+    ``out`` (created in shared memory when not given). Domain errors come
+    out as ``nan`` as with :meth:`CompiledExpression.evaluate_vectorized`.
+    """
+    _require_numpy()
+    compiled = compile_expression(expr) if isinstance(expr, str) else expr
+    if not columns:
+        raise CalcError("At least one column is required")
+    _check_supported(compiled.tree, frozenset(columns))
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) != 1:
+        raise CalcError("Columns have different lengths")
+    (rows,) = lengths
+    if out is None:
+        out = SharedColumn.create(rows)
+    elif len(out) != rows:
+        raise CalcError("Output column has the wrong length")
+
+    specs = {name: column.spec for name, column in columns.items()}
+    workers = max(1, min(workers or os.cpu_count() or 1, -(-rows // block_size)))
+    step = -(-rows // workers // block_size) * block_size
+    ranges = [(lo, min(lo + step, rows)) for lo in range(0, rows, step)] if rows else []
+
+    if workers == 1:
+        arrays = {name: column.array for name, column in columns.items()}
+        _evaluate_blocks(compiled.tree, arrays, out.array, 0, rows, block_size)
+        return out
+
+    pool = _get_pool("process")
+    futures = [
+        pool.submit(_evaluate_block_range, compiled.tree, specs, out.spec, lo, hi, block_size)
+        for lo, hi in ranges
+    ]
+    for future in futures:
+        future.result()
+    return out
+
+
+# ---------------------------
+# Batch common-subexpression elimination
+# ---------------------------
+
+# Lines per batch plan, and the dedup ratio (total / unique subtrees) above
+# which batch CLI mode switches to shared evaluation.
+_CSE_CHUNK = 4096
+_CSE_SAMPLE = 256
+_CSE_MIN_RATIO = 1.5
+
+# Totals reported by --profile.
+_CSE_STATS: Dict[str, int] = {"lines": 0, "nodes": 0, "unique": 0}
+
+
+class BatchPlan:
+    """A batch of expressions sharing structurally identical subtrees.
+
+    Every distinct subtree across the batch is evaluated at most once;
+    per-line results are assembled from the shared values. Errors are
+    memoised too, and each line reports the error serial evaluation would.
+    A line nested too deeply for the shared walk is evaluated serially.
+    """
+
+    def __init__(self, exprs: Sequence[str]):
+        self._keys: Dict[tuple, int] = {}
+        self._nodes: list[tuple[ast.AST, tuple[int, ...]]] = []
+        self._sizes: list[int] = []
+        # Per line: its root node, its error, or None when it is too deep to
+        # intern; the compiled expression is kept for serial evaluation.
+        self._roots: list[Optional[int | CalcError]] = []
+        self._compiled: list[Optional[CompiledExpression]] = []
+        self.total_nodes = 0
+        for expr in exprs:
+            try:
+                compiled = compile_expression(expr)
+            except CalcError as e:
+                self._roots.append(e)
+                self._compiled.append(None)
+                continue
+            try:
+                self._roots.append(self._intern(compiled.tree.body, compiled.text))
+            except RecursionError:
+                # Subtrees interned before the overflow are complete and stay valid.
+                self._roots.append(None)
+            self._compiled.append(compiled)
+
+    @property
+    def unique_nodes(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def dedup_ratio(self) -> float:
+        return self.total_nodes / self.unique_nodes if self._nodes else 1.0
+
+    def _intern(self, node: ast.AST, text: Optional[bytes]) -> int:
+        # A subtree's source span re-parses to the same subtree, so identical
+        # spans are looked up before descending: a shared subterm costs one
+        # slice per line instead of a walk over all of its nodes.
+        span: Optional[tuple] = None
+        if text is not None and getattr(node, "end_lineno", None) == node.lineno == 1:
+            span = ("text", text[node.col_offset : node.end_col_offset])
+            uid = self._keys.get(span)
+            if uid is not None:
+                self.total_nodes += self._sizes[uid]
+                return uid
+
+        total_before = self.total_nodes
+        self.total_nodes += 1
+        if isinstance(node, ast.Constant):
+            key: tuple = ("const", type(node.value), node.value)
+            children: tuple[int, ...] = ()
+        elif isinstance(node, ast.Name):
+            key, children = ("name", node.id), ()
+        elif isinstance(node, ast.BinOp):
+            children = (self._intern(node.left, text), self._intern(node.right, text))
+            key = ("bin", type(node.op), children)
+        elif isinstance(node, ast.UnaryOp):
+            children = (self._intern(node.operand, text),)
+            key = ("unary", type(node.op), children)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            children = tuple(self._intern(arg, text) for arg in node.args)
+            key = ("call", node.func.id, children)
+        else:
+            # Anything else is left for _eval_node to reject, unshared.
+            key, children = ("other", id(node)), ()
+
+        uid = self._keys.get(key)
+        if uid is None:
+            uid = self._keys[key] = len(self._nodes)
+            self._nodes.append((node, children))
+            self._sizes.append(self.total_nodes - total_before)
+        if span is not None:
+            self._keys[span] = uid
+        return uid
+
+    def evaluate(self) -> list[float | CalcError]:
+        memo: Dict[int, tuple[Any, Optional[CalcError]]] = {}
+
+        def value(uid: int) -> Any:
+            hit = memo.get(uid)
+            if hit is None:
+                try:
+                    hit = (compute(uid), None)
+                except CalcError as e:
+                    hit = (None, e)
+                memo[uid] = hit
+            if hit[1] is not None:
+                raise hit[1]
+            return hit[0]
+
+        def compute(uid: int) -> Any:
+            # Same order and error choices as _eval_node.
+            node, children = self._nodes[uid]
+            if isinstance(node, ast.BinOp):
+                left = value(children[0])
+                right = value(children[1])
+                return _apply_binary(node.op, left, right)
+            if isinstance(node, ast.UnaryOp):
+                op_type = type(node.op)
+                if op_type in _OPERATORS:
+                    return _OPERATORS[op_type](value(children[0]))
+                raise CalcError("Unsupported unary operator")
+            if isinstance(node, ast.Call):
+                func = _call_target(node)
+                return _apply_call(func, [value(child) for child in children])
+            return _eval_node(node)
+
+        results: list[float | CalcError] = []
+        for root, compiled in zip(self._roots, self._compiled):
+            if isinstance(root, CalcError):
+                results.append(root)
+                continue
+            try:
+                if root is None:
+                    results.append(compiled.evaluate())
+                else:
+                    try:
+                        results.append(float(value(root)))
+                    except RecursionError:
+                        # value() and compute() take two frames per level to
+                        # _eval_node's one; memo entries made so far are whole.
+                        results.append(compiled.evaluate())
+            except CalcError as e:
+                results.append(e)
+        return results
+
+
+def evaluate_batch(exprs: Sequence[str]) -> list[float | CalcError]:
+    """Evaluate many expressions, sharing work between identical subtrees."""
+    results: list[float | CalcError] = []
+    for start in range(0, len(exprs), _CSE_CHUNK):
+        plan = BatchPlan(exprs[start : start + _CSE_CHUNK])
+        results.extend(plan.evaluate())
+        _CSE_STATS["lines"] += len(plan._roots)
+        _CSE_STATS["nodes"] += plan.total_nodes
+        _CSE_STATS["unique"] += plan.unique_nodes
+    return results
+
+
+def _estimate_sharing(exprs: Sequence[str]) -> float:
+    return BatchPlan(exprs[:_CSE_SAMPLE]).dedup_ratio
+
+
+# ---------------------------
+# Parallel evaluation
+# ---------------------------
+
+# Estimated cost (in machine-word operations) below which a subtree is
+# cheaper to evaluate inline than to hand to a pool worker. Calibrated with
+# ``--benchmark parallel``.
+_PARALLEL_MIN_COST = 200_000.0
+
+# CPython stores big integers in 30-bit digits.
+_DIGIT_BITS = 30
+
+_POOLS: Dict[str, Executor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(kind: str) -> Executor:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(kind)
+        if pool is None:
+            workers = os.cpu_count() or 1
+            if kind == "thread":
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="calc")
+            elif kind == "process":
+                # Start the resource tracker first so workers inherit it and
+                # shared memory they attach to stays owned by its creator.
+                from multiprocessing import resource_tracker
+
+                resource_tracker.ensure_running()
+                pool = ProcessPoolExecutor(max_workers=workers)
+            else:
+                raise ValueError(f"Unknown executor kind: {kind}")
+            _POOLS[kind] = pool
+        return pool
+
+
+def _constant_int(node: ast.AST) -> Optional[int]:
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    if (
+        isinstance(node, ast.UnaryOp)
+        and isinstance(node.op, ast.USub)
+        and isinstance(node.operand, ast.Constant)
+        and type(node.operand.value) is int
+    ):
+        return -node.operand.value
+    return None
+
+
+def _estimate(node: ast.AST, costs: Dict[int, float]) -> int:
+    """Record the estimated cost of ``node`` and its subtrees in ``costs``.
+
+    Returns the estimated bit length of an integer result, or 0 when the
+    result is a float (whose operations all cost about the same).
+    """
+    cost = 1.0
+    bits = 0
+
+    if isinstance(node, ast.Expression):
+        bits = _estimate(node.body, costs)
+        cost = costs[id(node.body)]
+    elif isinstance(node, ast.Constant):
+        if type(node.value) is int:
+            bits = abs(node.value).bit_length()
+    elif isinstance(node, ast.BinOp):
+        left_bits = _estimate(node.left, costs)
+        right_bits = _estimate(node.right, costs)
+        cost += costs[id(node.left)] + costs[id(node.right)]
+        if left_bits and right_bits:
+            left_words = left_bits // _DIGIT_BITS + 1
+            right_words = right_bits // _DIGIT_BITS + 1
+            op_type = type(node.op)
+            if op_type is ast.Pow:
+                exponent = _constant_int(node.right)
+                if exponent is not None and exponent >= 0:
+                    bits = left_bits * exponent
+                    # Squaring dominates; Karatsuba makes that ~n**1.585.
+                    cost += 2 * (bits // _DIGIT_BITS + 1) ** 1.585
+            elif op_type is ast.Mult:
+                bits = left_bits + right_bits
+                cost += left_words * right_words
+            elif op_type in (ast.Add, ast.Sub):
+                bits = max(left_bits, right_bits) + 1
+                cost += max(left_words, right_words)
+            elif op_type is ast.Mod:
+                bits = right_bits
+                cost += left_words * right_words
+            else:
+                cost += left_words
+    elif isinstance(node, ast.UnaryOp):
+        bits = _estimate(node.operand, costs)
+        cost += costs[id(node.operand)]
+    elif isinstance(node, ast.Call):
+        for arg in node.args:
+            arg_bits = _estimate(arg, costs)
+            cost += costs[id(arg)]
+        if isinstance(node.func, ast.Name) and node.func.id == "abs" and len(node.args) == 1:
+            bits = arg_bits
+
+    costs[id(node)] = cost
+    return bits
+
+
+def _estimate_cost(node: ast.AST) -> float:
+    costs: Dict[int, float] = {}
+    _estimate(node, costs)
+    return costs[id(node)]
+
+
+def _heavy_frontier(
+    node: ast.AST, costs: Dict[int, float], min_cost: float
+) -> list[ast.AST]:
+    """Return the largest independent subtrees worth evaluating on a worker."""
+    if costs.get(id(node), 0.0) < min_cost:
+        return []
+    if isinstance(node, ast.Expression):
+        children = [node.body]
+    elif isinstance(node, ast.BinOp):
+        children = [node.left, node.right]
+    elif isinstance(node, ast.UnaryOp):
+        children = [node.operand]
+    elif isinstance(node, ast.Call):
+        children = list(node.args)
+    else:
+        children = []
+
+    frontier: list[ast.AST] = []
+    for child in children:
+        frontier.extend(_heavy_frontier(child, costs, min_cost))
+    return frontier or [node]
+
+
+def _eval_scheduled(
+    node: ast.AST,
+    futures: Dict[int, Future],
+    done: Dict[int, tuple[Any, Optional[CalcError]]],
+) -> Any:
+    # Walks the tree in the same order as _eval_node so that the first error
+    # raised is the one serial evaluation would have raised.
+    key = id(node)
+    if key in futures:
+        return futures[key].result()
+    if key in done:
+        value, error = done[key]
+        if error is not None:
+            raise error
+        return value
+
+    if isinstance(node, ast.Expression):
+        return _eval_scheduled(node.body, futures, done)
+
+    if isinstance(node, ast.BinOp):
+        left = _eval_scheduled(node.left, futures, done)
+        right = _eval_scheduled(node.right, futures, done)
+        return _apply_binary(node.op, left, right)
+
+    if isinstance(node, ast.UnaryOp):
+        op_type = type(node.op)
+        if op_type in _OPERATORS:
+            return _OPERATORS[op_type](_eval_scheduled(node.operand, futures, done))
+        raise CalcError("Unsupported unary operator")
+
+    if isinstance(node, ast.Call):
+        func = _call_target(node)
+        return _apply_call(func, [_eval_scheduled(arg, futures, done) for arg in node.args])
+
+    return _eval_node(node)
+
+
+def evaluate_parallel(
+    expr: str,
+    *,
+    executor: str = "thread",
+    min_cost: float = _PARALLEL_MIN_COST,
+) -> float:
+    """Evaluate ``expr``, running costly independent subterms concurrently.
+
+    ``executor`` is ``"thread"`` or ``"process"``. Big-integer arithmetic
+    holds the GIL, so only the process pool speeds it up; threads help when
+    the heavy work releases the GIL. Expressions with fewer than two subterms
+    above ``min_cost`` are evaluated serially.
+    """
+    parsed = compile_expression(expr).tree
+    costs: Dict[int, float] = {}
+    _estimate(parsed, costs)
+    tasks = _heavy_frontier(parsed, costs, min_cost)
+    if len(tasks) < 2:
+        return float(_eval_node(parsed))
+
+    # Keep the costliest task on this thread so it works while waiting.
+    tasks.sort(key=lambda n: costs[id(n)])
+    pool = _get_pool(executor)
+    futures = {id(task): pool.submit(_eval_node, task) for task in tasks[:-1]}
+    done: Dict[int, tuple[Any, Optional[CalcError]]] = {}
+    try:
+        done[id(tasks[-1])] = (_eval_node(tasks[-1]), None)
+    except CalcError as e:
+        done[id(tasks[-1])] = (None, e)
+    return float(_eval_scheduled(parsed, futures, done))
+
+
+# ---------------------------
+# Asyncio API
+# ---------------------------
+
+def _worker_item(expr: str) -> ast.Expression | CalcError:
+    # Compiled in the parent, like evaluate_parallel's tasks, so workers see
+    # the functions defined here rather than those they started with.
+    try:
+        return compile_expression(expr).tree
+    except CalcError as e:
+        return e
+
+
+def _async_worker(conn: Any) -> None:
+    # Child process loop: evaluate each chunk, streaming results back one at
+    # a time so the parent can enforce a deadline per expression.
+    while True:
+        try:
+            chunk = conn.recv()
+        except EOFError:
+            return
+        if chunk is None:
+            return
+        for item in chunk:
+            if isinstance(item, CalcError):
+                conn.send((False, item))
+                continue
+            try:
+                conn.send((True, float(_eval_node(item))))
+            except Exception as e:
+                conn.send((False, e))
+
+
+class _Worker:
+    def __init__(self) -> None:
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_async_worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.conn = parent
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        with contextlib.suppress(OSError):
+            self.conn.send(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class AsyncEvaluator:
+    """Evaluate expressions from asyncio code without blocking the loop.
+
+    Work runs on ``workers`` child processes. An expression that overruns
+    its ``timeout`` or whose caller is cancelled has its worker killed, so
+    runaway evaluations (``9**9**9``) really stop. Batches are sent to the
+    workers in chunks of ``chunk_size`` expressions.
+    """
+
+    def __init__(self, workers: Optional[int] = None, *, chunk_size: int = 64):
+        self.size = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._idle: collections.deque[_Worker] = collections.deque()
+        self._slots = asyncio.Semaphore(self.size)
+        # Each busy worker has one thread blocked in Connection.recv().
+        self._threads = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="calc-recv")
+        self._closed = False
+
+    async def __aenter__(self) -> AsyncEvaluator:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        self._closed = True
+        while self._idle:
+            self._idle.pop().stop()
+        self._threads.shutdown(wait=False)
+
+    async def _acquire(self) -> _Worker:
+        if self._closed:
+            raise RuntimeError("AsyncEvaluator is closed")
+        await self._slots.acquire()
+        try:
+            return self._idle.pop() if self._idle else _Worker()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: _Worker) -> None:
+        self._idle.append(worker)
+        self._slots.release()
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        self._slots.release()
+
+    async def _recv(self, worker: _Worker, timeout: Optional[float]) -> tuple[bool, Any]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._threads, worker.conn.recv), timeout)
+
+    async def _run_chunk(
+        self, chunk: list[str], results: list[Any], base: int, timeout: Optional[float]
+    ) -> None:
+        items = [_worker_item(expr) for expr in chunk]
+        pos = 0
+        while pos < len(chunk):
+            worker = await self._acquire()
+            try:
+                worker.conn.send(items[pos:])
+                while pos < len(chunk):
+                    ok, value = await self._recv(worker, timeout)
+                    results[base + pos] = value
+                    pos += 1
+            except asyncio.TimeoutError:
+                # The rest of the chunk is resent to a fresh worker.
+                self._discard(worker)
+                results[base + pos] = CalcError("Evaluation timed out")
+                pos += 1
+            except BaseException:
+                self._discard(worker)
+                raise
+            else:
+                self._release(worker)
+
+    async def evaluate(self, expr: str, *, timeout: Optional[float] = None) -> float:
+        results: list[Any] = [None]
+        await self._run_chunk([expr], results, 0, timeout)
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+
+    async def evaluate_many(
+        self,
+        exprs: Iterable[str],
+        *,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> list[Any]:
+        """Evaluate every expression, returning results in input order.
+
+        Failed items hold their exception instead of a value. ``exprs`` is
+        consumed lazily through a bounded queue, so a slow pool pushes back
+        on the producer. ``timeout`` applies to each expression.
+        """
+        consumers = concurrency or self.size
+        queue: asyncio.Queue[Optional[tuple[int, list[str]]]] = asyncio.Queue(maxsize=consumers * 2)
+        results: list[Any] = []
+
+        async def produce() -> None:
+            it = iter(exprs)
+            while True:
+                chunk = list(itertools.islice(it, self.chunk_size))
+                if not chunk:
+                    break
+                base = len(results)
+                results.extend([None] * len(chunk))
+                await queue.put((base, chunk))
+            for _ in range(consumers):
+                await queue.put(None)
+
+        async def consume() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                base, chunk = item
+                await self._run_chunk(chunk, results, base, timeout)
+
+        await asyncio.gather(produce(), *(consume() for _ in range(consumers)))
+        return results
+
+
+# Per loop: the evaluator behind aevaluate() and the generator that closes it.
+_ASYNC_EVALUATORS: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, tuple[AsyncEvaluator, AsyncIterator[None]]
+] = weakref.WeakKeyDictionary()
+
+
+async def _close_at_shutdown(
+    loop: asyncio.AbstractEventLoop, evaluator: AsyncEvaluator
+) -> AsyncIterator[None]:
+    # Suspended at the yield for the loop's lifetime. loop.shutdown_asyncgens(),
+    # which asyncio.run() calls before closing the loop, closes it and so
+    # stops the evaluator's worker processes.
+    try:
+        yield
+    finally:
+        _ASYNC_EVALUATORS.pop(loop, None)
+        await evaluator.aclose()
+
+
+async def _default_async_evaluator() -> AsyncEvaluator:
+    loop = asyncio.get_running_loop()
+    entry = _ASYNC_EVALUATORS.get(loop)
+    if entry is None:
+        evaluator = AsyncEvaluator()
+        closer = _close_at_shutdown(loop, evaluator)
+        # The first step registers the generator with the loop, which only
+        # holds it weakly; the entry keeps it alive.
+        await closer.asend(None)
+        entry = _ASYNC_EVALUATORS[loop] = (evaluator, closer)
+    return entry[0]
+
+
+async def aevaluate(expr: str, *, timeout: Optional[float] = None) -> float:
+    """Async evaluate_expression; raises CalcError when ``timeout`` expires.
+
+    Uses one AsyncEvaluator per event loop, closed when ``asyncio.run``
+    shuts the loop down. Loops run by hand should call
+    ``loop.shutdown_asyncgens()`` before closing, or use ``async with
+    AsyncEvaluator()`` directly.
+    """
+    return await (await _default_async_evaluator()).evaluate(expr, timeout=timeout)
+
+
+async def aevaluate_many(
+    exprs: Iterable[str], *, concurrency: int = 4, timeout: Optional[float] = None
+) -> list[Any]:
+    return await (await _default_async_evaluator()).evaluate_many(
+        exprs, concurrency=concurrency, timeout=timeout
+    )
+
+
+# ---------------------------
+# Workspace
+# ---------------------------
+
+class Workspace:
+    """Named cells whose expressions may reference other cells.
+
+    Setting a cell recomputes only the cells downstream of it, in dependency
+    order. Inside ``with ws.batch():`` changes are collected and the affected
+    cells are recomputed once when the block exits. Cells may reference
+    names that are not defined yet; they hold an error until they are.
+    """
+
+    def __init__(self) -> None:
+        self._cells: Dict[str, Optional[CompiledExpression]] = {}
+        self._inputs: Dict[str, float] = {}
+        self._values: Dict[str, Any] = {}
+        self._deps: Dict[str, frozenset[str]] = {}
+        self._dependents: Dict[str, set[str]] = collections.defaultdict(set)
+        self._dirty: set[str] = set()
+        self._batch_depth = 0
+        # Number of cells evaluated by the most recent recomputation.
+        self.recomputed = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._cells
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def __getitem__(self, name: str) -> float:
+        return self.get(name)
+
+    def __setitem__(self, name: str, value: float | str) -> None:
+        self.set(name, value)
+
+    def get(self, name: str) -> float:
+        if name not in self._values:
+            raise CalcError(f"Unknown cell: {name}")
+        value = self._values[name]
+        if isinstance(value, CalcError):
+            raise value
+        return value
+
+    def formula(self, name: str) -> Optional[str]:
+        compiled = self._cells.get(name)
+        return compiled.source if compiled is not None else None
+
+    def set(self, name: str, value: float | str) -> None:
+        """Set ``name`` to a number or an expression over other cells."""
+        if not name.isidentifier() or name in _CONSTANTS or name in _MATH_FUNCS:
+            raise CalcError(f"Invalid cell name: {name}")
+        if isinstance(value, str):
+            compiled: Optional[CompiledExpression] = compile_expression(value)
+            deps = compiled.variables
+        else:
+            compiled = None
+            deps = frozenset()
+        self._check_cycle(name, deps)
+
+        for dep in self._deps.get(name, ()):
+            self._dependents[dep].discard(name)
+        for dep in deps:
+            self._dependents[dep].add(name)
+        self._deps[name] = deps
+        self._cells[name] = compiled
+        if compiled is None:
+            self._inputs[name] = float(value)
+        else:
+            self._inputs.pop(name, None)
+        self._mark(name)
+
+    def update(self, cells: Dict[str, float | str]) -> None:
+        with self.batch():
+            for name, value in cells.items():
+                self.set(name, value)
+
+    def delete(self, name: str) -> None:
+        if name not in self._cells:
+            raise CalcError(f"Unknown cell: {name}")
+        for dep in self._deps.pop(name):
+            self._dependents[dep].discard(name)
+        del self._cells[name]
+        self._inputs.pop(name, None)
+        self._values.pop(name, None)
+        self._mark(name)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[Workspace]:
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._recompute()
+
+    def _check_cycle(self, name: str, deps: frozenset[str]) -> None:
+        if name in deps:
+            raise CalcError(f"Circular reference: {name}")
+        if not self._dependents.get(name):
+            # Nothing reads this cell, so no path can lead back to it.
+            return
+        stack = list(deps)
+        seen: set[str] = set()
+        while stack:
+            cell = stack.pop()
+            if cell == name:
+                raise CalcError(f"Circular reference: {name}")
+            if cell not in seen:
+                seen.add(cell)
+                stack.extend(self._deps.get(cell, ()))
+
+    def _mark(self, name: str) -> None:
+        self._dirty.add(name)
+        if not self._batch_depth:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        # Collect the downstream cone of every changed cell.
+        cone: set[str] = set()
+        stack = list(self._dirty)
+        self._dirty.clear()
+        while stack:
+            cell = stack.pop()
+            if cell not in cone:
+                cone.add(cell)
+                stack.extend(self._dependents.get(cell, ()))
+        cone &= self._cells.keys()
+
+        # Kahn's algorithm restricted to the cone.
+        pending = {cell: sum(dep in cone for dep in self._deps[cell]) for cell in cone}
+        ready = [cell for cell, count in pending.items() if not count]
+        self.recomputed = 0
+        while ready:
+            cell = ready.pop()
+            self._values[cell] = self._evaluate(cell)
+            self.recomputed += 1
+            for child in self._dependents.get(cell, ()):
+                if child in pending:
+                    pending[child] -= 1
+                    if not pending[child]:
+                        ready.append(child)
+
+    def _evaluate(self, name: str) -> Any:
+        compiled = self._cells[name]
+        if compiled is None:
+            return self._inputs[name]
+        env: Dict[str, Any] = {}
+        for dep in self._deps[name]:
+            if dep in self._values:
+                value = self._values[dep]
+                if isinstance(value, CalcError):
+                    return CalcError(f"Error in referenced cell: {dep}")
+                env[dep] = value
+        try:
+            return compiled.evaluate(env)
+        except CalcError as e:
+            return e
+
+
+# ---------------------------
+# History
+# ---------------------------
+
+_HISTORY_CAPACITY = 500
+_HISTORY_MAX_BYTES = 1 << 20
+
+
+class HistoryEntry:
+    __slots__ = ("seq", "expr", "result")
+
+    def __init__(self, seq: int, expr: str, result: str):
+        self.seq = seq
+        self.expr = expr
+        self.result = result
+
+    def __repr__(self) -> str:
+        return f"HistoryEntry({self.expr!r} = {self.result!r})"
+
+
+class History:
+    """Bounded calculation history backed by an append-only log.
+
+    Memory holds the newest ``capacity`` entries in a ring buffer, indexed
+    for prefix search (a sorted list) and substring search (trigrams).
+    Every entry is appended to ``path`` as a JSON line; when the log would
+    pass ``max_bytes`` it is rotated to ``path + ".1"``. Nothing is read
+    from disk until the history is first used.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: int = _HISTORY_CAPACITY,
+        max_bytes: int = _HISTORY_MAX_BYTES,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._ring: collections.deque[HistoryEntry] = collections.deque()
+        self._by_seq: Dict[int, HistoryEntry] = {}
+        self._sorted: list[tuple[str, int]] = []
+        self._trigrams: Dict[str, set[int]] = {}
+        self._next_seq = 0
+        self._loaded = path is None
+        self._unloaded: list[tuple[str, str]] = []
+        self._unloaded_on_disk = 0
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        pending, self._unloaded = self._unloaded, []
+        on_disk, self._unloaded_on_disk = self._unloaded_on_disk, 0
+        lines: list[str] = []
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path, "r", encoding="utf-8") as handle:
+                    lines.extend(handle.read().splitlines())
+            except OSError:
+                continue
+        # Entries appended before the load are already at the end of the log.
+        if on_disk:
+            lines = lines[: len(lines) - on_disk]
+        for line in lines[-self.capacity :]:
+            try:
+                expr, result = json.loads(line)
+            except (ValueError, TypeError):
+                continue  # a torn or hand-edited line
+            self._remember(str(expr), str(result))
+        for expr, result in pending:
+            self._remember(expr, result)
+
+    def _remember(self, expr: str, result: str) -> HistoryEntry:
+        entry = HistoryEntry(self._next_seq, expr, result)
+        self._next_seq += 1
+        self._ring.append(entry)
+        self._by_seq[entry.seq] = entry
+        bisect.insort(self._sorted, (expr, entry.seq))
+        for gram in self._grams(expr):
+            self._trigrams.setdefault(gram, set()).add(entry.seq)
+        while len(self._ring) > self.capacity:
+            self._forget(self._ring.popleft())
+        return entry
+
+    def _forget(self, entry: HistoryEntry) -> None:
+        del self._by_seq[entry.seq]
+        del self._sorted[bisect.bisect_left(self._sorted, (entry.expr, entry.seq))]
+        for gram in self._grams(entry.expr):
+            seqs = self._trigrams[gram]
+            seqs.discard(entry.seq)
+            if not seqs:
+                del self._trigrams[gram]
+
+    @staticmethod
+    def _grams(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def append(self, expr: str, result: str) -> None:
+        if self._loaded:
+            self._remember(expr, result)
+        else:
+            self._unloaded.append((expr, result))
+            if len(self._unloaded) > self.capacity:
+                del self._unloaded[0]
+        if self.path is None:
+            return
+        line = json.dumps([expr, result], ensure_ascii=False) + "\n"
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(line)
+            if not self._loaded:
+                self._unloaded_on_disk += 1
+        except OSError:
+            pass  # history is a convenience; never block a calculation on it
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._ring)
+
+    def entries(self) -> list[HistoryEntry]:
+        """Oldest first."""
+        self._ensure_loaded()
+        return list(self._ring)
+
+    def recall(self, back: int = 1) -> Optional[str]:
+        """The stored result ``back`` entries ago (1 = latest), not re-evaluated."""
+        self._ensure_loaded()
+        if not 1 <= back <= len(self._ring):
+            return None
+        return self._ring[-back].result
+
+    def search(self, text: str, prefix: bool = False, limit: int = 50) -> list[HistoryEntry]:
+        """Entries whose expression starts with / contains ``text``, newest first."""
+        self._ensure_loaded()
+        if prefix:
+            start = bisect.bisect_left(self._sorted, (text, -1))
+            seqs = []
+            for expr, seq in itertools.islice(self._sorted, start, None):
+                if not expr.startswith(text):
+                    break
+                seqs.append(seq)
+        elif len(text) >= 3:
+            grams = sorted(self._grams(text), key=lambda g: len(self._trigrams.get(g, ())))
+            candidates = set(self._trigrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates &= self._trigrams.get(gram, set())
+            seqs = [seq for seq in candidates if text in self._by_seq[seq].expr]
+        else:
+            seqs = [entry.seq for entry in self._ring if text in entry.expr]
+        seqs.sort(reverse=True)
+        return [self._by_seq[seq] for seq in seqs[:limit]]
+
+
+def _default_history_path(name: str) -> Optional[str]:
+    path = os.environ.get("CALCULATOR_HISTORY")
+    if path is not None:
+        return path or None  # empty disables persistence
+    return os.path.join(os.path.expanduser("~"), name)
+
+
+# ---------------------------
+# GUI
+# ---------------------------
+
+# Set in the environment by the startup benchmark: print "ready" once the
+# first frame is idle, then quit.
+_STARTUP_PROBE = "CALCULATOR_STARTUP_PROBE"
+
+
+def _load_gui() -> bool:
+    global tk, ttk, _GUI_AVAILABLE
+    if tk is not None:
+        return True
+    if not _GUI_AVAILABLE:
+        return False
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+    except Exception:
+        _GUI_AVAILABLE = False
+        return False
+    _define_gui()
+    return True
+
+
+def _probe_startup(root: Any) -> None:
+    if os.environ.get(_STARTUP_PROBE):
+
+        def ready() -> None:
+            print("ready", flush=True)
+            root.destroy()
+
+        root.after_idle(ready)
+
+
+def _define_gui() -> None:
+    global CalculatorUI, _history_window
+
+    def _history_window(
+        master: tk.Misc, history: History, on_pick: Callable[[str], None]
+    ) -> tk.Toplevel:
+        """Searchable list of past calculations; picking one hands back its result.
+
+        Typing filters by substring; a leading ``^`` matches prefixes instead.
+        """
+        window = tk.Toplevel(master)
+        window.title("History")
+        query = tk.StringVar()
+        entry = ttk.Entry(window, textvariable=query)
+        entry.pack(fill=tk.X, padx=8, pady=8)
+        listbox = tk.Listbox(window, width=40, height=15)
+        listbox.pack(expand=True, fill=tk.BOTH, padx=8, pady=(0, 8))
+        shown: list[HistoryEntry] = []
+
+        def refresh(*_: Any) -> None:
+            text = query.get()
+            if text.startswith("^"):
+                shown[:] = history.search(text[1:], prefix=True)
+            else:
+                shown[:] = history.search(text)
+            listbox.delete(0, tk.END)
+            for item in shown:
+                listbox.insert(tk.END, f"{item.expr} = {item.result}")
+
+        def pick(_: Any = None) -> None:
+            selection = listbox.curselection()
+            index = selection[0] if selection else 0
+            if index < len(shown):
+                on_pick(shown[index].result)
+            window.destroy()
+
+        query.trace_add("write", refresh)
+        entry.bind("<Return>", pick)
+        listbox.bind("<Return>", pick)
+        listbox.bind("<Double-Button-1>", pick)
+        window.bind("<Escape>", lambda _: window.destroy())
+        refresh()
+        entry.focus_set()
+        return window
+
+    class CalculatorUI(ttk.Frame):
+        def __init__(self, master: tk.Tk | tk.Widget):
+            super().__init__(master, padding=12)
+            self.master = master
+            self._make_style()
+            self.pack(expand=True, fill=tk.BOTH)
+            self._create_widgets()
+            self.history = History(_default_history_path(".calculator_history"))
+            self._recall_back = 0
+
+        def _make_style(self) -> None:
+            style = ttk.Style()
+            try:
+                style.theme_use("clam")
+            except Exception:
+                pass
+            style.configure("TButton", font=("Segoe UI", 12), padding=8)
+            style.configure("Display.TEntry", font=("Segoe UI", 18))
+
+        def _create_widgets(self) -> None:
+            self.display_var = tk.StringVar()
+            self.display = ttk.Entry(
+                self,
+                textvariable=self.display_var,
+                justify="right",
+                style="Display.TEntry",
+            )
+            self.display.grid(row=0, column=0, columnspan=4, sticky="nsew", pady=(0, 8))
+
+            # Bind key events to Entry only
+            self.display.bind("<Key>", self._on_keypress)
+            self.display.bind("<Control-h>", self._open_history)
+
+            buttons = [
+                ("C", "C"),
+                ("←", "back"),
+                ("%", "%"),
+                ("÷", "/"),
+                ("7", "7"),
+                ("8", "8"),
+                ("9", "9"),
+                ("×", "*"),
+                ("4", "4"),
+                ("5", "5"),
+                ("6", "6"),
+                ("−", "-"),
+                ("1", "1"),
+                ("2", "2"),
+                ("3", "3"),
+                ("+", "+"),
+                ("±", "neg"),
+                ("0", "0"),
+                (".", "."),
+                ("=", "equal"),
+            ]
+
+            r, c = 1, 0
+            for label, action in buttons:
+                ttk.Button(
+                    self, text=label, command=lambda a=action: self._on_press(a)
+                ).grid(row=r, column=c, sticky="nsew", padx=4, pady=4)
+                c += 1
+                if c > 3:
+                    c = 0
+                    r += 1
+
+            for i in range(6):
+                self.rowconfigure(i, weight=1)
+            for i in range(4):
+                self.columnconfigure(i, weight=1)
+
+        def _open_history(self, _event: Any = None) -> str:
+            _history_window(self, self.history, self._insert_text)
+            return "break"
+
+        # Insert text at cursor position
+        def _insert_text(self, text: str) -> None:
+            pos = int(self.display.index(tk.INSERT))
+            self.display.insert(pos, text)
+
+        # Delete character before cursor
+        def _delete_back(self) -> None:
+            pos = int(self.display.index(tk.INSERT))
+            if pos > 0:
+                self.display.delete(pos - 1, pos)
+
+        def _on_press(self, action: str) -> None:
+            if action == "C":
+                self.display_var.set("")
+                self.display.icursor(tk.END)
+                return
+            if action == "back":
+                self._delete_back()
+                return
+            if action == "neg":
+                text = self.display_var.get()
+                if text.startswith("-"):
+                    self.display_var.set(text[1:])
+                else:
+                    self.display_var.set("-" + text)
+                self.display.icursor(tk.END)
+                return
+            if action == "equal":
+                self._on_equal()
+                return
+            self._insert_text(action)
+
+        def _on_keypress(self, event: tk.Event) -> Optional[str]:
+            key = event.keysym
+            char = event.char
+
+            # Enter evaluates
+            if key in ("Return", "KP_Enter"):
+                self._on_equal()
+                return "break"
+
+            # Escape clears
+            if key == "Escape":
+                self.display_var.set("")
+                return "break"
+
+            # Up/Down step through earlier results without re-evaluating
+            if key in ("Up", "Down"):
+                back = self._recall_back + (1 if key == "Up" else -1)
+                result = self.history.recall(back)
+                if result is not None:
+                    self._recall_back = back
+                    self.display_var.set(result)
+                    self.display.icursor(tk.END)
+                return "break"
+            self._recall_back = 0
+
+            # Allow navigation keys
+            if key in (
+                "Left", "Right",
+                "Home", "End", "Tab",
+                "Shift_L", "Shift_R",
+                "Control_L", "Control_R"
+            ):
+                return None
+
+            # Allow Backspace/Delete default behavior
+            if key in ("BackSpace", "Delete"):
+                return None
+
+            # Only allow calculator characters
+            allowed = "0123456789.+-*/()%"
+            if char in allowed:
+                self._insert_text(char)
+                return "break"
+
+            # Block all other characters
+            return "break"
+
+        def _on_equal(self) -> None:
+            expr = self.display_var.get()
+            try:
+                result = evaluate_expression(expr)
+            except CalcError:
+                self._show_error("Error")
+                return
+            out = str(int(result)) if result.is_integer() else str(result)
+            self.history.append(expr, out)
+            self.display_var.set(out)
+            self.display.icursor(tk.END)
+
+        def _show_error(self, msg: str) -> None:
+            self.display_var.set("Error")
+            self.after(1000, lambda: self.display_var.set(""))
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def _evaluate_lines(
+    lines: list[str], evaluate: Callable[[str], float] = evaluate_expression
+) -> None:
+    if evaluate is evaluate_expression:
+        exprs = [s for s in (line.strip() for line in lines) if s]
+        if len(exprs) > 1 and _estimate_sharing(exprs) >= _CSE_MIN_RATIO:
+            for result in evaluate_batch(exprs):
+                if isinstance(result, CalcError):
+                    print("Error:", result)
+                else:
+                    print(result)
+            return
+
+    for line in lines:
+        s = line.strip()
+        if not s:
+            continue
+        try:
+            print(evaluate(s))
+        except CalcError as e:
+            print("Error:", e)
+
+
+def reduce_lines(
+    lines: Any,
+    reductions: tuple[str, ...] | list[str] = _REDUCTIONS,
+    evaluate: Callable[[str], float] = evaluate_expression,
+) -> Dict[str, float]:
+    """Evaluate each line and reduce the results instead of printing them."""
+    stats = StreamingStats()
+    for line in lines:
+        s = line.strip()
+        if not s:
+            continue
+        try:
+            stats.add(evaluate(s))
+        except CalcError:
+            stats.errors += 1
+    return stats.results(reductions)
+
+
+def cli_repl(
+    non_interactive_fallback: Optional[list[str]] = None,
+    evaluate: Callable[[str], float] = evaluate_expression,
+) -> None:
+    if non_interactive_fallback:
+        _evaluate_lines(non_interactive_fallback, evaluate)
+        return
+
+    try:
+        data = "" if sys.stdin.isatty() else sys.stdin.read()
+    except (OSError, ValueError, AttributeError):
+        data = ""  # stdin closed or missing
+    if data:
+        _evaluate_lines(data.splitlines(), evaluate)
+        return
+
+    if sys.stdin.isatty():
+        print("Calculator CLI. Type 'quit' or 'exit' to leave.")
+        while True:
+            try:
+                expr = input("> ")
+            except (EOFError, KeyboardInterrupt, OSError):
+                print()
+                return
+
+            if expr is None:
+                return
+            if expr.lower().strip() in ("quit", "exit"):
+                return
+
+            expr = expr.strip()
+            if not expr:
+                continue
+
+            try:
+                print(evaluate(expr))
+            except CalcError as e:
+                print("Error:", e)
+        return
+
+    print("No interactive stdin available and no expressions provided.")
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+
+def _best_of(func: Callable[[], Any], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _bench_parallel() -> None:
+    """Find where parallel evaluation starts to beat serial evaluation."""
+    print(f"cpus={os.cpu_count()}  default min_cost={_PARALLEL_MIN_COST:,.0f}")
+    print(f"{'exponent':>10} {'est. cost':>14} {'serial':>10} {'thread':>10} {'process':>10}")
+    for kind in ("thread", "process"):
+        # Exclude pool start-up from the timings.
+        _get_pool(kind).submit(int).result()
+
+    crossover: Optional[float] = None
+    for exponent in (1_000, 10_000, 50_000, 100_000, 300_000, 1_000_000):
+        expr = " + ".join(f"({b}**{exponent} % 1000003)" for b in (3, 5, 7, 11))
+        cost = _estimate_cost(_parse_expression(expr))
+        serial = _best_of(lambda: evaluate_expression(expr))
+        thread = _best_of(lambda: evaluate_parallel(expr, executor="thread", min_cost=0))
+        process = _best_of(lambda: evaluate_parallel(expr, executor="process", min_cost=0))
+        print(
+            f"{exponent:>10,} {cost:>14,.0f} {serial * 1e3:>8.2f}ms "
+            f"{thread * 1e3:>8.2f}ms {process * 1e3:>8.2f}ms"
+        )
+        if crossover is None and min(thread, process) < 0.9 * serial:
+            crossover = cost / 4
+
+    if crossover is None:
+        print("parallel evaluation never paid off on this machine")
+    else:
+        print(f"crossover: ~{crossover:,.0f} cost units per subterm")
+
+
+def _bench_sweep() -> None:
+    """Compare a per-point evaluate_expression loop with evaluate_range."""
+    expr = "sin(x) * x**2 + sqrt(abs(x)) / (1 + x)"
+    loop_points = 10_000
+    sweep_points = 1_000_000 if _NUMPY_AVAILABLE else 100_000
+
+    def loop() -> None:
+        step = 10.0 / (loop_points - 1)
+        for i in range(loop_points):
+            evaluate_expression(expr.replace("x", f"({i * step!r})"))
+
+    per_point = _best_of(loop, repeat=1) / loop_points
+    sweep = _best_of(lambda: evaluate_range(expr, 0.0, 10.0, sweep_points))
+    backend = "numpy" if _NUMPY_AVAILABLE else "pure python"
+    print(f"string-substitution loop: {per_point * 1e6:8.2f}us/point")
+    print(f"evaluate_range ({backend}): {sweep / sweep_points * 1e6:8.2f}us/point")
+    print(
+        f"{sweep_points:,} points: loop ~{per_point * sweep_points:.2f}s, "
+        f"sweep {sweep * 1e3:.1f}ms"
+    )
+
+
+def _bench_binary() -> None:
+    """Compare text batch evaluation with the binary column path."""
+    import io
+    import random
+
+    expr = "sqrt(x*x + y*y) / (1 + x)"
+    rows = 1_000_000 if _NUMPY_AVAILABLE else 100_000
+    text_rows = 20_000
+    xs = array("d", (random.uniform(-10, 10) for _ in range(rows)))
+    ys = array("d", (random.uniform(-10, 10) for _ in range(rows)))
+    lines = [f"sqrt({x!r}*{x!r} + {y!r}*{y!r}) / (1 + {x!r})" for x, y in zip(xs[:text_rows], ys)]
+
+    def text() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _evaluate_lines(lines)
+
+    def binary() -> None:
+        results, errors = evaluate_columns(expr, {"x": xs, "y": ys})
+        sink = io.BytesIO()
+        _write_float64(sink, results)
+        sink.write(errors)
+
+    text_time = _best_of(text, repeat=1) / text_rows
+    binary_time = _best_of(binary) / rows
+    backend = "numpy" if _NUMPY_AVAILABLE else "pure python"
+    mb_per_row = 3 * 8 / 1e6  # two input columns and one output column
+    print(f"text lines:           {text_time * 1e6:8.3f}us/row")
+    print(
+        f"binary ({backend}): {binary_time * 1e6:8.3f}us/row "
+        f"({mb_per_row / binary_time:,.0f} MB/s of column data)"
+    )
+
+
+def _bench_async() -> None:
+    """Measure event-loop latency while a batch is evaluated."""
+    exprs = [f"({b}**30000 % 1000003) + sqrt({b})" for b in range(2, 402)]
+
+    async def ticker(lags: list[float], stop: asyncio.Event) -> None:
+        interval = 0.005
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def measure(label: str, work: Callable[[], Any]) -> None:
+        lags: list[float] = []
+        stop = asyncio.Event()
+        tick = asyncio.create_task(ticker(lags, stop))
+        await asyncio.sleep(0.02)
+        start = time.perf_counter()
+        await work()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await tick
+        lags.sort()
+        p50 = lags[len(lags) // 2] if lags else 0.0
+        p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+        worst = lags[-1] if lags else 0.0
+        print(
+            f"{label:<16} batch {elapsed * 1e3:8.1f}ms  loop lag p50 {p50 * 1e3:6.2f}ms "
+            f"p99 {p99 * 1e3:6.2f}ms max {worst * 1e3:7.2f}ms"
+        )
+
+    async def run() -> None:
+        async def blocking() -> None:
+            for expr in exprs:
+                evaluate_expression(expr)
+
+        async with AsyncEvaluator(chunk_size=16) as evaluator:
+            await evaluator.evaluate("0")  # start a worker outside the timing
+            await measure("synchronous", blocking)
+            await measure("evaluate_many", lambda: evaluator.evaluate_many(exprs))
+
+    asyncio.run(run())
+
+
+def _bench_workspace() -> None:
+    """Time a single input change in a 100k-cell workspace."""
+    chains, length = 1_000, 100
+    ws = Workspace()
+    cells: Dict[str, float | str] = {f"in{k}": float(k) for k in range(chains)}
+    for k in range(chains):
+        previous = f"in{k}"
+        for j in range(length):
+            cells[f"c{k}_{j}"] = f"{previous} * 1.01 + in{k}"
+            previous = f"c{k}_{j}"
+
+    start = time.perf_counter()
+    ws.update(cells)
+    build = time.perf_counter() - start
+    print(f"built {len(ws):,} cells in {build:.2f}s ({ws.recomputed:,} evaluated)")
+
+    start = time.perf_counter()
+    with ws.batch():
+        ws._dirty.update(ws._cells)
+    full = time.perf_counter() - start
+    print(f"full recompute: {full * 1e3:.2f}ms, {ws.recomputed:,} cells recomputed")
+
+    start = time.perf_counter()
+    ws.set("in5", 42.0)
+    change = time.perf_counter() - start
+    print(f"one input change: {change * 1e3:.2f}ms, {ws.recomputed} cells recomputed")
+
+    start = time.perf_counter()
+    with ws.batch():
+        for k in range(10):
+            ws.set(f"in{k}", k + 0.5)
+            ws.set(f"in{k}", k + 1.5)
+    coalesced = time.perf_counter() - start
+    print(f"20 coalesced changes: {coalesced * 1e3:.2f}ms, {ws.recomputed} cells recomputed")
+
+
+def _bench_cse() -> None:
+    """Compare per-line evaluation with shared-subtree batch evaluation."""
+    norm = "sqrt(" + " + ".join(f"{k}**2" for k in range(1, 60)) + ")"
+    scale = "log10(" + " * ".join(str(k) for k in range(2, 40)) + ")"
+    # Stay within the compile cache so parsing is excluded from both timings.
+    exprs = [f"({i % 97} * {norm} + {i} % 13) / {scale}" for i in range(1_000)]
+    for expr in exprs:
+        compile_expression(expr)
+
+    plan = BatchPlan(exprs[:_CSE_CHUNK])
+    serial = _best_of(lambda: [evaluate_expression(e) for e in exprs], repeat=3)
+    shared = _best_of(lambda: evaluate_batch(exprs), repeat=3)
+    print(
+        f"{len(exprs):,} lines, {plan.total_nodes:,} nodes per chunk, "
+        f"{plan.unique_nodes:,} unique (dedup ratio {plan.dedup_ratio:.1f})"
+    )
+    print(f"per line: {serial * 1e3:.1f}ms  shared: {shared * 1e3:.1f}ms  speedup {serial / shared:.1f}x")
+
+
+def _bench_shared() -> None:
+    """Scale block evaluation across cores and compare peak memory."""
+    import tracemalloc
+
+    if not _NUMPY_AVAILABLE:
+        print("NumPy is required for this benchmark")
+        return
+    rows = int(os.environ.get("CALC_BENCH_ROWS", 10_000_000))
+    expr = "sqrt(x*x + y*y) * sin(x) + log10(abs(y) + 1)"
+    rng = np.random.default_rng(0)
+    with SharedColumn.from_values(rng.uniform(-1e3, 1e3, rows)) as x, SharedColumn.from_values(
+        rng.uniform(-1e3, 1e3, rows)
+    ) as y, SharedColumn.create(rows) as out:
+        compiled = compile_expression(expr)
+        env = {"x": x.array, "y": y.array}
+        columns = {"x": x, "y": y}
+
+        tracemalloc.start()
+        naive = _best_of(lambda: compiled.evaluate_vectorized(env), repeat=1)
+        naive_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        evaluate_shared(compiled, columns, out, workers=1)
+        blocked_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        mb = rows * 8 / 1e6
+        print(f"{rows:,} rows, expression: {expr}")
+        print(f"naive vectorized: {naive * 1e3:8.1f}ms  peak extra memory {naive_peak / 1e6:8.1f}MB")
+        print(f"blocked, 1 core:                 peak extra memory {blocked_peak / 1e6:8.1f}MB")
+        for workers in range(1, (os.cpu_count() or 1) + 1):
+            elapsed = _best_of(lambda: evaluate_shared(compiled, columns, out, workers=workers), repeat=3)
+            print(
+                f"blocked, {workers} worker(s): {elapsed * 1e3:8.1f}ms "
+                f"({3 * mb / elapsed:,.0f} MB/s, {naive / elapsed:.2f}x naive)"
+            )
+
+
+def _bench_inline() -> None:
+    """Compare inlined user-function calls with textual expansion."""
+    body = "sqrt(a**2 + b**2)"
+    define_function(f"hyp(a, b) = {body}")
+    try:
+        calls = [f"hyp({i}, {i + 1}) * hyp({i}, 2)" for i in range(1_000)]
+        pasted = [
+            "(" + body.replace("a", str(i)).replace("b", str(i + 1)) + ") * ("
+            + body.replace("a", str(i)).replace("b", "2") + ")"
+            for i in range(1_000)
+        ]
+
+        def run(exprs: list[str]) -> None:
+            compile_expression.cache_clear()
+            for expr in exprs:
+                evaluate_expression(expr)
+
+        inlined = _best_of(lambda: run(calls))
+        textual = _best_of(lambda: run(pasted))
+        print(f"compile+evaluate 1,000 lines: inlined {inlined * 1e3:.1f}ms, textual {textual * 1e3:.1f}ms")
+
+        compiled = compile_expression("hyp(3, 4) * x")
+        print(f"hyp(3, 4) * x compiles to: {ast.unparse(compiled.tree)}")
+        if _NUMPY_AVAILABLE:
+            sweep_inlined = _best_of(lambda: evaluate_range("hyp(x, 3) * 2", 0, 1, 1_000_000))
+            sweep_textual = _best_of(lambda: evaluate_range("sqrt(x**2 + 3**2) * 2", 0, 1, 1_000_000))
+            print(
+                f"1M-point sweep: inlined {sweep_inlined * 1e3:.1f}ms, "
+                f"textual {sweep_textual * 1e3:.1f}ms"
+            )
+    finally:
+        undefine_function("hyp")
+
+
+def _bench_reduce() -> None:
+    """Compare --reduce with printing results and re-parsing them downstream."""
+    import io
+    import random
+
+    lines = [f"sqrt({random.uniform(0, 1e3)!r}) * {random.uniform(-5, 5)!r}" for _ in range(20_000)]
+
+    def piped() -> None:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            _evaluate_lines(lines)
+        values = sorted(float(v) for v in out.getvalue().split())
+        sum(values), values[int(0.99 * (len(values) - 1))]
+
+    pipe_time = _best_of(piped, repeat=3)
+    reduce_time = _best_of(lambda: reduce_lines(lines, ("sum", "p99")), repeat=3)
+    print(f"20,000 lines: print + re-parse {pipe_time * 1e3:.1f}ms, --reduce {reduce_time * 1e3:.1f}ms")
+
+    rows = 1_000_000 if _NUMPY_AVAILABLE else 100_000
+    xs = array("d", (random.uniform(-10, 10) for _ in range(rows)))
+    expr = "x*x*x + sin(x)"
+    elapsed = _best_of(lambda: reduce_expression(expr, {"x": xs}, ("mean", "p50", "p99")), repeat=3)
+    parallel = _best_of(
+        lambda: reduce_expression(expr, {"x": xs}, ("mean", "p50", "p99"), parallel=True), repeat=3
+    )
+    approx = reduce_expression(expr, {"x": xs}, ("p50", "p99"))
+    exact = sorted(_eval_node(compile_expression(expr).tree, {"x": x}) for x in xs)
+    print(f"{rows:,} rows: {elapsed * 1e3:.1f}ms serial, {parallel * 1e3:.1f}ms on the thread pool")
+    for name, q in (("p50", 0.5), ("p99", 0.99)):
+        true = exact[int(q * (rows - 1))]
+        print(f"  {name}: sketch {approx[name]:.4f}, exact {true:.4f}")
+
+
+def _bench_grad() -> None:
+    """Compare value_and_grad with central finite differences."""
+    import random
+
+    expr = "x*x*x + sin(x)"
+    compiled = compile_expression(expr)
+    h = 1e-6
+
+    def exact(x: float) -> float:
+        return 3 * x * x + math.cos(x)
+
+    def reparsed(x: float) -> float:
+        # What the optimisation loops do today: substitute the point into
+        # the text and evaluate twice.
+        up = evaluate_expression(f"({x + h!r})**3 + sin({x + h!r})")
+        down = evaluate_expression(f"({x - h!r})**3 + sin({x - h!r})")
+        return (up - down) / (2 * h)
+
+    points = [random.uniform(-10, 10) for _ in range(20_000)]
+    fd = _best_of(lambda: [reparsed(x) for x in points[:2_000]], repeat=1)
+    fd_env = _best_of(
+        lambda: [(compiled.evaluate({"x": x + h}) - compiled.evaluate({"x": x - h})) / (2 * h) for x in points],
+        repeat=3,
+    )
+    scalar = {
+        mode: _best_of(lambda: [value_and_grad(compiled, {"x": x}, mode=mode) for x in points], repeat=3)
+        for mode in ("forward", "reverse")
+    }
+    scale = 1_000_000 / len(points)
+    print(f"1,000,000 points, scalar (extrapolated from {len(points):,}):")
+    print(f"  finite differences, re-parsing   {fd * 500:8.2f}s")
+    print(f"  finite differences, compiled     {fd_env * scale:8.2f}s")
+    for mode, elapsed in scalar.items():
+        print(f"  {mode + ' mode':<32} {elapsed * scale:8.2f}s")
+    fd_error = max(
+        abs((compiled.evaluate({"x": x + h}) - compiled.evaluate({"x": x - h})) / (2 * h) - exact(x))
+        for x in points
+    )
+    ad_error = max(abs(value_and_grad(compiled, {"x": x})[1]["x"] - exact(x)) for x in points)
+    print(f"  max abs error: finite differences {fd_error:.2e}, autodiff {ad_error:.2e}")
+
+    if not _NUMPY_AVAILABLE:
+        print("NumPy not installed; skipping the vectorized comparison")
+        return
+    xs = np.random.uniform(-10, 10, 1_000_000)
+    fd_vec = _best_of(
+        lambda: (compiled.evaluate_vectorized({"x": xs + h}) - compiled.evaluate_vectorized({"x": xs - h}))
+        / (2 * h),
+        repeat=3,
+    )
+    print("1,000,000 points, NumPy arrays:")
+    print(f"  finite differences               {fd_vec * 1e3:8.1f}ms")
+    for mode in ("forward", "reverse"):
+        elapsed = _best_of(lambda: value_and_grad(compiled, {"x": xs}, mode=mode), repeat=3)
+        print(f"  {mode + ' mode':<32} {elapsed * 1e3:8.1f}ms")
+
+
+def _bench_solve() -> None:
+    """Hand-written bisection over evaluate_expression vs solve / solve_many."""
+    import random
+
+    def handwritten(c: float) -> float:
+        # Substitutes the point into the text, so every step re-parses
+        def f(x: float) -> float:
+            return evaluate_expression(f"({x!r})**3 - 2*({x!r}) - {c!r}")
+
+        a, b = 0.0, 10.0
+        fa = f(a)
+        while b - a > 2e-12:
+            m = (a + b) / 2
+            fm = f(m)
+            if (fm > 0) == (fa > 0):
+                a, fa = m, fm
+            else:
+                b = m
+        return (a + b) / 2
+
+    expr = "x**3 - 2*x - c"
+    cs = [random.uniform(1, 100) for _ in range(500)]
+    base = _best_of(lambda: [handwritten(c) for c in cs], repeat=1)
+    print(f"{len(cs)} problems, x**3 - 2*x - c on [0, 10]:")
+    print(f"  hand-written bisection    {len(cs) / base:12,.0f} problems/s")
+    for method in ("bisect", "brent"):
+        elapsed = _best_of(lambda: [solve(expr, bracket=(0, 10), method=method, env={"c": c}) for c in cs], repeat=3)
+        print(f"  solve({method})           {len(cs) / elapsed:12,.0f} problems/s")
+    elapsed = _best_of(lambda: [solve(expr, x0=5.0, env={"c": c}) for c in cs], repeat=3)
+    print(f"  solve(newton)           {len(cs) / elapsed:12,.0f} problems/s")
+
+    if not _NUMPY_AVAILABLE:
+        print("NumPy not installed; solve_many falls back to solve")
+        return
+    n = 100_000
+    many = np.random.uniform(1, 100, n)
+    lo, hi = np.zeros(n), np.full(n, 10.0)
+    print(f"{n:,} problems with solve_many:")
+    for method in ("bisect", "brent", "newton"):
+        kwargs: Dict[str, Any] = {"x0": np.full(n, 5.0)} if method == "newton" else {"bracket": (lo, hi)}
+        result = solve_many(expr, method=method, env={"c": many}, **kwargs)
+        elapsed = _best_of(lambda: solve_many(expr, method=method, env={"c": many}, **kwargs), repeat=3)
+        print(
+            f"  {method:<8} {n / elapsed:12,.0f} problems/s, "
+            f"{result.iterations.mean():.1f} iterations on average, "
+            f"{int(result.converged.sum()):,} converged"
+        )
+
+
+def _bench_jit() -> None:
+    """Fused numba kernel vs NumPy's one-array-per-operation evaluation."""
+    if not (_NUMPY_AVAILABLE and _NUMBA_AVAILABLE):
+        print("NumPy and numba are required for this benchmark")
+        return
+    rows = 10_000_000
+    rng = np.random.default_rng(46)
+    env = {"x": rng.uniform(0.1, 10, rows), "y": rng.uniform(-5, 5, rows)}
+    expr = "x*x*x + sin(x)*y - sqrt(abs(y)) / (1 + x % 3)"
+    compiled = compile_expression(expr)
+    start = time.perf_counter()
+    evaluate_jit(compiled, {name: column[:10] for name, column in env.items()})
+    print(f"first call (lower, load, numba compile or cache hit): {(time.perf_counter() - start) * 1e3:.0f}ms")
+    vectorized = _best_of(lambda: compiled.evaluate_vectorized(env), repeat=3)
+    fused = _best_of(lambda: evaluate_jit(compiled, env), repeat=3)
+    same = np.array_equal(evaluate_jit(compiled, env), compiled.evaluate_vectorized(env))
+    print(
+        f"{rows:,} rows: NumPy {vectorized * 1e3:.0f}ms, fused kernel {fused * 1e3:.0f}ms "
+        f"({vectorized / fused:.1f}x), results identical: {same}"
+    )
+
+
+@contextlib.contextmanager
+def _display() -> Iterator[Dict[str, str]]:
+    """Environment with a usable X display, starting Xvfb if there is none."""
+    import shutil
+    import subprocess
+
+    env = dict(os.environ)
+    if env.get("DISPLAY"):
+        yield env
+        return
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        raise RuntimeError("no DISPLAY and Xvfb is not installed")
+    number = next(n for n in range(99, 200) if not os.path.exists(f"/tmp/.X11-unix/X{n}"))
+    server = subprocess.Popen(
+        [xvfb, f":{number}", "-screen", "0", "1024x768x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Xvfb did not start")
+            time.sleep(0.05)
+        env["DISPLAY"] = f":{number}"
+        yield env
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _time_to_first_frame(script: str, env: Dict[str, str]) -> float:
+    """Seconds from spawning *script* until its GUI reports the first idle frame."""
+    import subprocess
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, script], env=env, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True
+    )
+    assert proc.stdout is not None
+    for line in proc.stdout:
+        if line.strip() == "ready":
+            elapsed = time.perf_counter() - start
+            break
+    else:
+        proc.wait()
+        raise RuntimeError(f"{script} exited before its first frame")
+    proc.wait()
+    return elapsed
+
+
+def _bench_startup(runs: int = 15) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    scripts = {
+        "calculator": os.path.abspath(__file__),
+        "modern-calculator": os.path.join(here, "modern-calculator", "calculator.py"),
+    }
+    with contextlib.ExitStack() as stack:
+        try:
+            env = stack.enter_context(_display())
+        except RuntimeError as e:
+            print(f"startup benchmark needs a display: {e}")
+            return
+        home = stack.enter_context(tempfile.TemporaryDirectory())
+        env.update(HOME=home, CALCULATOR_HISTORY="", **{_STARTUP_PROBE: "1"})
+        for name, script in scripts.items():
+            _time_to_first_frame(script, env)  # warm the OS page cache
+            times = sorted(_time_to_first_frame(script, env) for _ in range(runs))
+            print(
+                f"{name}: first frame median {times[runs // 2] * 1e3:.1f}ms, "
+                f"min {times[0] * 1e3:.1f}ms over {runs} runs"
+            )
+
+
+_BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "startup": _bench_startup,
+    "grad": _bench_grad,
+    "solve": _bench_solve,
+    "jit": _bench_jit,
+    "reduce": _bench_reduce,
+    "inline": _bench_inline,
+    "shared": _bench_shared,
+    "cse": _bench_cse,
+    "workspace": _bench_workspace,
+    "async": _bench_async,
+    "binary": _bench_binary,
+    "parallel": _bench_parallel,
+    "sweep": _bench_sweep,
+}
+
+
+# ---------------------------
+# Tests
+# ---------------------------
+
+import unittest
+
+
+class TestEvaluateExpression(unittest.TestCase):
+    def test_simple_add(self):
+        self.assertEqual(evaluate_expression("2+3"), 5.0)
+
+    def test_precedence(self):
+        self.assertEqual(evaluate_expression("2+3*4"), 14.0)
+
+    def test_parentheses(self):
+        self.assertEqual(evaluate_expression("(2+3)*4"), 20.0)
+
+    def test_functions(self):
+        self.assertEqual(evaluate_expression("sqrt(25)"), 5.0)
+
+    def test_pow_operator_and_func(self):
+        self.assertEqual(evaluate_expression("2**3"), 8.0)
+        self.assertEqual(evaluate_expression("pow(2,3)"), 8.0)
+
+    def test_pi_constant(self):
+        self.assertAlmostEqual(evaluate_expression("pi"), math.pi)
+
+    def test_unary_minus(self):
+        self.assertEqual(evaluate_expression("-5 + 2"), -3.0)
+
+    def test_invalid_syntax(self):
+        with self.assertRaises(CalcError):
+            evaluate_expression("2+*3")
+
+    def test_disallowed_name(self):
+        with self.assertRaises(CalcError):
+            evaluate_expression('__import__("os")')
+
+    def test_empty(self):
+        with self.assertRaises(CalcError):
+            evaluate_expression("")
+
+    def test_modulo(self):
+        self.assertEqual(evaluate_expression("10 % 3"), 1.0)
+
+    def test_log10(self):
+        self.assertAlmostEqual(evaluate_expression("log10(100)"), 2.0)
+
+    def test_sin_zero(self):
+        self.assertAlmostEqual(evaluate_expression("sin(0)"), 0.0)
+
+    def test_abs(self):
+        self.assertEqual(evaluate_expression("abs(-7)"), 7.0)
+
+
+class TestParallelEvaluation(unittest.TestCase):
+    def test_matches_serial(self):
+        expr = "(3**2000 % 7) + (5**2000 % 11) * sqrt(16)"
+        self.assertEqual(evaluate_parallel(expr, min_cost=0), evaluate_expression(expr))
+
+    def test_process_pool(self):
+        expr = "(3**5000 % 1000003) - (7**5000 % 1000003)"
+        self.assertEqual(
+            evaluate_parallel(expr, executor="process", min_cost=0),
+            evaluate_expression(expr),
+        )
+
+    def test_first_error_wins(self):
+        with self.assertRaisesRegex(CalcError, "division by zero"):
+            evaluate_parallel("(1/0) + sqrt(-1)", min_cost=0)
+
+    def test_cost_grows_with_exponent(self):
+        small = _estimate_cost(_parse_expression("3**100"))
+        large = _estimate_cost(_parse_expression("3**100000"))
+        self.assertGreater(large, small * 1000)
+
+    def test_cheap_expression_stays_serial(self):
+        costs: Dict[int, float] = {}
+        parsed = _parse_expression("1 + 2 * 3")
+        _estimate(parsed, costs)
+        self.assertEqual(_heavy_frontier(parsed, costs, _PARALLEL_MIN_COST), [])
+
+
+class TestSweeps(unittest.TestCase):
+    def test_compiled_expression_is_cached(self):
+        self.assertIs(compile_expression("x*2"), compile_expression("x*2"))
+        self.assertEqual(compile_expression("sin(x) + y*pi").variables, {"x", "y"})
+
+    def test_compiled_evaluate_with_env(self):
+        self.assertEqual(compile_expression("x**2 + 1").evaluate({"x": 3}), 10.0)
+
+    def test_range_values(self):
+        xs, ys = evaluate_range("x*x", 0, 4, 5)
+        self.assertEqual(list(xs), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(list(ys), [0.0, 1.0, 4.0, 9.0, 16.0])
+
+    def test_range_domain_errors_are_nan(self):
+        _, ys = evaluate_range("sqrt(x)", -1, 1, 3)
+        self.assertTrue(math.isnan(ys[0]))
+        self.assertEqual(ys[2], 1.0)
+
+    def test_range_matches_numpy_at_poles_and_complex_results(self):
+        _, ys = evaluate_range("x**0.5", -1, 1, 3)
+        self.assertTrue(math.isnan(ys[0]))
+        self.assertEqual(list(ys[1:]), [0.0, 1.0])
+        _, ys = evaluate_range("1/x", -1, 1, 3)
+        self.assertEqual(list(ys), [-1.0, math.inf, 1.0])
+        _, ys = evaluate_range("log10(x)", 0, 1, 2)
+        self.assertEqual(list(ys), [-math.inf, 0.0])
+
+    def test_point_value_rules(self):
+        cases = {"1/x": [math.inf, -math.inf], "-1/x": [-math.inf, math.inf], "x/x": [math.nan] * 2,
+                 "3 % x": [math.nan] * 2, "x**-1": [math.inf, -math.inf], "sqrt(x-1)": [math.nan] * 2}
+        for expr, expected in cases.items():
+            tree = compile_expression(expr).tree
+            got = [_point_value(tree, {"x": x}) for x in (0.0, -0.0)]
+            self.assertEqual([str(v) for v in got], [str(v) for v in expected], expr)
+
+    def test_range_constant_expression(self):
+        _, ys = evaluate_range("2+3", 0, 1, 3)
+        self.assertEqual(list(ys), [5.0, 5.0, 5.0])
+
+    def test_range_unknown_variable(self):
+        with self.assertRaises(CalcError):
+            evaluate_range("x + y", 0, 1, 3)
+
+    def test_grid_values(self):
+        _, values = evaluate_grid("x + 10*y", {"x": (0, 1, 2), "y": (0, 2, 3)})
+        flat = [float(v) for v in (values.ravel() if _NUMPY_AVAILABLE else values)]
+        self.assertEqual(flat, [0.0, 10.0, 20.0, 1.0, 11.0, 21.0])
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.addCleanup(disable_disk_cache)
+
+    def test_tree_round_trip(self):
+        tree = _parse_expression("-sqrt(x**2 + 1) % 3 / log(2, 10)")
+        rebuilt = _tree_from_data(json.loads(json.dumps(_tree_to_data(tree))))
+        self.assertEqual(ast.dump(rebuilt), ast.dump(tree))
+
+    def test_rejects_unknown_nodes(self):
+        with self.assertRaises(ValueError):
+            _tree_from_data(["attr", "x", "__class__"])
+
+    def test_hit_across_instances(self):
+        first = _DiskCache(self._tmp.name)
+        first.store("1+2", _parse_expression("1+2"), 0.001)
+        second = _DiskCache(self._tmp.name)
+        tree = second.load("1+2")
+        self.assertIsNotNone(tree)
+        self.assertEqual(_eval_node(tree), 3)
+        self.assertEqual(second.hits, 1)
+        self.assertIsNone(second.load("1+3"))
+        self.assertEqual(second.misses, 1)
+
+    def test_versioned_directory(self):
+        cache = _DiskCache(self._tmp.name)
+        self.assertTrue(cache.directory.endswith(f"v{_EVALUATOR_VERSION}"))
+
+    def test_corrupt_entry_is_a_miss(self):
+        cache = _DiskCache(self._tmp.name)
+        cache.store("2*3", _parse_expression("2*3"), 0.0)
+        with open(cache._path(cache._key("2*3")), "w") as handle:
+            handle.write("{not json")
+        self.assertIsNone(cache.load("2*3"))
+
+    def test_entry_without_timing_is_a_miss(self):
+        cache = _DiskCache(self._tmp.name)
+        path = cache._path(cache._key("2*3"))
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as handle:
+            json.dump({"source": "2*3", "tree": _tree_to_data(_parse_expression("2*3"))}, handle)
+        self.assertIsNone(cache.load("2*3"))
+        self.assertEqual(cache.misses, 1)
+
+    def test_unusable_directory_leaves_cache_off(self):
+        blocker = os.path.join(self._tmp.name, "file")
+        open(blocker, "w").close()
+        self.assertFalse(enable_disk_cache(blocker))
+        self.assertIsNone(_DISK_CACHE)
+        self.assertEqual(evaluate_expression("6*7"), 42.0)
+
+    def test_lru_eviction(self):
+        cache = _DiskCache(self._tmp.name, max_bytes=250)
+        for i in range(10):
+            source = f"{i} + {i}"
+            cache.store(source, _parse_expression(source), 0.0)
+            cache.flush()
+        with open(os.path.join(cache.directory, "index.json")) as handle:
+            index = json.load(handle)
+        self.assertLessEqual(sum(size for size, _ in index.values()), 250)
+        self.assertIsNotNone(cache.load("9 + 9"))
+        self.assertIsNone(cache.load("0 + 0"))
+
+    def test_compile_expression_uses_cache(self):
+        enable_disk_cache(self._tmp.name)
+        self.assertEqual(evaluate_expression("6*7"), 42.0)
+        self.assertEqual(_DISK_CACHE.writes, 1)
+        compile_expression.cache_clear()
+        self.assertEqual(evaluate_expression("6*7"), 42.0)
+        self.assertEqual(_DISK_CACHE.hits, 1)
+
+
+class TestBinaryColumns(unittest.TestCase):
+    @staticmethod
+    def _pack(values: list[float]) -> bytes:
+        column = array("d", values)
+        if not _LITTLE_ENDIAN:
+            column.byteswap()
+        return column.tobytes()
+
+    def test_values_and_error_bitmap(self):
+        columns = {"x": self._pack([4.0, -1.0, 0.0, 9.0]), "y": self._pack([1, 1, 0, 1])}
+        results, errors = evaluate_columns("sqrt(x) / y", columns)
+        self.assertEqual(float(results[0]), 2.0)
+        self.assertEqual(float(results[3]), 3.0)
+        self.assertEqual(errors, bytearray([0b0110]))
+
+    def test_complex_results_are_nan(self):
+        results, errors = evaluate_columns("x**0.5", {"x": self._pack([-1.0, 4.0])})
+        self.assertTrue(math.isnan(results[0]))
+        self.assertEqual(float(results[1]), 2.0)
+        self.assertEqual(errors, bytearray([0b01]))
+
+    def test_length_mismatch(self):
+        with self.assertRaises(CalcError):
+            evaluate_columns("x + y", {"x": self._pack([1, 2]), "y": self._pack([1])})
+
+    def test_unknown_variable(self):
+        with self.assertRaises(CalcError):
+            evaluate_columns("x + z", {"x": self._pack([1])})
+
+    def test_cli_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            x_path = os.path.join(tmp, "x.f64")
+            out_path = os.path.join(tmp, "out.f64")
+            with open(x_path, "wb") as handle:
+                handle.write(self._pack([1.0, 2.0, 3.0]))
+            self.assertEqual(main(["--binary", "x*10", "--var", f"x={x_path}", "--out", out_path]), 0)
+            with open(out_path, "rb") as handle:
+                data = handle.read()
+        results = list(_as_float64(data[:24]))
+        self.assertEqual(results, [10.0, 20.0, 30.0])
+        self.assertEqual(data[24:], bytes([0]))
+
+
+class TestAsyncEvaluation(unittest.TestCase):
+    def test_aevaluate(self):
+        self.assertEqual(asyncio.run(aevaluate("2**10")), 1024.0)
+
+    def test_error_propagates(self):
+        with self.assertRaises(CalcError):
+            asyncio.run(aevaluate("1/0"))
+
+    def test_default_evaluator_closed_with_loop(self):
+        before = set(multiprocessing.active_children())
+        for _ in range(3):
+            self.assertEqual(asyncio.run(aevaluate("1+1")), 2.0)
+        self.assertEqual(set(multiprocessing.active_children()) - before, set())
+        self.assertEqual(len(_ASYNC_EVALUATORS), 0)
+
+    def test_timeout_kills_runaway_work(self):
+        async def run() -> None:
+            async with AsyncEvaluator(workers=1) as evaluator:
+                with self.assertRaisesRegex(CalcError, "timed out"):
+                    await evaluator.evaluate("9**9**9", timeout=0.2)
+                self.assertEqual(await evaluator.evaluate("1+1"), 2.0)
+
+        asyncio.run(run())
+
+    def test_user_functions_reach_workers(self):
+        async def run() -> list[Any]:
+            async with AsyncEvaluator(workers=1) as evaluator:
+                await evaluator.evaluate("1+1")  # worker started before the definition
+                define_function("sq(a) = a*a")
+                return [await evaluator.evaluate("sq(3)"), *await evaluator.evaluate_many(["sq(4)", "sq("])]
+
+        self.addCleanup(clear_functions)
+        results = asyncio.run(run())
+        self.assertEqual(results[:2], [9.0, 16.0])
+        self.assertIsInstance(results[2], CalcError)
+
+    def test_evaluate_many_keeps_order(self):
+        async def run() -> list[Any]:
+            async with AsyncEvaluator(workers=2, chunk_size=3) as evaluator:
+                exprs = (f"{i}*2" if i != 4 else "sqrt(-1)" for i in range(10))
+                return await evaluator.evaluate_many(exprs)
+
+        results = asyncio.run(run())
+        self.assertEqual(results[:4], [0.0, 2.0, 4.0, 6.0])
+        self.assertIsInstance(results[4], CalcError)
+        self.assertEqual(results[9], 18.0)
+
+    def test_evaluate_many_timeout_per_item(self):
+        async def run() -> list[Any]:
+            async with AsyncEvaluator(workers=1) as evaluator:
+                return await evaluator.evaluate_many(["1", "9**9**9", "3"], timeout=0.2)
+
+        results = asyncio.run(run())
+        self.assertEqual(results[0], 1.0)
+        self.assertIsInstance(results[1], CalcError)
+        self.assertEqual(results[2], 3.0)
+
+
+class TestWorkspace(unittest.TestCase):
+    def test_dependencies(self):
+        ws = Workspace()
+        ws.update({"rate": 0.2, "base": 100, "tax": "rate*base", "net": "base - tax"})
+        self.assertEqual(ws["tax"], 20.0)
+        self.assertEqual(ws["net"], 80.0)
+        ws["base"] = 200
+        self.assertEqual(ws["net"], 160.0)
+
+    def test_only_affected_cone_recomputed(self):
+        ws = Workspace()
+        ws.update({"a": 1, "b": 2, "a2": "a*2", "b2": "b*2", "a4": "a2*2"})
+        ws["a"] = 5
+        self.assertEqual(ws.recomputed, 3)
+        self.assertEqual(ws["a4"], 20.0)
+        self.assertEqual(ws["b2"], 4.0)
+
+    def test_cycle_rejected(self):
+        ws = Workspace()
+        ws.update({"a": "b + 1", "b": 1})
+        with self.assertRaisesRegex(CalcError, "Circular"):
+            ws["b"] = "a * 2"
+        self.assertEqual(ws["a"], 2.0)
+        with self.assertRaises(CalcError):
+            ws["c"] = "c + 1"
+
+    def test_batch_coalesces(self):
+        ws = Workspace()
+        ws.update({"x": 1, "y": "x + 1"})
+        with ws.batch():
+            ws["x"] = 2
+            ws["x"] = 3
+            self.assertEqual(ws["y"], 2.0)
+        self.assertEqual(ws["y"], 4.0)
+        self.assertEqual(ws.recomputed, 2)
+
+    def test_forward_reference_and_errors(self):
+        ws = Workspace()
+        ws["total"] = "later * 2"
+        with self.assertRaisesRegex(CalcError, "Unknown identifier"):
+            ws.get("total")
+        ws["later"] = 4
+        self.assertEqual(ws["total"], 8.0)
+        ws["later"] = "1/0"
+        with self.assertRaisesRegex(CalcError, "later"):
+            ws.get("total")
+        ws.delete("later")
+        with self.assertRaisesRegex(CalcError, "Unknown identifier"):
+            ws.get("total")
+
+
+class TestBatchCSE(unittest.TestCase):
+    def test_results_match_serial(self):
+        exprs = ["sqrt(16) + 1", "2 * sqrt(16)", "sqrt(16)", "1/0", "sqrt(-1) + 1/0", "2+*3", "x"]
+        expected: list[Any] = []
+        for expr in exprs:
+            try:
+                expected.append(evaluate_expression(expr))
+            except CalcError as e:
+                expected.append(str(e))
+        actual = [str(r) if isinstance(r, CalcError) else r for r in evaluate_batch(exprs)]
+        self.assertEqual(actual, expected)
+
+    def test_shared_subtrees_counted_once(self):
+        plan = BatchPlan(["sqrt(9) + 1", "sqrt(9) + 2", "sqrt(9) + 1"])
+        # sqrt, 9, 1, 2, two distinct sums
+        self.assertEqual(plan.unique_nodes, 6)
+        self.assertEqual(plan.total_nodes, 12)
+        self.assertEqual(plan.dedup_ratio, 2.0)
+
+    def test_int_and_float_constants_kept_apart(self):
+        self.assertEqual(evaluate_batch(["7 % 2", "7.0 % 2"]), [1.0, 1.0])
+        plan = BatchPlan(["1", "1.0"])
+        self.assertEqual(plan.unique_nodes, 2)
+
+    def test_deep_expressions(self):
+        for terms in (600, 950):
+            expr = "+".join(["1"] * terms)
+            self.assertEqual(evaluate_batch([expr, expr, f"2*({expr})"]), [terms, terms, 2 * terms])
+        deep = "+".join(["1"] * 600) + "+1/0"
+        self.assertEqual([str(r) for r in evaluate_batch([deep, deep])], [str(CalcError("division by zero"))] * 2)
+
+    def test_deep_lines_on_cli(self):
+        import io
+
+        line = "+".join(["1"] * 600)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            _evaluate_lines([line] * 3)
+        self.assertEqual(out.getvalue().split(), ["600.0"] * 3)
+
+    def test_errors_stop_evaluation_like_serial(self):
+        # The right operand is never evaluated once the left one fails.
+        self.assertIsInstance(evaluate_batch(["1/0 + 9**9**9", "1/0 + 9**9**9"])[0], CalcError)
+        self.assertEqual(str(evaluate_batch(["foo(1/0)", "foo(1/0)"])[0]), "Unsupported function call")
+
+
+class TestAutodiff(unittest.TestCase):
+    # One expression per operator and function, at a point inside every domain
+    CASES = [
+        "x + y", "x - y", "x * y", "x / y", "x % y", "x ** y", "-x",
+        "sqrt(x)", "sin(x)", "cos(x)", "tan(x)", "log(x)", "log(x, y)",
+        "ln(x)", "log10(x)", "abs(x - y)", "pow(x, y)", "x * sin(x * y) / (1 + y**2)",
+    ]
+    POINT = {"x": 1.3, "y": 2.7}
+
+    def _finite_difference(self, expr: str, name: str, h: float = 1e-6) -> float:
+        up, down = dict(self.POINT), dict(self.POINT)
+        up[name] += h
+        down[name] -= h
+        compiled = compile_expression(expr)
+        return (compiled.evaluate(up) - compiled.evaluate(down)) / (2 * h)
+
+    def test_rules_cover_evaluator(self):
+        self.assertLessEqual(set(_OPERATORS) | set(_MATH_FUNCS), set(_PARTIALS))
+
+    def test_matches_finite_differences(self):
+        for expr in self.CASES:
+            for mode in ("forward", "reverse"):
+                value, grads = value_and_grad(expr, self.POINT, ["x", "y"], mode=mode)
+                self.assertEqual(value, compile_expression(expr).evaluate(self.POINT))
+                for name in ("x", "y"):
+                    with self.subTest(expr=expr, mode=mode, var=name):
+                        self.assertAlmostEqual(grads[name], self._finite_difference(expr, name), places=5)
+
+    def test_repeated_variable_and_constant_result(self):
+        self.assertEqual(derivative("x * x * x", "x", {"x": 2.0}), (8.0, 12.0))
+        self.assertEqual(value_and_grad("x * x * x", {"x": 2.0}, mode="reverse"), (8.0, {"x": 12.0}))
+        self.assertEqual(value_and_grad("pi", {"x": 1.0}, ["x"]), (math.pi, {"x": 0.0}))
+
+    def test_errors(self):
+        with self.assertRaises(CalcError):
+            derivative("1/x", "x", {"x": 0.0})
+        with self.assertRaises(CalcError):
+            value_and_grad("x + z", {"x": 1.0})
+        with self.assertRaises(CalcError):
+            value_and_grad("x", {"x": 1.0}, mode="sideways")
+
+    @unittest.skipUnless(_NUMPY_AVAILABLE, "requires NumPy")
+    def test_vectorized(self):
+        xs = np.linspace(0.1, 3.0, 50)
+        for mode in ("forward", "reverse"):
+            value, grads = value_and_grad("x*x*x + sin(x) * y", {"x": xs, "y": 2.0}, mode=mode)
+            np.testing.assert_allclose(value, xs**3 + np.sin(xs) * 2)
+            np.testing.assert_allclose(grads["x"], 3 * xs**2 + 2 * np.cos(xs))
+            np.testing.assert_allclose(grads["y"], np.sin(xs))
+
+
+class TestSolve(unittest.TestCase):
+    EXPR = "x**3 - 2*x - 5"
+    ROOT = 2.0945514815423265
+
+    def test_scalar_methods(self):
+        for method, kwargs in (("bisect", {"bracket": (2, 3)}), ("brent", {"bracket": (2, 3)}), ("newton", {"x0": 2})):
+            result = solve(self.EXPR, "x", method=method, **kwargs)
+            self.assertTrue(result.converged, method)
+            self.assertAlmostEqual(result.root, self.ROOT, places=10)
+        self.assertLess(solve(self.EXPR, bracket=(2, 3)).iterations, solve(self.EXPR, bracket=(2, 3), method="bisect").iterations)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(CalcError):
+            solve(self.EXPR, bracket=(3, 4))
+        with self.assertRaises(CalcError):
+            solve(self.EXPR, x0=2, method="brent")
+        with self.assertRaises(CalcError):
+            solve(self.EXPR, x0=2, method="secant")
+
+    def test_iteration_limit_reported(self):
+        result = solve(self.EXPR, bracket=(2, 3), method="bisect", maxiter=5)
+        self.assertEqual((result.iterations, result.converged), (5, False))
+
+    def test_many_matches_scalar(self):
+        cs = [1.0, 7.5, 30.0, 99.0]
+        for method, kwargs in (
+            ("bisect", {"bracket": ([0.0] * 4, [10.0] * 4)}),
+            ("brent", {"bracket": ([0.0] * 4, [10.0] * 4)}),
+            ("newton", {"x0": [3.0] * 4}),
+        ):
+            batch = solve_many("x**3 - 2*x - c", "x", method=method, env={"c": cs}, **kwargs)
+            self.assertEqual(list(batch.converged), [True] * 4)
+            for i, c in enumerate(cs):
+                single = solve(
+                    "x**3 - 2*x - c", "x", method=method, env={"c": c},
+                    bracket=(0.0, 10.0) if method != "newton" else None, x0=3.0,
+                )
+                self.assertAlmostEqual(float(batch.root[i]), single.root, places=9)
+                self.assertLessEqual(abs(int(batch.iterations[i]) - single.iterations), 1)
+
+    def test_many_flags_failures(self):
+        batch = solve_many("x*x - c", bracket=([0.0, 0.0], [5.0, 5.0]), env={"c": [4.0, -1.0]})
+        self.assertEqual(list(batch.converged), [True, False])
+        self.assertAlmostEqual(float(batch.root[0]), 2.0)
+
+    def test_many_broadcasts_scalars(self):
+        for kwargs in ({"bracket": (0.0, 4.0)}, {"bracket": ([0.0], 4.0)}, {"x0": 3.0, "method": "newton"}):
+            batch = solve_many("x*x - c*k", env={"c": [1.0, 4.0, 9.0], "k": 1.0}, **kwargs)
+            self.assertEqual(list(batch.converged), [True] * 3, kwargs)
+            self.assertEqual([round(float(r), 9) for r in batch.root], [1.0, 2.0, 3.0])
+        batch = solve_many("x*x - c", bracket=([0.0, 0.0, 0.0], [4.0, 1.0, 9.0]), env={"c": 4.0})
+        self.assertEqual(list(batch.converged), [True, False, True])
+
+    def test_many_argument_errors_raise(self):
+        with self.assertRaises(CalcError):
+            solve_many("x - c", bracket=([0.0, 0.0], [1.0, 1.0]))
+        with self.assertRaises(CalcError):
+            solve_many("x - c", bracket=([0.0, 0.0], [1.0, 1.0, 1.0]), env={"c": 0.5})
+        with self.assertRaises(CalcError):
+            solve_many("x - c", bracket=(0.0, 1.0), env={"c": 0.5})
+
+
+class TestJit(unittest.TestCase):
+    """evaluate_jit against evaluating each point with CompiledExpression.evaluate.
+
+    Without numba these exercise the fallback, which must agree as well.
+    """
+
+    EXPRESSIONS = [
+        "x*x*x + sin(x)*y - sqrt(abs(y))",
+        "x / y + x % y",
+        "x ** y",
+        "pow(abs(x), 0.5) + log(abs(x) + 1, 2)",
+        "tan(x) - cos(y) / ln(abs(y) + 2)",
+        "log10(abs(x * y) + 1) - -x",
+        "(2**60 + 1 - 2**60) * x + pi",
+        "1 / (1 / x)",
+        "sqrt(x) * y",
+        "x % 0.7 - y % -1.3",
+        "x + 1e309",
+        "x * 0 + (1e309 - 1e309) - -1e309 * y",
+    ]
+    SPECIAL = [-3.5, -1.0, -0.0, 0.0, 0.25, 1.0, 2.0, 7.5, 1e300, math.inf, math.nan]
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls._cache_home = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = cls._tmp.name
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._cache_home is None:
+            os.environ.pop("XDG_CACHE_HOME", None)
+        else:
+            os.environ["XDG_CACHE_HOME"] = cls._cache_home
+        cls._tmp.cleanup()
+
+    @staticmethod
+    def _result_of(func: Callable[[], Any]) -> Any:
+        try:
+            return [struct.pack("<d", v) for v in func()]
+        except (CalcError, TypeError) as e:
+            return type(e), str(e)
+
+    def _check(self, expr: str, xs: list[float], ys: list[float]) -> None:
+        compiled = compile_expression(expr)
+        expected = self._result_of(lambda: [compiled.evaluate({"x": x, "y": y}) for x, y in zip(xs, ys)])
+        env = {"x": array("d", xs), "y": array("d", ys)}
+        self.assertEqual(self._result_of(lambda: evaluate_jit(expr, env)), expected, expr)
+
+    def test_identical_numerics(self):
+        import random
+
+        rng = random.Random(46)
+        xs = [rng.uniform(0.1, 20) for _ in range(300)]
+        ys = [rng.uniform(-5, 5) or 1.0 for _ in range(300)]
+        for expr in self.EXPRESSIONS:
+            self._check(expr, xs, ys)
+
+    def test_identical_errors_and_special_values(self):
+        for expr in self.EXPRESSIONS:
+            for y in self.SPECIAL:
+                self._check(expr, self.SPECIAL, [y] * len(self.SPECIAL))
+
+    def test_unsupported_expressions_fall_back(self):
+        for expr in ("foo(x)", "x + z", "sqrt(x, 2)", "x < 1"):
+            self._check(expr, [1.0, 2.0], [3.0, 4.0])
+
+    @unittest.skipUnless(_NUMPY_AVAILABLE, "requires NumPy")
+    def test_kernel_source_runs_as_python(self):
+        # numba.njit stubbed out as the identity runs the generated loop as
+        # plain Python, so the kernel writer is checked without numba.
+        import random
+        import types
+        from unittest import mock
+
+        stub = types.ModuleType("numba")
+        stub.njit = lambda *args, **kwargs: lambda func: func  # type: ignore[attr-defined]
+        rng = random.Random(46)
+        xs = np.array([rng.uniform(0.1, 20) for _ in range(300)])
+        ys = np.array([rng.uniform(-5, 5) or 1.0 for _ in range(300)])
+        for expr in self.EXPRESSIONS:
+            compiled = compile_expression(expr)
+            namespace: Dict[str, Any] = {}
+            with mock.patch.dict(sys.modules, {"numba": stub}):
+                exec(_KernelWriter(("x", "y")).source(compiled.tree), namespace)
+            out, flags = np.empty(len(xs)), np.empty(len(xs), dtype=np.bool_)
+            namespace["kernel"](out, flags, xs, ys)
+            expected = [compiled.evaluate({"x": x, "y": y}) for x, y in zip(xs.tolist(), ys.tolist())]
+            # Only points that are not finite get flagged and redone by _eval_node
+            self.assertEqual(flags.tolist(), [not math.isfinite(v) for v in expected], expr)
+            for i in np.flatnonzero(flags):
+                out[i] = expected[i]
+            self.assertEqual(out.tobytes(), np.array(expected).tobytes(), expr)
+
+    @unittest.skipUnless(_NUMPY_AVAILABLE, "requires NumPy")
+    def test_failing_kernel_falls_back(self):
+        from unittest import mock
+
+        def broken(*args: Any) -> None:
+            raise ValueError("rejected by the compiler")
+
+        env = {"x": np.array([1.0, 2.0]), "y": 3.0}
+        self.addCleanup(_JIT_KERNELS.pop, (ast.dump(compile_expression("x * y + 1").tree), ("x", "y")), None)
+        with mock.patch(f"{__name__}._NUMBA_AVAILABLE", True), \
+                mock.patch(f"{__name__}._jit_kernel", return_value=broken):
+            self.assertEqual(evaluate_jit("x * y + 1", env).tolist(), [4.0, 7.0])
+
+    @unittest.skipUnless(_NUMPY_AVAILABLE and _NUMBA_AVAILABLE, "requires NumPy and numba")
+    def test_kernel_cached_by_hash(self):
+        directory = os.path.join(_default_cache_dir(), "jit")
+
+        def kernels() -> set[str]:
+            return {name for name in os.listdir(directory) if name.endswith(".py")} if os.path.isdir(directory) else set()
+
+        before = kernels()
+        evaluate_jit("x * y + 11", {"x": np.ones(3), "y": 2.0})
+        evaluate_jit("x * y + 11", {"x": np.ones(5), "y": np.zeros(5)})
+        self.assertEqual(len(kernels() - before), 1)
+        self.assertIsNotNone(_jit_kernel(compile_expression("x * y + 11"), ("x", "y")))
+
+
+@unittest.skipUnless(_NUMPY_AVAILABLE, "requires NumPy")
+class TestSharedBlocks(unittest.TestCase):
+    EXPRESSIONS = [
+        "x * y + 1",
+        "sqrt(x) * y",
+        "log(y, 2) + x**2",
+        "-x + sin(y) * cos(x) % 2",
+        "abs(x) / y - pow(y, 2)",
+        "2 + 3",
+        "x",
+    ]
+
+    def setUp(self):
+        self.x = np.linspace(-3, 3, 101)
+        self.y = np.linspace(1, 5, 101)
+
+    def test_matches_vectorized_across_block_edges(self):
+        with SharedColumn.from_values(self.x) as x, SharedColumn.from_values(self.y) as y:
+            for expr in self.EXPRESSIONS:
+                with evaluate_shared(expr, {"x": x, "y": y}, workers=1, block_size=7) as out:
+                    expected = compile_expression(expr).evaluate_vectorized({"x": self.x, "y": self.y})
+                    np.testing.assert_allclose(out.array, expected, equal_nan=True)
+
+    def test_process_pool(self):
+        with SharedColumn.from_values(self.x) as x, SharedColumn.from_values(self.y) as y:
+            with evaluate_shared("x * y + sqrt(y)", {"x": x, "y": y}, workers=3, block_size=8) as out:
+                np.testing.assert_allclose(out.array, self.x * self.y + np.sqrt(self.y))
+
+    def test_file_backed_columns(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "x.f64")
+            self.x.astype("<f8").tofile(path)
+            with SharedColumn.from_file(path) as x, SharedColumn.create_file(
+                os.path.join(tmp, "out.f64"), len(self.x)
+            ) as out:
+                evaluate_shared("x * 2", {"x": x}, out, workers=2, block_size=16)
+                np.testing.assert_allclose(out.array, self.x * 2)
+
+    def test_scratch_pool_stays_small(self):
+        tree = compile_expression("sqrt(x*x + y*y) * sin(x) + log10(abs(y) + 1)").tree
+        evaluator = _BlockEvaluator(tree, frozenset({"x", "y"}), 16)
+        out = np.empty(16)
+        evaluator.run({"x": self.x[:16], "y": self.y[:16]}, out)
+        self.assertLessEqual(len(evaluator.free), 3)
+
+
+class TestUserFunctions(unittest.TestCase):
+    def tearDown(self):
+        clear_functions()
+
+    def test_define_and_call(self):
+        define_function("hyp(a, b) = sqrt(a**2 + b**2)")
+        self.assertEqual(evaluate_expression("hyp(3, 4) + 1"), 6.0)
+
+    def test_functions_compose(self):
+        define_function("sq(a) = a*a")
+        define_function("hyp(a, b) = sqrt(sq(a) + sq(b))")
+        self.assertEqual(evaluate_expression("hyp(6, 8)"), 10.0)
+
+    def test_inlined_and_folded(self):
+        define_function("hyp(a, b) = sqrt(a**2 + b**2)")
+        tree = compile_expression("hyp(3, 4) * x").tree
+        self.assertFalse(any(isinstance(n, ast.Call) for n in ast.walk(tree)))
+        self.assertIsInstance(tree.body.left, ast.Constant)
+        self.assertEqual(tree.body.left.value, 5.0)
+
+    def test_recursion_rejected(self):
+        with self.assertRaisesRegex(CalcError, "Recursive|Unsupported"):
+            define_function("f(a) = f(a - 1)")
+        define_function("g(a) = a + 1")
+        define_function("h(a) = g(a) * 2")
+        with self.assertRaisesRegex(CalcError, "Recursive"):
+            define_function("g(a) = h(a)")
+        self.assertEqual(evaluate_expression("h(1)"), 4.0)
+
+    def test_invalid_definitions(self):
+        for definition in ("f(a) = a + b", "sqrt(a) = a", "f(a, a) = a", "f(1) = 2", "f(a) a"):
+            with self.assertRaises(CalcError):
+                define_function(definition)
+
+    def test_arity_checked(self):
+        define_function("twice(a) = 2*a")
+        with self.assertRaises(CalcError):
+            evaluate_expression("twice(1, 2)")
+
+    def test_errors_preserved(self):
+        define_function("inv(a) = 1/a")
+        with self.assertRaisesRegex(CalcError, "division by zero"):
+            evaluate_expression("inv(0)")
+
+    def test_vectorized_through_functions(self):
+        define_function("sq(a) = a*a")
+        _, ys = evaluate_range("sq(x) + 1", 0, 2, 3)
+        self.assertEqual(list(ys), [1.0, 2.0, 5.0])
+
+    def test_costly_constants_not_folded(self):
+        start = time.perf_counter()
+        compile_expression("9**9**9 + x")
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_definitions_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "defs.txt")
+            with open(path, "w") as handle:
+                handle.write("# helpers\nsq(a) = a*a\n\ncube(a) = a*sq(a)  # uses sq\n")
+            load_definitions(path)
+        self.assertEqual(evaluate_expression("cube(3)"), 27.0)
+
+
+class TestReductions(unittest.TestCase):
+    def test_basic_reductions(self):
+        stats = StreamingStats()
+        stats.update([3.0, -1.0, 4.0, 0.0, 2.0])
+        self.assertEqual(
+            stats.results(),
+            {"count": 5, "sum": 8.0, "mean": 1.6, "min": -1.0, "max": 4.0, "errors": 0},
+        )
+
+    def test_quantiles_within_accuracy(self):
+        values = [float(v) for v in range(-5_000, 10_001)]
+        stats = StreamingStats()
+        for v in values:
+            stats.add(v)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(stats.quantile(q) - exact), 0.011 * abs(exact) + 1e-9)
+
+    def test_merge_matches_single_pass(self):
+        values = [math.sin(i) * 100 for i in range(1_000)]
+        whole = StreamingStats()
+        whole.update(values)
+        left, right = StreamingStats(), StreamingStats()
+        left.update(values[:400])
+        right.update(values[400:])
+        merged = left.merge(right).results(("count", "min", "max", "p50", "p99"))
+        self.assertEqual(merged, whole.results(("count", "min", "max", "p50", "p99")))
+        self.assertAlmostEqual(left.sum, whole.sum)
+
+    def test_memory_bounded(self):
+        stats = StreamingStats(max_buckets=64)
+        stats.update([10.0**k for k in range(-300, 300)])
+        self.assertLessEqual(len(stats._positive), 64)
+        self.assertEqual(stats.quantile(1.0), 1e299)
+        self.assertAlmostEqual(stats.quantile(0.99) / 1e293, 1.0, delta=0.011)
+
+    def test_non_finite_counted_as_errors(self):
+        stats = StreamingStats()
+        stats.update([1.0, math.nan, math.inf])
+        self.assertEqual((stats.count, stats.errors), (1, 2))
+
+    def test_reduce_env_stream(self):
+        results = reduce_expression("1/x", ({"x": x} for x in (1, 2, 0, 4)), ("sum", "errors"))
+        self.assertEqual(results, {"sum": 1.75, "errors": 1})
+
+    def test_reduce_columns_chunked_and_parallel(self):
+        xs = array("d", (float(i) for i in range(1_000)))
+        serial = reduce_expression("x*2", {"x": xs}, ("sum", "max", "p50"), chunk_size=64)
+        parallel = reduce_expression("x*2", {"x": xs}, ("sum", "max", "p50"), chunk_size=64, parallel=True)
+        self.assertEqual(serial["sum"], 999_000.0)
+        self.assertEqual(serial, parallel)
+
+    def test_unknown_reduction(self):
+        with self.assertRaises(CalcError):
+            reduce_expression("x", [{"x": 1}], ("median",))
+
+    def test_cli_reduce(self):
+        import io
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(main(["--reduce", "sum,count,errors", "--cli", "1+1", "2*3", "1/0"]), 0)
+        self.assertEqual(out.getvalue().split("\n")[:3], ["sum: 8.0", "count: 2", "errors: 1"])
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "history")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ring_buffer_is_bounded(self):
+        history = History(self.path, capacity=3)
+        for i in range(5):
+            history.append(f"{i}+1", str(i + 1))
+        self.assertEqual([e.expr for e in history.entries()], ["2+1", "3+1", "4+1"])
+        self.assertEqual(history.search("1+1"), [])
+
+    def test_persisted_and_loaded_lazily(self):
+        history = History(self.path)
+        history.append("2*21", "42")
+        reopened = History(self.path)
+        self.assertFalse(reopened._loaded)
+        reopened.append("1+1", "2")
+        self.assertEqual([(e.expr, e.result) for e in reopened.entries()], [("2*21", "42"), ("1+1", "2")])
+
+    def test_recall_returns_stored_result(self):
+        history = History(self.path)
+        history.append("sqrt(2)", "1.4142135623730951")
+        history.append("1/3", "0.3333333333333333")
+        self.assertEqual(history.recall(1), "0.3333333333333333")
+        self.assertEqual(history.recall(2), "1.4142135623730951")
+        self.assertIsNone(history.recall(3))
+
+    def test_prefix_and_substring_search(self):
+        history = History(None)
+        for expr in ("sin(1)", "sqrt(16)", "2*sin(3)", "sin(1)+1"):
+            history.append(expr, "0")
+        self.assertEqual([e.expr for e in history.search("sin(", prefix=True)], ["sin(1)+1", "sin(1)"])
+        self.assertEqual([e.expr for e in history.search("in(")], ["sin(1)+1", "2*sin(3)", "sin(1)"])
+        self.assertEqual([e.expr for e in history.search("q")], ["sqrt(16)"])
+
+    def test_log_rotates_at_size_cap(self):
+        history = History(self.path, max_bytes=200)
+        for i in range(20):
+            history.append(f"{i}*{i}", str(i * i))
+        self.assertLessEqual(os.path.getsize(self.path), 200)
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertEqual(History(self.path).recall(1), "361")
+
+    def test_corrupt_lines_skipped(self):
+        with open(self.path, "w", encoding="utf-8") as handle:
+            handle.write('["1+1", "2"]\nnot json\n["2+2", "4"]\n')
+        self.assertEqual([e.expr for e in History(self.path).entries()], ["1+1", "2+2"])
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_does_not_import_gui_or_asyncio(self):
+        import subprocess
+
+        code = (
+            "import sys; sys.argv = ['calculator.py', '--eval', '1+2'];"
+            "import runpy; runpy.run_path(sys.argv[0], run_name='__main__');"
+            "print('tkinter' in sys.modules, 'asyncio.base_events' in sys.modules)"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code.replace("calculator.py", os.path.abspath(__file__))],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        self.assertEqual(out, ["3.0", "False", "False"])
+
+
+def run_tests() -> int:
     loader = unittest.TestLoader()
-    suite = loader.loadTestsFromTestCase(TestEvaluateExpression)
+    suite = unittest.TestSuite()
+    for case in (
+        TestEvaluateExpression,
+        TestParallelEvaluation,
+        TestSweeps,
+        TestDiskCache,
+        TestBinaryColumns,
+        TestAsyncEvaluation,
+        TestWorkspace,
+        TestBatchCSE,
+        TestSharedBlocks,
+        TestUserFunctions,
+        TestReductions,
+        TestAutodiff,
+        TestSolve,
+        TestJit,
+        TestHistory,
+        TestStartup,
+    ):
+        suite.addTests(loader.loadTestsFromTestCase(case))
     result = unittest.TextTestRunner(verbosity=2).run(suite)
     return 0 if result.wasSuccessful() else 1
 
@@ -408,12 +5128,106 @@ def run_tests() -> int:
 # Entrypoint
 # ---------------------------
 
+def _print_profile(elapsed: float) -> None:
+    info = compile_expression.cache_info()
+    print(f"profile: total {elapsed * 1e3:.2f}ms", file=sys.stderr)
+    print(
+        f"profile: in-process cache hits={info.hits} misses={info.misses}",
+        file=sys.stderr,
+    )
+    cache = _DISK_CACHE
+    if cache is not None:
+        lookups = cache.hits + cache.misses
+        rate = cache.hits / lookups * 100 if lookups else 0.0
+        print(
+            f"profile: disk cache hits={cache.hits} misses={cache.misses} "
+            f"writes={cache.writes} hit rate={rate:.1f}% "
+            f"time saved={cache.saved_seconds * 1e3:.3f}ms",
+            file=sys.stderr,
+        )
+    if _CSE_STATS["lines"]:
+        ratio = _CSE_STATS["nodes"] / max(_CSE_STATS["unique"], 1)
+        print(
+            f"profile: batch CSE lines={_CSE_STATS['lines']} "
+            f"nodes={_CSE_STATS['nodes']} unique={_CSE_STATS['unique']} "
+            f"dedup ratio={ratio:.2f}",
+            file=sys.stderr,
+        )
+
+
 def main(argv: list[str] | None = None) -> int:
-    argv = argv or sys.argv[1:]
+    argv = list(argv or sys.argv[1:])
 
+    for flag in ("--defs", "--define"):
+        while flag in argv:
+            idx = argv.index(flag)
+            if idx + 1 >= len(argv):
+                print(f"Usage: {flag} " + ("FILE" if flag == "--defs" else "'name(a, b) = expr'"))
+                return 1
+            value = argv.pop(idx + 1)
+            argv.pop(idx)
+            try:
+                if flag == "--defs":
+                    load_definitions(value)
+                else:
+                    define_function(value)
+            except (CalcError, OSError) as e:
+                print("Error:", e)
+                return 1
+
+    if "--disk-cache" in argv or os.environ.get("CALCULATOR_DISK_CACHE"):
+        if "--disk-cache" in argv:
+            argv.remove("--disk-cache")
+        if not enable_disk_cache():
+            print(f"disk cache disabled: cannot create {_default_cache_dir()}", file=sys.stderr)
+
+    if "--profile" not in argv:
+        return _run(argv)
+    argv.remove("--profile")
+    start = time.perf_counter()
+    try:
+        return _run(argv)
+    finally:
+        _print_profile(time.perf_counter() - start)
+
+
+def _run(argv: list[str]) -> int:
     if "--run-tests" in argv:
         return run_tests()
 
+    if "--benchmark" in argv:
+        idx = argv.index("--benchmark")
+        name = argv[idx + 1] if idx + 1 < len(argv) else ""
+        if name not in _BENCHMARKS:
+            print("Usage: --benchmark {" + ",".join(sorted(_BENCHMARKS)) + "}")
+            return 1
+        _BENCHMARKS[name]()
+        return 0
+
+    if "--binary" in argv:
+        return binary_batch(argv)
+
+    evaluate: Callable[[str], float] = evaluate_expression
+    if "--parallel" in argv:
+        idx = argv.index("--parallel")
+        kind = "thread"
+        if idx + 1 < len(argv) and argv[idx + 1] in ("thread", "process"):
+            kind = argv.pop(idx + 1)
+        argv.remove("--parallel")
+        evaluate = functools.partial(evaluate_parallel, executor=kind)
+
+    try:
+        reductions = _parse_reductions(argv)
+    except CalcError as e:
+        print(e)
+        return 1
+    if reductions:
+        lines: Any = sys.stdin
+        if "--cli" in argv:
+            lines = argv[argv.index("--cli") + 1 :] or sys.stdin
+        _print_reductions(reduce_lines(lines, reductions, evaluate))
+        return 0
+
     if "--eval" in argv:
         try:
             expr = argv[argv.index("--eval") + 1]
@@ -421,7 +5235,7 @@ def main(argv: list[str] | None = None) -> int:
             print("Usage: --eval 'EXPR'")
             return 1
         try:
-            print(evaluate_expression(expr))
+            print(evaluate(expr))
             return 0
         except CalcError as e:
             print("Error:", e)
@@ -430,14 +5244,15 @@ def main(argv: list[str] | None = None) -> int:
     if "--cli" in argv:
         idx = argv.index("--cli")
         fallback = argv[idx + 1 :]
-        cli_repl(fallback or None)
+        cli_repl(fallback or None, evaluate)
         return 0
 
-    if _GUI_AVAILABLE and "--no-gui" not in argv:
+    if "--no-gui" not in argv and _load_gui():
         root = tk.Tk()
         root.title("Modern Calculator")
         root.geometry("400x520")
         CalculatorUI(root)
+        _probe_startup(root)
         try:
             root.mainloop()
         except KeyboardInterrupt:
@@ -1,10 +1,1564 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:  # Headless installs can still serve the API and run benchmarks
+    tk = ttk = messagebox = filedialog = None
+import bisect
+import contextlib
 import csv
+import io
+import json
+import math
 import os
-from datetime import datetime
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
 
 FILENAME = "expenses.csv"
+HEADER = ["Date", "Category", "Amount", "Description"]
+
+# Files smaller than this are parsed in-process; starting workers costs more.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+
+# --- DIAGNOSTICS ---
+class Profiler:
+    """Wall time per operation and sub-phase, plus counters.
+
+    A phase opened inside another is recorded as "outer/inner", so the CSV
+    parsing done for load_data is told apart from a report's. Each thread
+    keeps its own stack of open phases. With ``trace_memory`` on, every
+    top-level operation also records tracemalloc's current and peak usage
+    and its largest allocation sites.
+    """
+
+    MAX_SNAPSHOTS = 50
+
+    def __init__(self):
+        self.timings = {}  # path -> [calls, seconds, slowest]
+        self.counters = {}
+        self.snapshots = []
+        self.trace_memory = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._stack()
+        path = f"{stack[-1]}/{name}" if stack else name
+        stack.append(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            self.record(path, elapsed)
+            if not stack and self.trace_memory:
+                self._snapshot(path)
+
+    def add_time(self, name, seconds, calls=1):
+        """Record time measured by the caller as a phase of the current one."""
+        stack = self._stack()
+        self.record(f"{stack[-1]}/{name}" if stack else name, seconds, calls)
+
+    def record(self, path, seconds, calls=1):
+        with self._lock:
+            entry = self.timings.get(path)
+            if entry is None:
+                self.timings[path] = [calls, seconds, seconds / calls]
+            else:
+                entry[0] += calls
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds / calls)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_trace_memory(self, on):
+        import tracemalloc
+
+        if on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not on and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = on
+
+    def _snapshot(self, operation):
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:5]
+        tracemalloc.reset_peak()
+        with self._lock:
+            self.snapshots.append({
+                "operation": operation,
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size} B in {stat.count}"
+                        for stat in top],
+            })
+            del self.snapshots[:-self.MAX_SNAPSHOTS]
+
+    def reset(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+            self.snapshots.clear()
+
+    def report(self):
+        with self._lock:
+            return {
+                "timings": {
+                    path: {"calls": calls, "total_ms": seconds * 1e3, "mean_ms": seconds / calls * 1e3,
+                           "max_ms": slowest * 1e3}
+                    for path, (calls, seconds, slowest) in sorted(self.timings.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "memory": list(self.snapshots),
+            }
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=1)
+
+
+# Always on: a phase costs about a microsecond, operations take milliseconds.
+PROFILE = Profiler()
+
+
+class DiagnosticsPanel:
+    """Window showing PROFILE: phase timings as a tree, counters and memory snapshots."""
+
+    COLUMNS = ("Calls", "Total ms", "Mean ms", "Max ms")
+
+    def __init__(self, master):
+        self.window = tk.Toplevel(master)
+        self.window.title("Diagnostics")
+        self.window.geometry("720x560")
+
+        self.tree = ttk.Treeview(self.window, columns=self.COLUMNS, height=14)
+        self.tree.heading("#0", text="Operation / phase")
+        self.tree.column("#0", width=300)
+        for col in self.COLUMNS:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=90, anchor="e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        self.details = tk.Text(self.window, height=12, wrap="none")
+        self.details.pack(fill="both", expand=True, padx=10, pady=5)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x", padx=10, pady=5)
+        ttk.Button(buttons, text="Refresh", command=self.refresh).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Reset", command=lambda: (PROFILE.reset(), self.refresh())).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Save JSON…", command=self.save).pack(side="left", padx=5)
+        self.trace_var = tk.BooleanVar(value=PROFILE.trace_memory)
+        ttk.Checkbutton(buttons, text="Track memory (tracemalloc, slower)", variable=self.trace_var,
+                        command=lambda: PROFILE.set_trace_memory(self.trace_var.get())).pack(side="left", padx=5)
+        self.refresh()
+
+    def alive(self):
+        return bool(self.window.winfo_exists())
+
+    def refresh(self):
+        report = PROFILE.report()
+        self.tree.delete(*self.tree.get_children())
+        for path, timing in report["timings"].items():
+            parent, _, name = path.rpartition("/")
+            self.tree.insert(parent if self.tree.exists(parent) else "", "end", iid=path, text=name, open=True,
+                             values=(timing["calls"], f"{timing['total_ms']:.1f}", f"{timing['mean_ms']:.2f}",
+                                     f"{timing['max_ms']:.1f}"))
+        lines = [f"{name}: {value:,}" for name, value in report["counters"].items()] or ["No counters yet."]
+        if report["memory"]:
+            lines.append("")
+        for snapshot in reversed(report["memory"]):
+            lines.append(f"{snapshot['time']}  {snapshot['operation']}: {snapshot['current_bytes'] / 1e6:.1f} MB now, "
+                         f"{snapshot['peak_bytes'] / 1e6:.1f} MB peak")
+            lines.extend(f"    {line}" for line in snapshot["top"])
+        self.details.delete("1.0", "end")
+        self.details.insert("1.0", "\n".join(lines))
+
+    def save(self):
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=".json",
+                                            initialfile="profile.json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            PROFILE.dump(path)
+        except OSError as e:
+            messagebox.showerror("Diagnostics", f"Could not save: {e}", parent=self.window)
+
+
+# --- LOADING ---
+class StringPool:
+    """Each distinct string stored once; rows refer to it by an integer code."""
+
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, text):
+        code = self.codes.get(text)
+        if code is None:
+            code = self.codes[text] = len(self.strings)
+            self.strings.append(text)
+        return code
+
+    def remap(self, other):
+        """List mapping each of ``other``'s codes to the code for the same string here."""
+        return [self.encode(text) for text in other.strings]
+
+
+class ExpenseColumns:
+    """Expenses stored column by column.
+
+    Dates are ordinals, amounts whole paise, and categories and descriptions
+    are codes into string pools, so a row costs 24 bytes of arrays plus its
+    share of the distinct strings. Display text is built per row on demand.
+    """
+
+    def __init__(self, category_pool=None, description_pool=None):
+        self.ordinals = array("l")
+        self.paise = array("q")
+        self.category_codes = array("I")
+        self.description_codes = array("I")
+        self.category_pool = category_pool or StringPool()
+        self.description_pool = description_pool or StringPool()
+        self.malformed = 0
+
+    def __len__(self):
+        return len(self.paise)
+
+    def append(self, ordinal, category, amount, description):
+        self.ordinals.append(ordinal)
+        self.paise.append(round(amount * 100))
+        self.category_codes.append(self.category_pool.encode(category))
+        self.description_codes.append(self.description_pool.encode(description))
+
+    def insert(self, pos, ordinal, category, amount, description):
+        self.ordinals.insert(pos, ordinal)
+        self.paise.insert(pos, round(amount * 100))
+        self.category_codes.insert(pos, self.category_pool.encode(category))
+        self.description_codes.insert(pos, self.description_pool.encode(description))
+
+    def delete(self, pos):
+        for column in (self.ordinals, self.paise, self.category_codes, self.description_codes):
+            del column[pos]
+
+    def amount(self, i):
+        return self.paise[i] / 100
+
+    def category(self, i):
+        return self.category_pool.strings[self.category_codes[i]]
+
+    def description(self, i):
+        return self.description_pool.strings[self.description_codes[i]]
+
+    def row(self, i):
+        """(ordinal, category, amount, description) for row ``i``."""
+        return self.ordinals[i], self.category(i), self.amount(i), self.description(i)
+
+    def display_values(self, i):
+        """The strings the table shows for row ``i``."""
+        return [date.fromordinal(self.ordinals[i]).isoformat(), self.category(i),
+                f"₹{self.amount(i)}", self.description(i)]
+
+    def extend(self, other):
+        self.ordinals.extend(other.ordinals)
+        self.paise.extend(other.paise)
+        for codes, pool, other_codes, other_pool in (
+            (self.category_codes, self.category_pool, other.category_codes, other.category_pool),
+            (self.description_codes, self.description_pool, other.description_codes, other.description_pool),
+        ):
+            if other_pool is pool:
+                codes.extend(other_codes)
+            else:
+                mapping = pool.remap(other_pool)
+                codes.extend(array("I", map(mapping.__getitem__, other_codes)))
+        self.malformed += other.malformed
+
+    def take(self, positions):
+        """The given rows, in that order, sharing this object's string pools."""
+        out = ExpenseColumns(self.category_pool, self.description_pool)
+        for name in ("ordinals", "paise", "category_codes", "description_codes"):
+            column = getattr(self, name)
+            setattr(out, name, array(column.typecode, map(column.__getitem__, positions)))
+        return out
+
+    def total(self):
+        return sum(self.paise) / 100
+
+    def between(self, start=None, end=None):
+        """The rows dated within [start, end] (ordinals, either may be None)."""
+        return self.take([
+            i for i, ordinal in enumerate(self.ordinals)
+            if (start is None or ordinal >= start) and (end is None or ordinal <= end)
+        ])
+
+    def category_totals(self, lo=0, hi=None):
+        """{category: total} over rows ``lo`` to ``hi``."""
+        paise = {}
+        for code, value in zip(self.category_codes[lo:hi], self.paise[lo:hi]):
+            paise[code] = paise.get(code, 0) + value
+        return {self.category_pool.strings[code]: value / 100 for code, value in paise.items()}
+
+
+def parse_date_ordinal(text):
+    """Ordinal of a YYYY-MM-DD date, sliced directly instead of via strptime."""
+    if len(text) == 10 and text[4] == "-" and text[7] == "-":
+        return date(int(text[:4]), int(text[5:7]), int(text[8:])).toordinal()
+    # Hand-edited files may drop leading zeros (2025-1-5); strptime allows that.
+    PROFILE.count("strptime calls")
+    return datetime.strptime(text, "%Y-%m-%d").toordinal()
+
+
+def parse_rows(lines, columns=None):
+    """Append the CSV ``lines`` to ``columns``, counting rows that don't parse."""
+    if columns is None:
+        columns = ExpenseColumns()
+    ordinals, paise = columns.ordinals, columns.paise
+    category_codes, description_codes = columns.category_codes, columns.description_codes
+    encode_category = columns.category_pool.encode
+    encode_description = columns.description_pool.encode
+    memo = {}
+    malformed = 0
+    date_seconds = 0.0
+    clock = time.perf_counter
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        if len(row) != 4:
+            malformed += 1
+            continue
+        try:
+            ordinal = memo.get(row[0])
+            if ordinal is None:
+                # Once per distinct date, so timing it costs nothing measurable
+                began = clock()
+                ordinal = memo[row[0]] = parse_date_ordinal(row[0])
+                date_seconds += clock() - began
+            amount = round(float(row[2]) * 100)
+        except (ValueError, OverflowError):
+            malformed += 1
+            continue
+        ordinals.append(ordinal)
+        paise.append(amount)
+        category_codes.append(encode_category(row[1]))
+        description_codes.append(encode_description(row[3]))
+    columns.malformed += malformed
+    if memo:
+        PROFILE.add_time("dates", date_seconds, len(memo))
+    PROFILE.count("corrupt rows skipped", malformed)
+    return columns
+
+
+def split_file(path, parts):
+    """Byte ranges covering ``path``, each ending just after a newline.
+
+    Rows never straddle two ranges. Descriptions come from a single-line
+    entry, so a newline always ends a row.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as file:
+        for i in range(1, parts):
+            file.seek(max(size * i // parts, bounds[-1]))
+            file.readline()
+            pos = file.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _parse_range(path, start, end):
+    with PROFILE.phase("read"):
+        with open(path, "rb") as file:
+            file.seek(start)
+            text = file.read(end - start).decode("utf-8")
+    PROFILE.count("bytes read", end - start)
+    with PROFILE.phase("parse"):
+        if start == 0:
+            first, sep, rest = text.partition("\n")
+            if next(csv.reader([first]), None) == HEADER:
+                text = rest
+        return parse_rows(io.StringIO(text, newline=""))
+
+
+def load_expenses(path=FILENAME, workers=None):
+    """Load ``path`` into an ExpenseColumns, in parallel for large files.
+
+    The file is cut into newline-aligned byte ranges which a process pool
+    parses independently; the partial columns are merged in file order.
+    """
+    if not os.path.exists(path):
+        return ExpenseColumns()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or os.path.getsize(path) < PARALLEL_MIN_BYTES:
+        return _parse_range(path, 0, os.path.getsize(path))
+
+    ranges = split_file(path, workers * 4)
+    columns = ExpenseColumns()
+    with PROFILE.phase("parallel parse"), ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_range, path, start, end) for start, end in ranges]
+        for future in futures:
+            columns.extend(future.result())
+    # The workers' own counts stay in their processes
+    PROFILE.count("bytes read", os.path.getsize(path))
+    PROFILE.count("corrupt rows skipped", columns.malformed)
+    return columns
+
+
+# --- STORAGE ---
+DATA_DIR = "expenses"
+MANIFEST = "manifest.json"
+JOURNAL = "journal.wal"
+
+
+def _month_key(ordinal):
+    day = date.fromordinal(ordinal)
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def _month_bounds(key):
+    year, month = int(key[:4]), int(key[5:7])
+    first = date(year, month, 1).toordinal()
+    following = date(year + month // 12, month % 12 + 1, 1).toordinal()
+    return first, following - 1
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    data = text.encode("utf-8")
+    with PROFILE.phase("write"):
+        with open(tmp, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+    PROFILE.count("bytes written", len(data))
+
+
+def _rows_to_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+class Journal:
+    """Append-only write-ahead log of expense changes.
+
+    Each line is ``<crc32> <json>``; a torn or corrupt tail left by a crash
+    fails the checksum and is cut off when the journal is reopened.
+    ``durability`` decides when appends reach the disk:
+
+    * ``"always"``: fsync after every record.
+    * ``"group"``: the caller waits for an fsync covering its record, and
+      concurrent callers share one fsync (group commit).
+    * ``"interval"``: a background thread fsyncs every ``interval`` seconds;
+      a crash can lose that much.
+    * ``"off"``: left to the OS.
+
+    ``batch()`` defers the fsync of every record written inside it to one
+    at the end, whatever the policy.
+    """
+
+    POLICIES = ("always", "group", "interval", "off")
+
+    def __init__(self, path, durability="group", interval=1.0, start_lsn=0):
+        if durability not in self.POLICIES:
+            raise ValueError(f"Unknown durability policy: {durability}")
+        self.path = path
+        self.durability = durability
+        self.records = self._read_valid()
+        # A checkpoint empties the journal, so numbering carries on from
+        # ``start_lsn`` (the last checkpointed record) when there is none.
+        self.last_lsn = max(self.records[-1][0] if self.records else 0, start_lsn)
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(threading.Lock())
+        self._synced_lsn = self.last_lsn
+        self._syncing = False
+        self._batch_depth = 0
+        self._closed = threading.Event()
+        if durability == "interval":
+            threading.Thread(target=self._sync_periodically, args=(interval,), daemon=True).start()
+
+    def _read_valid(self):
+        records = []
+        good_bytes = 0
+        if not os.path.exists(self.path):
+            return records
+        PROFILE.count("bytes read", os.path.getsize(self.path))
+        with open(self.path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                crc, _, payload = line[:-1].partition(b" ")
+                try:
+                    if int(crc, 16) != zlib.crc32(payload):
+                        break
+                    records.append(json.loads(payload))
+                except ValueError:
+                    break
+                good_bytes += len(line)
+        if good_bytes != os.path.getsize(self.path):
+            with open(self.path, "r+b") as file:
+                file.truncate(good_bytes)
+                os.fsync(file.fileno())
+        return records
+
+    def append(self, op, *fields):
+        """Log one change and return its sequence number once it is durable."""
+        began = time.perf_counter()
+        with self._lock:
+            PROFILE.add_time("journal lock wait", time.perf_counter() - began)
+            self.last_lsn += 1
+            lsn = self.last_lsn
+            payload = json.dumps([lsn, op, *fields], ensure_ascii=False).encode("utf-8")
+            line = b"%08x %s\n" % (zlib.crc32(payload), payload)
+            self._file.write(line)
+            PROFILE.count("bytes written", len(line))
+            self.records.append([lsn, op, *fields])
+            self._file.flush()
+            if self._batch_depth or self.durability in ("interval", "off"):
+                return lsn
+            if self.durability == "always":
+                with PROFILE.phase("fsync"):
+                    os.fsync(self._file.fileno())
+                self._synced_lsn = lsn
+                return lsn
+        self.sync(lsn)
+        return lsn
+
+    def sync(self, lsn=None):
+        """Block until everything up to ``lsn`` (default: all) is on disk."""
+        if lsn is None:
+            lsn = self.last_lsn
+        with self._synced:
+            while self._synced_lsn < lsn:
+                if self._syncing:
+                    # Someone else's fsync is in flight; ours rides the next one.
+                    self._synced.wait()
+                    continue
+                self._syncing = True
+                target = self.last_lsn
+                self._synced.release()
+                try:
+                    with PROFILE.phase("fsync"):
+                        os.fsync(self._file.fileno())
+                finally:
+                    self._synced.acquire()
+                    self._syncing = False
+                self._synced_lsn = max(self._synced_lsn, target)
+                self._synced.notify_all()
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+            if self.durability != "off":
+                self.sync()
+
+    def _sync_periodically(self, interval):
+        while not self._closed.wait(interval):
+            if self._synced_lsn < self.last_lsn:
+                self.sync()
+
+    def reset(self, upto_lsn):
+        """Drop the records up to ``upto_lsn`` once they are checkpointed.
+
+        The kept records are written to a new file that then replaces the
+        journal, so a crash leaves one or the other, never a half-written mix.
+        """
+        with self._lock:
+            records = [record for record in self.records if record[0] > upto_lsn]
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as file:
+                for record in records:
+                    payload = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                    line = b"%08x %s\n" % (zlib.crc32(payload), payload)
+                    file.write(line)
+                    PROFILE.count("bytes written", len(line))
+                file.flush()
+                os.fsync(file.fileno())
+            with self._synced:
+                # An fsync in flight still holds the old file descriptor.
+                while self._syncing:
+                    self._synced.wait()
+                self._file.close()
+                os.replace(tmp, self.path)
+                _fsync_dir(os.path.dirname(self.path) or ".")
+                self._file = open(self.path, "ab")
+                self._synced_lsn = self.last_lsn
+            self.records = records
+
+    def close(self):
+        self._closed.set()
+        if self.durability != "off":
+            self.sync()
+        self._file.close()
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on this platform (Windows)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ExpenseStore:
+    """Expenses split into one CSV segment per month plus a manifest.
+
+    The manifest records each segment's row count, total and per-category
+    totals, so whole-history reports never open a segment and date-bounded
+    loads only read the months they overlap. A segment whose size or
+    modification time no longer matches the manifest (edited by hand) is
+    rescanned on the next access.
+
+    Writes go to a Journal first and reach the segments at a checkpoint:
+    new segment files are written beside the old ones, the manifest naming
+    them and the last applied journal record is replaced atomically, and
+    only then are they renamed into place. Reopening the store finishes an
+    interrupted checkpoint and replays whatever the journal still holds.
+
+    A checkpoint runs once the journal holds ``checkpoint_every`` records or
+    is ``checkpoint_age`` seconds old, and on close. Until then reads lay the
+    journaled changes over the segments and manifest totals, so a save costs
+    one journal append however often the data is read back.
+    """
+
+    def __init__(self, directory=DATA_DIR, legacy_file=FILENAME, durability="group",
+                 checkpoint_every=10_000, checkpoint_age=300.0):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_age = checkpoint_age
+        self._checkpoint_lock = threading.Lock()
+        self._checkpointed_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self.partitions = {}
+        self.checkpoint_lsn = 0
+        self.pending_renames = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as file:
+                manifest = json.load(file)
+            self.partitions = manifest.get("partitions", {})
+            self.checkpoint_lsn = manifest.get("checkpoint_lsn", 0)
+            self.pending_renames = manifest.get("pending", {})
+        elif legacy_file and os.path.exists(legacy_file):
+            self._migrate(legacy_file)
+        self._finish_renames()
+        self.journal = Journal(os.path.join(directory, JOURNAL), durability, start_lsn=self.checkpoint_lsn)
+        self.refresh()
+        self.checkpoint()
+
+    def segment_path(self, key):
+        return os.path.join(self.directory, f"{key}.csv")
+
+    def _migrate(self, legacy_file):
+        months = {}
+        unreadable = []
+        with open(legacy_file, newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            for row in reader:
+                if row == HEADER or not row:
+                    continue
+                try:
+                    key = _month_key(parse_date_ordinal(row[0])) if len(row) == 4 else None
+                    float(row[2])
+                except (ValueError, IndexError):
+                    key = None
+                if key is None:
+                    unreadable.append(row)
+                else:
+                    months.setdefault(key, []).append(row)
+        for key, rows in months.items():
+            _write_atomic(self.segment_path(key), _rows_to_csv(rows))
+        if unreadable:
+            # Kept for the user to fix by hand; never part of a segment.
+            _write_atomic(os.path.join(self.directory, "unreadable.csv"), _rows_to_csv(unreadable))
+        os.replace(legacy_file, legacy_file + ".migrated")
+
+    def _finish_renames(self):
+        if not self.pending_renames:
+            return
+        for key, staged in self.pending_renames.items():
+            if staged is None:
+                if os.path.exists(self.segment_path(key)):
+                    os.remove(self.segment_path(key))
+            elif os.path.exists(staged):
+                os.replace(staged, self.segment_path(key))
+        _fsync_dir(self.directory)
+        self.pending_renames = {}
+        self._save_manifest()
+
+    def _scan(self, key, path=None):
+        path = path or self.segment_path(key)
+        data = load_expenses(path)
+        categories = data.category_totals()
+        stat = os.stat(path)
+        self.partitions[key] = {
+            "rows": len(data),
+            "total": data.total(),
+            "categories": categories,
+            "malformed": data.malformed,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        return data
+
+    def refresh(self):
+        """Bring the manifest in line with the segments on disk."""
+        changed = False
+        on_disk = set()
+        for name in os.listdir(self.directory):
+            key = name[:-4]
+            if name.endswith(".csv") and len(key) == 7 and key[4] == "-" and key.replace("-", "").isdigit():
+                on_disk.add(key)
+        for key in set(self.partitions) - on_disk:
+            del self.partitions[key]
+            changed = True
+        for key in on_disk:
+            entry = self.partitions.get(key)
+            stat = os.stat(self.segment_path(key))
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                self._scan(key)
+                changed = True
+        if changed or not os.path.exists(self.manifest_path):
+            self._save_manifest()
+
+    def _save_manifest(self):
+        manifest = {
+            "version": 2,
+            "checkpoint_lsn": self.checkpoint_lsn,
+            "pending": self.pending_renames,
+            "partitions": dict(sorted(self.partitions.items())),
+        }
+        _write_atomic(self.manifest_path, json.dumps(manifest, indent=1))
+
+    def checkpoint(self):
+        """Apply the journal to the segments; returns the number of deletes that matched."""
+        with self._checkpoint_lock:
+            self._checkpointed_at = time.monotonic()
+            records = [r for r in self.journal.records if r[0] > self.checkpoint_lsn]
+            if not records:
+                if self.journal.records:
+                    self.journal.reset(self.checkpoint_lsn)
+                return 0
+            with PROFILE.phase("checkpoint"):
+                return self._apply_records(records)
+
+    def _maybe_checkpoint(self):
+        if len(self.journal.records) >= self.checkpoint_every \
+                or time.monotonic() - self._checkpointed_at >= self.checkpoint_age:
+            self.checkpoint()
+
+    def _pending(self, records=None):
+        """{"YYYY-MM": [record, ...]} for journal records not yet checkpointed."""
+        by_month = {}
+        for record in self.journal.records if records is None else records:
+            if record[0] > self.checkpoint_lsn:
+                by_month.setdefault(_month_key(parse_date_ordinal(record[2])), []).append(record)
+        return by_month
+
+    def _segment_rows(self, key):
+        if not os.path.exists(self.segment_path(key)):
+            return []
+        PROFILE.count("bytes read", os.path.getsize(self.segment_path(key)))
+        with open(self.segment_path(key), newline="", encoding="utf-8") as file:
+            return [row for row in csv.reader(file) if row and row != HEADER]
+
+    def _month_rows(self, key, changes):
+        """Segment ``key``'s rows with ``changes`` applied, and how many deletes matched."""
+        rows = self._segment_rows(key)
+        matched = 0
+        for lsn, op, day, category, amount, description in changes:
+            if op == "add":
+                rows.append([day, category, amount, description])
+                continue
+            i = _find_row(rows, day, amount, description, category)
+            if i is not None:
+                del rows[i]
+                matched += 1
+        return rows, matched
+
+    def _month_columns(self, key, changes):
+        if not changes:
+            return load_expenses(self.segment_path(key))
+        out = io.StringIO(newline="")
+        csv.writer(out).writerows(self._month_rows(key, changes)[0])
+        out.seek(0)
+        return parse_rows(out)
+
+    def _summary(self, key, changes):
+        """Manifest entry for ``key`` with ``changes`` applied, without reading the segment."""
+        entry = self.partitions.get(key)
+        if not changes:
+            return entry
+        entry = entry or {"rows": 0, "total": 0.0, "categories": {}, "malformed": 0}
+        rows = entry["rows"]
+        total = round(entry["total"] * 100)
+        categories = {category: round(value * 100) for category, value in entry["categories"].items()}
+        for lsn, op, day, category, amount, description in changes:
+            # Every journaled delete names a row that exists (see delete())
+            paise = round(amount * 100) if op == "add" else -round(amount * 100)
+            rows += 1 if op == "add" else -1
+            total += paise
+            categories[category] = categories.get(category, 0) + paise
+            if op == "delete" and not categories[category]:
+                del categories[category]
+        return dict(entry, rows=rows, total=total / 100,
+                    categories={category: value / 100 for category, value in categories.items()})
+
+    def _apply_records(self, records):
+        matched = 0
+        staged = {}
+        for key, changes in sorted(self._pending(records).items()):
+            rows, found = self._month_rows(key, changes)
+            matched += found
+            if rows:
+                path = staged[key] = self.segment_path(key) + ".ckpt"
+                _write_atomic(path, _rows_to_csv(rows))
+                self._scan(key, path)
+            else:
+                staged[key] = None
+                self.partitions.pop(key, None)
+
+        # The manifest is the commit point: once it names the staged files
+        # and the last applied record, the checkpoint can always be finished.
+        self.checkpoint_lsn = records[-1][0]
+        self.pending_renames = staged
+        _fsync_dir(self.directory)
+        self._save_manifest()
+        self._finish_renames()
+        self.journal.reset(self.checkpoint_lsn)
+        return matched
+
+    def append(self, day, category, amount, description):
+        """Journal one expense dated ``day`` (a date)."""
+        self.journal.append("add", day.isoformat(), category, amount, description)
+        self._maybe_checkpoint()
+
+    def batch(self):
+        """Context manager grouping many appends under a single fsync."""
+        return self.journal.batch()
+
+    def delete(self, day_text, amount, description, category=None):
+        """Remove the first row matching the given values (any category if None).
+
+        Returns the removed row as (ordinal, category, amount, description),
+        or None if no row matched. Only a delete that matches is journaled,
+        so the pending changes can be summed without reading the segment.
+        """
+        ordinal = parse_date_ordinal(day_text)
+        key = _month_key(ordinal)
+        rows = self._month_rows(key, self._pending().get(key, ()))[0]
+        i = _find_row(rows, day_text, amount, description, category)
+        if i is None:
+            return None
+        category = rows[i][1]
+        self.journal.append("delete", day_text, category, amount, description)
+        self._maybe_checkpoint()
+        return ordinal, category, round(float(rows[i][2]) * 100) / 100, description
+
+    def close(self):
+        self.checkpoint()
+        self.journal.close()
+
+    def load(self, start=None, end=None):
+        """ExpenseColumns for the rows dated within [start, end] (ordinals)."""
+        self.refresh()
+        pending = self._pending()
+        columns = ExpenseColumns()
+        for key in self.months(start, end, pending):
+            part = self._month_columns(key, pending.get(key))
+            first, last = _month_bounds(key)
+            if (start is None or start <= first) and (end is None or last <= end):
+                columns.extend(part)
+            else:
+                columns.extend(part.between(start, end))
+        return columns
+
+    def months(self, start=None, end=None, pending=None):
+        """Partition keys overlapping the ordinal range [start, end], in order."""
+        if pending is None:
+            pending = self._pending()
+        keys = []
+        for key in sorted(self.partitions.keys() | pending.keys()):
+            first, last = _month_bounds(key)
+            if (start is None or last >= start) and (end is None or first <= end):
+                entry = self._summary(key, pending.get(key))
+                if entry["rows"] or entry["malformed"]:
+                    keys.append(key)
+        return keys
+
+    def total(self):
+        pending = self._pending()
+        return sum(self._summary(key, pending.get(key))["total"] for key in self.months(pending=pending))
+
+    def malformed(self):
+        return sum(entry["malformed"] for entry in self.partitions.values())
+
+    def monthly_totals(self, start=None, end=None):
+        """{"YYYY-MM": total}; whole months come straight from the manifest."""
+        self.refresh()
+        pending = self._pending()
+        totals = {}
+        for key in self.months(start, end, pending):
+            first, last = _month_bounds(key)
+            if (start is None or start <= first) and (end is None or last <= end):
+                totals[key] = self._summary(key, pending.get(key))["total"]
+            else:
+                totals[key] = self._month_columns(key, pending.get(key)).between(start, end).total()
+        return totals
+
+    def rollups(self, start=None, end=None):
+        """{"YYYY-MM": (total, {category: total})} for every month overlapping [start, end].
+
+        Whole months, straight from the manifest; no segment is read.
+        """
+        self.refresh()
+        pending = self._pending()
+        rollups = {}
+        for key in self.months(start, end, pending):
+            entry = self._summary(key, pending.get(key))
+            rollups[key] = (entry["total"], dict(entry["categories"]))
+        return rollups
+
+    def category_totals(self, start=None, end=None):
+        self.refresh()
+        pending = self._pending()
+        totals = {}
+        for key in self.months(start, end, pending):
+            first, last = _month_bounds(key)
+            if (start is None or start <= first) and (end is None or last <= end):
+                items = self._summary(key, pending.get(key))["categories"].items()
+            else:
+                items = self._month_columns(key, pending.get(key)).between(start, end).category_totals().items()
+            for category, amount in items:
+                totals[category] = totals.get(category, 0.0) + amount
+        return totals
+
+
+def _find_row(rows, day, amount, description, category=None):
+    """Index of the first CSV row matching the given values, or None.
+
+    ``category`` of None matches any (journals written before deletes
+    recorded one).
+    """
+    for i, row in enumerate(rows):
+        if len(row) >= 4 and row[3] == description and _same_day(row[0], day) \
+                and _same_amount(row[2], amount) and category in (None, row[1]):
+            return i
+    return None
+
+
+def _same_day(text, day):
+    try:
+        return text == day or parse_date_ordinal(text) == parse_date_ordinal(day)
+    except ValueError:
+        return False
+
+
+def _same_amount(text, amount):
+    # Compared in paise, the resolution rows are held at in memory
+    try:
+        return round(float(text) * 100) == round(amount * 100)
+    except (ValueError, OverflowError):
+        return False
+
+
+# Report periods: label -> function of today's ordinal returning (start, end).
+PERIODS = {
+    "All Time": lambda today: (None, None),
+    "This Month": lambda today: (_month_bounds(_month_key(today))[0], today),
+    "Last 30 Days": lambda today: (today - 29, today),
+    "This Year": lambda today: (date(date.fromordinal(today).year, 1, 1).toordinal(), today),
+}
+
+
+# --- BUDGETS ---
+BUDGET_FILE = "budgets.json"
+
+
+class Budgets:
+    """Monthly spending limits checked against running per-month totals.
+
+    The config file sets a limit for each month's total, limits for single
+    categories, and optionally different limits for particular months::
+
+        {"monthly": 30000, "categories": {"Food": 8000, "Travel": 5000},
+         "months": {"2024-12": {"monthly": 45000, "categories": {"Travel": 20000}}},
+         "warn_at": 0.9}
+
+    ``track`` seeds the totals from the store's monthly rollups. After that
+    ``add`` bumps two counters and compares them with at most two limits,
+    so checking a new expense costs the same however long the history is.
+    """
+
+    def __init__(self, monthly=None, categories=None, months=None, warn_at=0.9):
+        self.monthly = monthly
+        self.categories = dict(categories or {})
+        self.months = {key: dict(value) for key, value in (months or {}).items()}
+        self.warn_at = warn_at
+        self.totals = {}
+        self.category_spent = {}
+
+    @classmethod
+    def load(cls, path=BUDGET_FILE):
+        """Budgets from ``path``; none at all if the file does not exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+        if not isinstance(config, dict):
+            raise ValueError(f"{path}: expected a JSON object")
+        # Checked here, where callers expect ValueError, rather than in add()
+        # halfway through saving an expense
+        _budget_limits(path, config)
+        months = config.get("months", {})
+        if not isinstance(months, dict):
+            raise ValueError(f"{path}: months must be a JSON object")
+        for key, override in months.items():
+            _month_bounds(key)  # rejects anything but YYYY-MM
+            _budget_limits(f"{path}: {key}", override)
+        warn_at = config.get("warn_at", 0.9)
+        if isinstance(warn_at, bool) or not isinstance(warn_at, (int, float)) or not 0 < warn_at <= 1:
+            raise ValueError(f"{path}: warn_at must be a fraction between 0 and 1, not {warn_at!r}")
+        return cls(config.get("monthly"), config.get("categories"), months, warn_at)
+
+    def __bool__(self):
+        return bool(self.monthly or self.categories or self.months)
+
+    def limits(self, month):
+        """(monthly limit or None, {category: limit}) in force for ``month``."""
+        override = self.months.get(month, {})
+        categories = self.categories
+        if "categories" in override:
+            categories = dict(categories, **override["categories"])
+        return override.get("monthly", self.monthly), categories
+
+    def track(self, rollups):
+        """Reset the running totals to ``ExpenseStore.rollups()``."""
+        self.totals = {}
+        self.category_spent = {}
+        for month, (total, categories) in rollups.items():
+            self.totals[month] = total
+            for category, amount in categories.items():
+                self.category_spent[month, category] = amount
+
+    def add(self, ordinal, category, amount):
+        """Count one expense; returns alert messages for the limits it reaches."""
+        month = _month_key(ordinal)
+        before = self.totals.get(month, 0.0)
+        self.totals[month] = before + amount
+        before_category = self.category_spent.get((month, category), 0.0)
+        self.category_spent[month, category] = before_category + amount
+        monthly, categories = self.limits(month)
+        alerts = []
+        for scope, limit, was in (("Monthly total", monthly, before),
+                                  (category, categories.get(category), before_category)):
+            message = self._alert(scope, month, limit, was, was + amount)
+            if message:
+                alerts.append(message)
+        return alerts
+
+    def remove(self, ordinal, category, amount):
+        """Uncount a deleted expense."""
+        month = _month_key(ordinal)
+        self.totals[month] = self.totals.get(month, 0.0) - amount
+        self.category_spent[month, category] = self.category_spent.get((month, category), 0.0) - amount
+
+    def _alert(self, scope, month, limit, before, after):
+        if not limit:
+            return None
+        if after > limit:
+            return f"{scope} for {month} is over budget: ₹{after:.2f} of ₹{limit:.2f} ({after / limit:.0%})"
+        if before < self.warn_at * limit <= after:
+            return f"{scope} for {month} has reached {after / limit:.0%} of its ₹{limit:.2f} budget"
+        return None
+
+    def check(self, months):
+        """[(month, scope, spent, limit)] for every limit set on ``months``."""
+        rows = []
+        for month in months:
+            monthly, categories = self.limits(month)
+            if monthly:
+                rows.append((month, "Monthly total", self.totals.get(month, 0.0), monthly))
+            for category, limit in sorted(categories.items()):
+                rows.append((month, category, self.category_spent.get((month, category), 0.0), limit))
+        return rows
+
+
+def _budget_limits(where, config):
+    """Raise ValueError unless ``config``'s monthly and category limits are positive numbers."""
+    if not isinstance(config, dict):
+        raise ValueError(f"{where}: expected a JSON object")
+    categories = config.get("categories", {})
+    if not isinstance(categories, dict):
+        raise ValueError(f"{where}: categories must be a JSON object")
+    limits = [("monthly", config["monthly"])] if config.get("monthly") is not None else []
+    for name, limit in limits + list(categories.items()):
+        if isinstance(limit, bool) or not isinstance(limit, (int, float)) \
+                or not (math.isfinite(limit) and limit > 0):
+            raise ValueError(f"{where}: the {name} budget must be a positive number, not {limit!r}")
+
+
+def _period_months(period, today=None):
+    """Month keys covered by a PERIODS label or a single "YYYY-MM"."""
+    today = today or date.today().toordinal()
+    if period in PERIODS:
+        start, end = PERIODS[period](today)
+        first = _month_key(start) if start is not None else None
+        return first, _month_key(end if end is not None else today)
+    _month_bounds(period)
+    return period, period
+
+
+def check_budgets(period="This Month", directory=DATA_DIR, legacy_file=FILENAME, budget_file=BUDGET_FILE):
+    """Print every budget for ``period`` against the manifest's rollups; returns how many are exceeded."""
+    budgets = Budgets.load(budget_file)
+    if not budgets:
+        print(f"No budgets set; create {budget_file} to add some.")
+        return 0
+    first, last = _period_months(period)
+    store = ExpenseStore(directory, legacy_file)
+    try:
+        start = _month_bounds(first)[0] if first is not None else None
+        rollups = store.rollups(start, _month_bounds(last)[1])
+    finally:
+        store.close()
+    budgets.track(rollups)
+    months = sorted(rollups)
+    if first is not None:
+        # Months without any spending still have budgets to report
+        months = []
+        key = first
+        while key <= last:
+            months.append(key)
+            key = _month_key(_month_bounds(key)[1] + 1)
+    exceeded = 0
+    for month, scope, spent, limit in budgets.check(months):
+        over = spent > limit
+        exceeded += over
+        flag = "OVER" if over else ("near" if spent >= budgets.warn_at * limit else "ok")
+        print(f"{month}  {scope:<15} ₹{spent:>12,.2f} / ₹{limit:>12,.2f}  {spent / limit:>5.0%}  {flag}")
+    return exceeded
+
+
+# Exit statuses of --check-budgets
+BUDGETS_OK, BUDGETS_EXCEEDED, BUDGETS_CONFIG_ERROR = 0, 1, 2
+
+
+def check_budgets_command(period="This Month", **kwargs):
+    """check_budgets for the command line: returns one of the BUDGETS_* exit statuses.
+
+    A bad budgets file or period is a configuration error, told apart from
+    an overspend so scripts can react differently.
+    """
+    try:
+        exceeded = check_budgets(period, **kwargs)
+    except (OSError, ValueError) as e:
+        print(f"Cannot check budgets: {e}", file=sys.stderr)
+        return BUDGETS_CONFIG_ERROR
+    return BUDGETS_EXCEEDED if exceeded else BUDGETS_OK
+
+
+# --- CHARTS ---
+class _Series:
+    """Paise per consecutive key (a day, week or month number), grown as keys arrive."""
+
+    def __init__(self):
+        self.base = None
+        self.values = array("q")
+
+    def add(self, key, paise):
+        if self.base is None:
+            self.base = key
+        elif key < self.base:
+            self.values[0:0] = array("q", bytes(8 * (self.base - key)))
+            self.base = key
+        i = key - self.base
+        if i >= len(self.values):
+            self.values.frombytes(bytes(8 * (i + 1 - len(self.values))))
+        self.values[i] += paise
+
+    def span(self, lo, hi):
+        """(first key, values) for the keys in [lo, hi] that exist."""
+        lo = lo if self.base is None else max(lo, self.base)
+        if self.base is None or hi < lo:
+            return lo, array("q")
+        return lo, self.values[lo - self.base:hi - self.base + 1]
+
+
+def _week_key(ordinal):
+    return (ordinal - 1) // 7  # ordinal 1 is a Monday
+
+
+def _month_number(ordinal):
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+class SpendingRollups:
+    """Spending per day, week and month, plus per category per day.
+
+    Built from the rows once, then kept current with ``add`` (a negative
+    amount undoes a delete), so charts query these arrays and never the
+    rows. Ten years of history is a few thousand entries per level.
+    """
+
+    LEVELS = {
+        "daily": (lambda ordinal: ordinal, lambda key: key),
+        "weekly": (_week_key, lambda key: key * 7 + 1),
+        "monthly": (_month_number, lambda key: date(key // 12, key % 12 + 1, 1).toordinal()),
+    }
+
+    def __init__(self):
+        self.series = {level: _Series() for level in self.LEVELS}
+        self.by_category = {}
+
+    @classmethod
+    def from_columns(cls, columns):
+        rollups = cls()
+        sums = {}
+        get = sums.get
+        for code, ordinal, value in zip(columns.category_codes, columns.ordinals, columns.paise):
+            key = code, ordinal
+            sums[key] = get(key, 0) + value
+        strings = columns.category_pool.strings
+        for (code, ordinal), paise in sorted(sums.items(), key=lambda item: item[0][1]):
+            rollups._add_paise(ordinal, strings[code], paise)
+        return rollups
+
+    def add(self, ordinal, category, amount):
+        self._add_paise(ordinal, category, round(amount * 100))
+
+    def _add_paise(self, ordinal, category, paise):
+        for level, (key, _) in self.LEVELS.items():
+            self.series[level].add(key(ordinal), paise)
+        series = self.by_category.get(category)
+        if series is None:
+            series = self.by_category[category] = _Series()
+        series.add(ordinal, paise)
+
+    def bounds(self):
+        """(first, last) ordinal with any spending recorded, or None."""
+        daily = self.series["daily"]
+        if daily.base is None:
+            return None
+        return daily.base, daily.base + len(daily.values) - 1
+
+    def count(self, level, start, end):
+        key, _ = self.LEVELS[level]
+        return key(end) - key(start) + 1
+
+    def pick_level(self, start, end, max_points):
+        """The finest level giving at most ``max_points`` points over [start, end]."""
+        for level in ("daily", "weekly"):
+            if self.count(level, start, end) <= max_points:
+                return level
+        return "monthly"
+
+    def points(self, level, start, end):
+        """[(ordinal, rupees)] for each ``level`` period overlapping [start, end]."""
+        key, first_day = self.LEVELS[level]
+        lo, values = self.series[level].span(key(start), key(end))
+        return [(first_day(lo + i), value / 100) for i, value in enumerate(values)]
+
+    def category_totals(self, start, end):
+        totals = {}
+        for category, series in self.by_category.items():
+            _, values = series.span(start, end)
+            paise = sum(values)
+            if paise:
+                totals[category] = paise / 100
+        return totals
+
+
+def lttb(points, threshold):
+    """Downsample [(x, y)] to ``threshold`` points with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last point and, from each bucket in between, the
+    point forming the largest triangle with the previous pick and the next
+    bucket's average, which preserves peaks that plain striding drops.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        following = points[end:next_end]
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+class ChartPanel:
+    """Spending over time and by category, drawn on a Canvas from SpendingRollups.
+
+    Dragging pans and the mouse wheel zooms. Either way the visible range is
+    re-queried from the rollups at the finest level that gives at most a few
+    points per pixel, then downsampled with lttb to the plot's width.
+    """
+
+    WIDTH, HEIGHT = 760, 480
+    LEFT, RIGHT, TOP, LINE_BOTTOM = 80, 20, 30, 280
+    MIN_SPAN = 14
+
+    def __init__(self, master, rollups):
+        self.rollups = rollups
+        self.window = tk.Toplevel(master)
+        self.window.title("Spending Charts")
+        self.canvas = tk.Canvas(self.window, width=self.WIDTH, height=self.HEIGHT, bg="white",
+                                highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+        self.draw_ms = 0.0
+        self.reset_view()
+        self._drag = None
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<ButtonPress-1>", self._start_drag)
+        self.canvas.bind("<B1-Motion>", self._pan)
+        self.canvas.bind("<MouseWheel>", lambda e: self._zoom(e.x, 0.8 if e.delta > 0 else 1.25))
+        self.canvas.bind("<Button-4>", lambda e: self._zoom(e.x, 0.8))
+        self.canvas.bind("<Button-5>", lambda e: self._zoom(e.x, 1.25))
+        self.window.bind("<Home>", lambda e: (self.reset_view(), self.redraw()))
+
+    def alive(self):
+        return bool(self.window.winfo_exists())
+
+    def reset_view(self):
+        today = date.today().toordinal()
+        first, last = self.rollups.bounds() or (today - 30, today)
+        self.start, self.end = first, max(last, first + self.MIN_SPAN)
+
+    def _plot_width(self):
+        width = self.canvas.winfo_width()
+        if width <= 1:  # not mapped yet
+            width = self.WIDTH
+        return max(50, width - self.LEFT - self.RIGHT)
+
+    def _start_drag(self, event):
+        self._drag = (event.x, self.start, self.end)
+
+    def _pan(self, event):
+        if self._drag is None:
+            return
+        x, start, end = self._drag
+        shift = round((x - event.x) / self._plot_width() * (end - start))
+        self.start, self.end = start + shift, end + shift
+        self.redraw()
+
+    def _zoom(self, x, factor):
+        span = self.end - self.start
+        anchor = self.start + (x - self.LEFT) / self._plot_width() * span
+        new_span = max(self.MIN_SPAN, min(span * factor, 366 * 200))
+        self.start = round(anchor - (anchor - self.start) * new_span / span)
+        self.end = self.start + round(new_span)
+        self.redraw()
+
+    def redraw(self):
+        began = time.perf_counter()
+        canvas = self.canvas
+        canvas.delete("all")
+        plot_width = self._plot_width()
+        span = max(1, self.end - self.start)
+        level = self.rollups.pick_level(self.start, self.end, plot_width * 4)
+        points = lttb(self.rollups.points(level, self.start, self.end), plot_width)
+        peak = max((y for _, y in points), default=0.0) or 1.0
+        height = self.LINE_BOTTOM - self.TOP
+
+        canvas.create_line(self.LEFT, self.TOP, self.LEFT, self.LINE_BOTTOM, fill="#999")
+        canvas.create_line(self.LEFT, self.LINE_BOTTOM, self.LEFT + plot_width, self.LINE_BOTTOM, fill="#999")
+        canvas.create_text(self.LEFT - 6, self.TOP, text=f"₹{peak:,.0f}", anchor="e")
+        canvas.create_text(self.LEFT - 6, self.LINE_BOTTOM, text="₹0", anchor="e")
+        canvas.create_text(self.LEFT, self.LINE_BOTTOM + 12, anchor="w",
+                           text=date.fromordinal(max(1, self.start)).isoformat())
+        canvas.create_text(self.LEFT + plot_width, self.LINE_BOTTOM + 12, anchor="e",
+                           text=date.fromordinal(max(1, self.end)).isoformat())
+        coords = []
+        for x, y in points:
+            coords.append(self.LEFT + (x - self.start) / span * plot_width)
+            coords.append(self.LINE_BOTTOM - y / peak * height)
+        if len(coords) >= 4:
+            canvas.create_line(*coords, fill="#4f46e5", width=2)
+        elif coords:
+            canvas.create_oval(coords[0] - 2, coords[1] - 2, coords[0] + 2, coords[1] + 2, fill="#4f46e5")
+
+        totals = sorted(self.rollups.category_totals(self.start, self.end).items(), key=lambda item: -item[1])
+        top = self.LINE_BOTTOM + 40
+        largest = totals[0][1] if totals else 1.0
+        for i, (category, total) in enumerate(totals[:8]):
+            y = top + i * 22
+            canvas.create_text(self.LEFT - 6, y + 8, text=category, anchor="e")
+            canvas.create_rectangle(self.LEFT, y, self.LEFT + total / largest * (plot_width - 90), y + 16,
+                                    fill="#a5b4fc", outline="")
+            canvas.create_text(self.LEFT + total / largest * (plot_width - 90) + 6, y + 8,
+                               text=f"₹{total:,.2f}", anchor="w")
+
+        self.draw_ms = (time.perf_counter() - began) * 1e3
+        PROFILE.add_time("chart redraw", self.draw_ms / 1e3)
+        canvas.create_text(self.LEFT + plot_width, 12, anchor="e", fill="#666",
+                           text=f"{level}, {len(points)} points, {self.draw_ms:.1f} ms  (drag to pan, wheel to zoom, Home to reset)")
+
+
+# --- DUPLICATES ---
+_DAY_BITS = 22  # date.max.toordinal() < 2**22
+_LABEL_BITS = 42
+
+
+class DuplicateIndex:
+    """How many stored expenses share each content, for O(1) duplicate checks.
+
+    A near key packs the amount in paise with the date ordinal into one
+    int; an exact key adds a code for the (category, description) pair.
+    Neighbouring days of the same amount are neighbouring near keys, so a
+    near duplicate (same amount within a day either side) is three lookups.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.exact = {}
+        self.near = {}
+
+    @classmethod
+    def from_columns(cls, columns):
+        index = cls()
+        exact, near, labels = index.exact, index.near, index.labels
+        exact_get, near_get = exact.get, near.get
+        categories = columns.category_pool.strings
+        descriptions = columns.description_pool.strings
+        memo = {}
+        for ordinal, paise, category, description in zip(
+            columns.ordinals, columns.paise, columns.category_codes, columns.description_codes
+        ):
+            pair = category << 32 | description
+            label = memo.get(pair)
+            if label is None:
+                label = memo[pair] = labels.setdefault(
+                    (categories[category], descriptions[description]), len(labels))
+            key = paise << _DAY_BITS | ordinal
+            near[key] = near_get(key, 0) + 1
+            key = key << _LABEL_BITS | label
+            exact[key] = exact_get(key, 0) + 1
+        return index
+
+    def _keys(self, ordinal, category, amount, description):
+        near = round(amount * 100) << _DAY_BITS | ordinal
+        label = self.labels.setdefault((category, description), len(self.labels))
+        return near, near << _LABEL_BITS | label
+
+    def add(self, ordinal, category, amount, description):
+        for counts, key in zip((self.near, self.exact), self._keys(ordinal, category, amount, description)):
+            counts[key] = counts.get(key, 0) + 1
+
+    def remove(self, ordinal, category, amount, description):
+        for counts, key in zip((self.near, self.exact), self._keys(ordinal, category, amount, description)):
+            left = counts.get(key, 0) - 1
+            if left > 0:
+                counts[key] = left
+            else:
+                counts.pop(key, None)
+
+    def check(self, ordinal, category, amount, description):
+        """"exact", "near" or None for an expense that is about to be added."""
+        near = round(amount * 100) << _DAY_BITS | ordinal
+        label = self.labels.get((category, description))
+        if label is not None and near << _LABEL_BITS | label in self.exact:
+            return "exact"
+        counts = self.near
+        if near in counts or near - 1 in counts or near + 1 in counts:
+            return "near"
+        return None
+
+    def screen(self, columns, skip_exact=True):
+        """Check a bulk import row by row, indexing each row that goes in.
+
+        Returns the positions of exact and of near duplicates. Near ones go
+        in, and exact ones too unless ``skip_exact`` (the caller skips them),
+        so a copy within the import itself is caught as well.
+        """
+        exact, near, labels = self.exact, self.near, self.labels
+        categories = columns.category_pool.strings
+        descriptions = columns.description_pool.strings
+        memo = {}
+        exact_rows, near_rows = [], []
+        for i, (ordinal, paise, category, description) in enumerate(zip(
+            columns.ordinals, columns.paise, columns.category_codes, columns.description_codes
+        )):
+            pair = category << 32 | description
+            label = memo.get(pair)
+            if label is None:
+                label = memo[pair] = labels.setdefault(
+                    (categories[category], descriptions[description]), len(labels))
+            near_key = paise << _DAY_BITS | ordinal
+            exact_key = near_key << _LABEL_BITS | label
+            if exact_key in exact:
+                exact_rows.append(i)
+                if skip_exact:
+                    continue
+            elif near_key in near or near_key - 1 in near or near_key + 1 in near:
+                near_rows.append(i)
+            near[near_key] = near.get(near_key, 0) + 1
+            exact[exact_key] = exact.get(exact_key, 0) + 1
+        return exact_rows, near_rows
+
 
 class BudgetTrackerApp:
     def __init__(self, root):
@@ -18,6 +1572,13 @@ class BudgetTrackerApp:
             self.root.destroy()
             return
 
+        # Built the first time the charts are opened, then kept current
+        self.rollups = None
+        self.charts = None
+        # Built on the first save, then kept current
+        self.duplicates = None
+        self.diagnostics = None
+
         # --- UI SECTION 1: INPUTS ---
         input_frame = ttk.LabelFrame(root, text="Add New Expense")
         input_frame.pack(fill="x", padx=10, pady=5)
@@ -46,11 +1607,19 @@ class BudgetTrackerApp:
 
         columns = ("Date", "Category", "Amount", "Description")
         self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
-        
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
-        scrollbar.pack(side="right", fill="y")
+
+        # Only the rows in view exist as Tk items; the scrollbar decides which
+        # rows those are and render_rows formats just them.
+        self.view = ExpenseColumns()
+        self.first_row = 0
+        self.page_size = 15
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.scroll_rows)
+        self.tree.bind("<Configure>", self.resize_rows)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_rows("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_rows("scroll", -1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_rows("scroll", 1, "units"))
+
+        self.scrollbar.pack(side="right", fill="y")
         self.tree.pack(side="left", fill="both", expand=True)
 
         for col in columns:
@@ -65,8 +1634,18 @@ class BudgetTrackerApp:
         ttk.Button(action_frame, text="📊 Monthly Report", command=self.generate_monthly_report).pack(side="left", padx=10, pady=10)
         ttk.Button(action_frame, text="🥧 Category Report", command=self.generate_category_report).pack(side="left", padx=10, pady=10)
         
+        ttk.Button(action_frame, text="📈 Charts", command=self.open_charts).pack(side="left", padx=10, pady=10)
+        ttk.Button(action_frame, text="🩺 Diagnostics", command=self.open_diagnostics).pack(side="left", padx=10, pady=10)
+        
         # Refresh button in case user edited file externally
-        ttk.Button(action_frame, text="🔄 Refresh Data", command=self.load_data).pack(side="left", padx=10, pady=10)
+        ttk.Button(action_frame, text="🔄 Refresh Data", command=self.refresh_data).pack(side="left", padx=10, pady=10)
+
+        # Table, total and reports only read the months in this period
+        self.period_var = tk.StringVar(value="All Time")
+        period_box = ttk.Combobox(action_frame, textvariable=self.period_var, values=list(PERIODS),
+                                  state="readonly", width=12)
+        period_box.pack(side="left", padx=10, pady=10)
+        period_box.bind("<<ComboboxSelected>>", lambda event: self.load_data())
 
         self.total_label = ttk.Label(action_frame, text="Total: ₹0.00", font=("Arial", 12, "bold"))
         self.total_label.pack(side="right", padx=20)
@@ -76,17 +1655,25 @@ class BudgetTrackerApp:
     def initialize_file(self):
         """Safely checks file existence and permissions"""
         try:
-            if not os.path.exists(FILENAME):
-                with open(FILENAME, mode='w', newline='', encoding='utf-8') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(["Date", "Category", "Amount", "Description"])
-            return True
+            # Migrates a single expenses.csv into monthly segments on first run
+            self.store = ExpenseStore(DATA_DIR, FILENAME)
         except PermissionError:
-            messagebox.showerror("CRITICAL ERROR", f"Cannot access '{FILENAME}'.\n\nIs the file open in Excel? Please close it and restart the app.")
+            messagebox.showerror("CRITICAL ERROR", f"Cannot access '{DATA_DIR}'.\n\nIs a file open in Excel? Please close it and restart the app.")
             return False
         except Exception as e:
             messagebox.showerror("Error", f"System Error: {e}")
             return False
+        try:
+            self.budgets = Budgets.load(BUDGET_FILE)
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Budgets", f"Ignoring {BUDGET_FILE}: {e}")
+            self.budgets = Budgets()
+        self.budgets_stale = True  # tracked on the first load_data
+        return True
+
+    def period(self):
+        """(start, end) date ordinals for the selected period; None means open-ended."""
+        return PERIODS[self.period_var.get()](date.today().toordinal())
 
     def add_expense(self):
         # 1. INPUT VALIDATION
@@ -101,65 +1688,149 @@ class BudgetTrackerApp:
         # Check for number validity
         try:
             amount = float(self.amount_var.get())
-            if amount <= 0:
+            if not math.isfinite(amount) or amount <= 0:
                 raise ValueError # Trigger the exception manually
         except ValueError:
             messagebox.showerror("Input Error", "Amount must be a positive number (e.g., 50 or 100.50).")
             return
 
-        date = datetime.now().strftime("%Y-%m-%d")
-
-        # 2. FILE WRITE SAFETY
+        # 2. DUPLICATE CHECK
+        today = date.today()
         try:
-            with open(FILENAME, mode='a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([date, category, amount, description])
-            
-            # Success UI Updates
+            with PROFILE.phase("duplicate check"):
+                if self.duplicates is None:
+                    self.duplicates = DuplicateIndex.from_columns(self.store.load())
+                duplicate = self.duplicates.check(today.toordinal(), category, amount, description)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load data: {e}")
+            return
+        if duplicate == "exact":
+            question = f"An identical {category} expense of ₹{amount:.2f} was already saved today.\n\nSave it again?"
+        elif duplicate == "near":
+            question = f"An expense of ₹{amount:.2f} was saved within the last day.\n\nSave this one as well?"
+        if duplicate and not messagebox.askyesno("Possible Duplicate", question):
+            return
+
+        # 3. FILE WRITE SAFETY
+        # Timed up to the confirmation; the dialog waits on the user
+        with PROFILE.phase("add_expense"):
+            try:
+                self.store.append(today, category, amount, description)
+            except PermissionError:
+                PROFILE.count("file locked errors")
+                messagebox.showerror("File Locked", "Could not save! Please close the CSV file if it is open in Excel.")
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+                return
+
+            # Saved: clear the form first so nothing below can prompt a second save
             self.category_entry.set('')
             self.amount_var.set(0.0)
             self.desc_var.set('')
+            self.duplicates.add(today.toordinal(), category, amount, description)
+            alerts = self.budgets.add(today.toordinal(), category, amount)
+            self.track_chart(today.toordinal(), category, amount)
             self.load_data()
+        if alerts:
+            messagebox.showwarning("Budget Alert", "Expense Saved!\n\n" + "\n".join(alerts))
+        else:
             messagebox.showinfo("Success", "Expense Saved!")
-            
-        except PermissionError:
-            messagebox.showerror("File Locked", "Could not save! Please close the CSV file if it is open in Excel.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
 
-    def load_data(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
+    def resize_rows(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        page_size = max(1, (event.height - row_height) // row_height)  # minus the heading
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.render_rows()
 
-        total = 0.0
-        
-        # 3. FILE READ SAFETY
+    def scroll_rows(self, action, amount, unit=None):
+        if action == "moveto":
+            self.first_row = int(float(amount) * len(self.view))
+        else:
+            self.first_row += int(amount) * (self.page_size if unit == "pages" else 1)
+        self.render_rows()
+        return "break"
+
+    def render_rows(self):
+        total = len(self.view)
+        self.first_row = max(0, min(self.first_row, total - self.page_size))
+        last = min(total, self.first_row + self.page_size)
+        with PROFILE.phase("render"):
+            self.tree.delete(*self.tree.get_children())
+            for i in range(self.first_row, last):
+                self.tree.insert("", "end", iid=str(i), values=self.view.display_values(i))
+        PROFILE.count("tk inserts", max(0, last - self.first_row))
+        if total:
+            self.scrollbar.set(self.first_row / total, min(1.0, (self.first_row + self.page_size) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def load_data(self):
+        # 4. FILE READ SAFETY
         try:
-            if os.path.exists(FILENAME):
-                with open(FILENAME, mode='r', encoding='utf-8') as file:
-                    reader = csv.reader(file)
-                    try:
-                        next(reader) # Skip header
-                    except StopIteration:
-                        pass # Empty file, do nothing
-
-                    for row in reader:
-                        if row and len(row) == 4: # Check for corrupted rows
-                            try:
-                                amount_val = float(row[2])
-                                display_row = [row[0], row[1], f"₹{row[2]}", row[3]]
-                                self.tree.insert("", "end", values=display_row)
-                                total += amount_val
-                            except ValueError:
-                                continue # Skip rows with bad number data
+            with PROFILE.phase("load_data"):
+                data = self.store.load(*self.period())
+
+                self.view = data
+                self.render_rows()
+                if self.budgets and self.budgets_stale:
+                    # Once at startup and after a refresh; saves and deletes
+                    # update the totals themselves, so checking stays O(1)
+                    self.budgets.track(self.store.rollups())
+                    self.budgets_stale = False
+
+                text = f"Total: ₹{data.total():.2f}"
+                if self.period_var.get() != "All Time":
+                    text += f"  (all time: ₹{self.store.total():.2f})"
+                if data.malformed:
+                    # Corrupted rows are left out of the table and the total
+                    text += f" ({data.malformed} unreadable rows skipped)"
+                self.total_label.config(text=text)
         except PermissionError:
+            PROFILE.count("file locked errors")
             messagebox.showerror("Error", "Cannot read data. Close the CSV file!")
-            return
         except Exception as e:
             messagebox.showerror("Error", f"Could not load data: {e}")
+
+    def refresh_data(self):
+        # Hand edits can touch any month, so the chart rollups, the
+        # duplicate index and the budget totals start over
+        self.rollups = None
+        self.duplicates = None
+        self.budgets_stale = True
+        with PROFILE.phase("refresh_data"):
+            if self.charts is not None and self.charts.alive():
+                self.rollups = self.charts.rollups = SpendingRollups.from_columns(self.store.load())
+                self.charts.redraw()
+            self.load_data()
+
+    def open_charts(self):
+        try:
+            if self.rollups is None:
+                with PROFILE.phase("open_charts"):
+                    self.rollups = SpendingRollups.from_columns(self.store.load())
+        except Exception as e:
+            messagebox.showerror("Chart Error", f"Could not load data: {e}")
+            return
+        if self.charts is not None and self.charts.alive():
+            self.charts.window.lift()
             return
+        self.charts = ChartPanel(self.root, self.rollups)
 
-        self.total_label.config(text=f"Total: ₹{total:.2f}")
+    def open_diagnostics(self):
+        if self.diagnostics is not None and self.diagnostics.alive():
+            self.diagnostics.refresh()
+            self.diagnostics.window.lift()
+            return
+        self.diagnostics = DiagnosticsPanel(self.root)
+
+    def track_chart(self, ordinal, category, amount):
+        if self.rollups is None:
+            return
+        self.rollups.add(ordinal, category, amount)
+        if self.charts is not None and self.charts.alive():
+            self.charts.redraw()
 
     def delete_expense(self):
         selected_item = self.tree.selection()
@@ -173,34 +1844,24 @@ class BudgetTrackerApp:
             return
 
         try:
-            selected_values = self.tree.item(selected_item)['values']
-            amount_str = str(selected_values[2]).replace("₹", "")
+            with PROFILE.phase("delete_expense"):
+                ordinal, category, amount, description = self.view.row(int(selected_item[0]))
 
-            with open(FILENAME, mode='r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                all_rows = list(reader)
+                # Journaled; the month's segment is rewritten at the next checkpoint
+                removed = self.store.delete(date.fromordinal(ordinal).isoformat(), amount, description, category)
+                if removed:
+                    # Bookkeeping follows the row the store removed
+                    ordinal, category, amount, description = removed
+                    self.budgets.remove(ordinal, category, amount)
+                    self.track_chart(ordinal, category, -amount)
+                    if self.duplicates is not None:
+                        self.duplicates.remove(ordinal, category, amount, description)
 
-            new_rows = [all_rows[0]]
-            deleted = False
-            
-            for row in all_rows[1:]:
-                # Robust comparison
-                if not deleted and len(row) >= 4 and \
-                   row[0] == str(selected_values[0]) and \
-                   float(row[2]) == float(amount_str) and \
-                   row[3] == str(selected_values[3]):
-                    deleted = True 
-                else:
-                    new_rows.append(row)
-
-            with open(FILENAME, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerows(new_rows)
-
-            self.load_data()
+                self.load_data()
             messagebox.showinfo("Success", "Record Deleted.")
 
         except PermissionError:
+            PROFILE.count("file locked errors")
             messagebox.showerror("File Locked", "Cannot delete! Please close the CSV file.")
         except Exception as e:
             messagebox.showerror("Error", f"Delete failed: {e}")
@@ -208,26 +1869,18 @@ class BudgetTrackerApp:
     def generate_monthly_report(self):
         totals = {} 
         try:
-            if os.path.exists(FILENAME):
-                with open(FILENAME, mode='r', encoding='utf-8') as file:
-                    reader = csv.reader(file)
-                    next(reader)
-                    for row in reader:
-                        if row and len(row) == 4:
-                            try:
-                                date_obj = datetime.strptime(row[0], "%Y-%m-%d")
-                                month_key = date_obj.strftime("%B-%Y")
-                                totals[month_key] = totals.get(month_key, 0) + float(row[2])
-                            except ValueError:
-                                continue
-
-            report_text = "--- Monthly Spending ---\n\n"
-            if not totals:
-                report_text += "No data available."
-            else:
-                for month, total in totals.items():
-                    report_text += f"{month}: ₹{total:.2f}\n"
-            
+            with PROFILE.phase("generate_monthly_report"):
+                for key, total in self.store.monthly_totals(*self.period()).items():
+                    month_key = date(int(key[:4]), int(key[5:]), 1).strftime("%B-%Y")
+                    totals[month_key] = total
+
+                report_text = "--- Monthly Spending ---\n\n"
+                if not totals:
+                    report_text += "No data available."
+                else:
+                    for month, total in totals.items():
+                        report_text += f"{month}: ₹{total:.2f}\n"
+
             messagebox.showinfo("Monthly Report", report_text)
             
         except Exception as e:
@@ -237,32 +1890,1595 @@ class BudgetTrackerApp:
         # Similar safety logic for category report
         totals = {} 
         try:
-            if os.path.exists(FILENAME):
-                with open(FILENAME, mode='r', encoding='utf-8') as file:
-                    reader = csv.reader(file)
-                    next(reader)
-                    for row in reader:
-                        if row and len(row) == 4:
-                            try:
-                                cat = row[1]
-                                totals[cat] = totals.get(cat, 0) + float(row[2])
-                            except ValueError:
-                                continue
-
-            report_text = "--- Spending by Category ---\n\n"
-            if not totals:
-                report_text += "No data available."
-            else:
-                for cat, total in totals.items():
-                    report_text += f"{cat}: ₹{total:.2f}\n"
-            
+            with PROFILE.phase("generate_category_report"):
+                totals = self.store.category_totals(*self.period())
+
+                report_text = "--- Spending by Category ---\n\n"
+                if not totals:
+                    report_text += "No data available."
+                else:
+                    for cat, total in totals.items():
+                        report_text += f"{cat}: ₹{total:.2f}\n"
+
             messagebox.showinfo("Category Report", report_text)
         except Exception as e:
             messagebox.showerror("Report Error", f"Could not generate report: {e}")
 
+# --- HTTP API ---
+class ExpenseIndex:
+    """In-memory copy of every expense, kept sorted by date, that serves reads.
+
+    Rows get integer ids for the lifetime of the process. Only the writer
+    thread mutates it; readers take the lock for the short time they copy
+    out a page or a report.
+
+    Positions shift on every insert, so ``id_ordinals`` maps an id to its
+    row's date instead (0 once removed): an id is found by bisecting to
+    that date and scanning the rows of that one day.
+    """
+
+    def __init__(self, columns):
+        self.rows = columns.take(sorted(range(len(columns)), key=columns.ordinals.__getitem__))
+        self.ids = array("q", range(len(self.rows)))
+        self.id_ordinals = array("l", self.rows.ordinals)
+        self.next_id = len(self.rows)
+        self.lock = threading.Lock()
+
+    def add(self, ordinal, category, amount, description):
+        with self.lock:
+            pos = bisect.bisect_right(self.rows.ordinals, ordinal)
+            row_id = self.next_id
+            self.next_id += 1
+            self.rows.insert(pos, ordinal, category, amount, description)
+            self.ids.insert(pos, row_id)
+            self.id_ordinals.append(ordinal)
+            return row_id
+
+    def _position(self, row_id):
+        if not 0 <= row_id < len(self.id_ordinals) or not self.id_ordinals[row_id]:
+            return None
+        lo, hi = self._span(self.id_ordinals[row_id], self.id_ordinals[row_id])
+        for pos in range(lo, hi):
+            if self.ids[pos] == row_id:
+                return pos
+        return None
+
+    def get(self, row_id):
+        with self.lock:
+            pos = self._position(row_id)
+            return None if pos is None else self._row(pos)
+
+    def remove(self, row_id):
+        with self.lock:
+            pos = self._position(row_id)
+            if pos is None:
+                raise KeyError(row_id)
+            self.rows.delete(pos)
+            del self.ids[pos]
+            self.id_ordinals[row_id] = 0
+
+    def _row(self, pos):
+        ordinal, category, amount, description = self.rows.row(pos)
+        return {
+            "id": self.ids[pos],
+            "date": date.fromordinal(ordinal).isoformat(),
+            "category": category,
+            "amount": amount,
+            "description": description,
+        }
+
+    def _span(self, start, end):
+        ordinals = self.rows.ordinals
+        lo = 0 if start is None else bisect.bisect_left(ordinals, start)
+        hi = len(ordinals) if end is None else bisect.bisect_right(ordinals, end)
+        return lo, hi
+
+    def query(self, start=None, end=None, category=None, offset=0, limit=100):
+        """One page of rows in date order plus the number of rows that match."""
+        with self.lock:
+            lo, hi = self._span(start, end)
+            if category is None:
+                matched = hi - lo
+                positions = range(lo + offset, min(hi, lo + offset + limit))
+            else:
+                code = self.rows.category_pool.codes.get(category)
+                codes = self.rows.category_codes
+                hits = [pos for pos in range(lo, hi) if codes[pos] == code]
+                matched = len(hits)
+                positions = hits[offset:offset + limit]
+            return [self._row(pos) for pos in positions], matched
+
+    def monthly_totals(self, start=None, end=None):
+        with self.lock:
+            lo, hi = self._span(start, end)
+            paise = {}
+            keys = {}
+            for ordinal, value in zip(self.rows.ordinals[lo:hi], self.rows.paise[lo:hi]):
+                key = keys.get(ordinal)
+                if key is None:
+                    key = keys[ordinal] = _month_key(ordinal)
+                paise[key] = paise.get(key, 0) + value
+            return {key: value / 100 for key, value in paise.items()}
+
+    def category_totals(self, start=None, end=None):
+        with self.lock:
+            lo, hi = self._span(start, end)
+            return self.rows.category_totals(lo, hi)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_expense(item):
+    if not isinstance(item, dict):
+        raise ApiError(400, "Each expense must be a JSON object")
+    category = item.get("category")
+    if not isinstance(category, str) or not category:
+        raise ApiError(400, "category is required")
+    amount = item.get("amount")
+    try:
+        # json.loads accepts Infinity and NaN; neither can be stored or summed
+        valid = not isinstance(amount, bool) and isinstance(amount, (int, float)) \
+            and math.isfinite(amount) and amount > 0
+    except OverflowError:
+        valid = False
+    if not valid:
+        raise ApiError(400, "amount must be a positive number")
+    description = item.get("description", "")
+    if not isinstance(description, str) or "\n" in description:
+        raise ApiError(400, "description must be a single line of text")
+    try:
+        day = date.fromordinal(parse_date_ordinal(item["date"])) if "date" in item else date.today()
+    except (TypeError, ValueError):
+        raise ApiError(400, "date must be YYYY-MM-DD")
+    return day, category, float(amount), description
+
+
+def _columns_from_rows(rows):
+    """ExpenseColumns for (date, category, amount, description) rows from _parse_expense."""
+    columns = ExpenseColumns()
+    for day, category, amount, description in rows:
+        columns.append(day.toordinal(), category, amount, description)
+    return columns
+
+
+class ExpenseService:
+    """Single-writer front end shared by every request handler.
+
+    Writes are queued to one writer thread, which applies whatever has
+    queued up under one journal batch (one fsync) and then publishes the
+    rows to the index. Reads go straight to the index.
+
+    The index always gets the rows that reached the journal, so it agrees
+    with the store even when a write fails partway or its fsync fails; the
+    request is still answered with the error.
+    """
+
+    MAX_BATCH = 512
+    TIMEOUT = 60  # seconds a request waits for the writer
+
+    def __init__(self, store):
+        self.store = store
+        self.index = ExpenseIndex(store.load())
+        self.duplicates = DuplicateIndex.from_columns(self.index.rows)  # writer thread only
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="expense-writer", daemon=True)
+        self._writer.start()
+
+    def submit(self, op, payload):
+        future = Future()
+        self._queue.put((op, payload, future))
+        try:
+            return future.result(timeout=self.TIMEOUT)
+        except FutureTimeoutError:
+            raise ApiError(503, "Timed out waiting for the write; it may still be applied") from None
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self.store.close()
+
+    def _write_loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.MAX_BATCH:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in jobs
+            jobs = [job for job in jobs if job is not None]
+            results = []
+            failure = None
+            try:
+                with self.store.batch():
+                    for op, payload, future in jobs:
+                        try:
+                            results.append((future, self._apply(op, payload), None))
+                        except Exception as e:
+                            results.append((future, None, e))
+            except Exception as e:
+                # The fsync failed: every reply in the batch reports it
+                failure = e
+            # Only now are the journal records durable; publish and reply.
+            for future, publish, error in results:
+                if error is None:
+                    try:
+                        value = publish()
+                    except Exception as e:
+                        error = e
+                if error is None and failure is not None:
+                    error = failure
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(value)
+            if stop:
+                return
+
+    def _apply(self, op, payload):
+        # Runs inside the journal batch; returns what to do once it is synced.
+        if op == "add":
+            rows, skip_exact = payload
+            exact, near = self.duplicates.screen(_columns_from_rows(rows), skip_exact)
+            kinds = [None] * len(rows)
+            for kind, positions in (("exact", exact), ("near", near)):
+                for i in positions:
+                    kinds[i] = kind
+            added = [row for row, kind in zip(rows, kinds) if not (kind == "exact" and skip_exact)]
+            saved = 0
+            error = None
+            try:
+                for day, category, amount, description in added:
+                    self.store.append(day, category, amount, description)
+                    saved += 1
+            except Exception as e:
+                # screen() indexed every row; forget the ones never journaled
+                error = e
+                for day, category, amount, description in added[saved:]:
+                    self.duplicates.remove(day.toordinal(), category, amount, description)
+
+            def publish():
+                ids = iter([self.index.add(day.toordinal(), category, amount, description)
+                            for day, category, amount, description in added[:saved]])
+                if error is not None:
+                    raise error
+                return [None if kind == "exact" and skip_exact else next(ids) for kind in kinds], kinds
+            return publish
+        if op == "delete":
+            row = self.index.get(payload)
+            if row is None:
+                raise ApiError(404, "No such expense")
+            removed = self.store.delete(row["date"], row["amount"], row["description"], row["category"])
+            if removed is None:
+                raise ApiError(409, "Expense changed on disk; reload and retry")
+            self.duplicates.remove(*removed)
+            return lambda: self.index.remove(payload)
+        raise ValueError(op)
+
+
+def _query_date(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_date_ordinal(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be YYYY-MM-DD")
+
+
+def _query_skip(params):
+    value = params.get("duplicates", "flag")
+    if value not in ("flag", "skip"):
+        raise ApiError(400, "duplicates must be flag or skip")
+    return value == "skip"
+
+
+def _query_int(params, name, default, maximum):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if not 0 <= value <= maximum:
+        raise ApiError(400, f"{name} must be between 0 and {maximum}")
+    return value
+
+
+class ExpenseRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints over an ExpenseService.
+
+    POST   /expenses           {"category", "amount", "description"?, "date"?}
+    POST   /expenses/bulk      [expense, ...]
+           ?duplicates=flag    add everything, reporting exact and near duplicates
+           ?duplicates=skip    leave out exact duplicates (their id is null)
+    DELETE /expenses/<id>
+    GET    /expenses?start=&end=&category=&offset=&limit=
+    GET    /reports/monthly?start=&end=
+    GET    /reports/category?start=&end=
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    timeout = 30  # close idle keep-alive connections
+    service = None
+    MAX_BODY = 16 * 1024 * 1024
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would dominate under load
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body can't be skipped without a length, so drop the connection
+            self.close_connection = True
+            raise ApiError(400, "Invalid Content-Length")
+        if length > self.MAX_BODY:
+            self.close_connection = True
+            raise ApiError(413, "Request body too large")
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            raise ApiError(400, "Body must be JSON")
+
+    def _dispatch(self, handler):
+        try:
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status, body = handler(url.path.rstrip("/"), params)
+        except ApiError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"Internal error: {e}"}
+        self._send(status, body)
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_POST(self):
+        self._dispatch(self._post)
+
+    def do_DELETE(self):
+        self._dispatch(self._delete)
+
+    def _get(self, path, params):
+        index = self.service.index
+        start, end = _query_date(params, "start"), _query_date(params, "end")
+        if path == "/expenses":
+            offset = _query_int(params, "offset", 0, 10**12)
+            limit = _query_int(params, "limit", 100, 1000)
+            items, matched = index.query(start, end, params.get("category"), offset, limit)
+            next_offset = offset + len(items) if offset + len(items) < matched else None
+            return 200, {"items": items, "total": matched, "next_offset": next_offset}
+        if path == "/reports/monthly":
+            return 200, index.monthly_totals(start, end)
+        if path == "/reports/category":
+            return 200, index.category_totals(start, end)
+        raise ApiError(404, "Not found")
+
+    def _post(self, path, params):
+        body = self._body()
+        skip = _query_skip(params)
+        if path == "/expenses":
+            (row_id,), (kind,) = self.service.submit("add", ([_parse_expense(body)], skip))
+            return (200 if row_id is None else 201), {"id": row_id, "duplicate": kind}
+        if path == "/expenses/bulk":
+            if not isinstance(body, list):
+                raise ApiError(400, "Body must be a JSON list of expenses")
+            ids, kinds = self.service.submit("add", ([_parse_expense(item) for item in body], skip))
+            return 201, {"ids": ids, "duplicates": {
+                kind: [i for i, found in enumerate(kinds) if found == kind] for kind in ("exact", "near")
+            }}
+        raise ApiError(404, "Not found")
+
+    def _delete(self, path, params):
+        prefix = "/expenses/"
+        if not path.startswith(prefix) or not path[len(prefix):].isdigit():
+            raise ApiError(404, "Not found")
+        self.service.submit("delete", int(path[len(prefix):]))
+        return 200, {"deleted": True}
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles connections on a fixed-size thread pool."""
+
+    request_queue_size = 128
+
+    def __init__(self, address, handler, workers=64):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def make_server(host="127.0.0.1", port=8765, directory=DATA_DIR, legacy_file=FILENAME, workers=64):
+    service = ExpenseService(ExpenseStore(directory, legacy_file))
+    handler = type("BoundExpenseHandler", (ExpenseRequestHandler,), {"service": service})
+    server = PooledHTTPServer((host, port), handler, workers)
+    server.service = service
+    return server
+
+
+def serve(host="127.0.0.1", port=8765):
+    server = make_server(host, port)
+    print(f"Serving expenses API on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+# --- TESTS ---
+class TestStoreRestart(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.directory = os.path.join(self._tmp.name, "expenses")
+
+    def open_store(self):
+        return ExpenseStore(self.directory, None, durability="off")
+
+    def test_appends_after_restart_are_kept(self):
+        store = self.open_store()
+        store.append(date(2025, 1, 1), "Food", 10.0, "a")
+        store.append(date(2025, 1, 2), "Food", 20.0, "b")
+        store.close()
+        for amount in (30.0, 40.0):
+            store = self.open_store()
+            store.append(date(2025, 1, 3), "Food", amount, "c")
+            store.close()
+        store = self.open_store()
+        self.assertEqual(store.total(), 100.0)
+        self.assertEqual(len(store.load()), 4)
+        store.close()
+
+    def test_lsn_continues_from_checkpoint(self):
+        store = self.open_store()
+        store.append(date(2025, 1, 1), "Food", 10.0, "a")
+        store.close()
+        store = self.open_store()
+        self.assertEqual(store.journal.last_lsn, store.checkpoint_lsn)
+        store.close()
+
+
+
+class TestStoreReads(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ExpenseStore(os.path.join(tmp.name, "expenses"), None, durability="off")
+        self.addCleanup(self.store.close)
+        self.store.append(date(2025, 1, 5), "Food", 10.0, "a")
+        self.store.append(date(2025, 2, 5), "Rent", 100.0, "b")
+        self.store.checkpoint()
+
+    def state(self):
+        store = self.store
+        jan = _month_bounds("2025-01")
+        return (store.total(), len(store.load()), store.rollups(), store.monthly_totals(),
+                store.category_totals(), store.category_totals(jan[0], jan[0] + 9),
+                store.monthly_totals(jan[0], jan[0] + 9), store.months())
+
+    def test_reads_do_not_rewrite_segments(self):
+        segment = self.store.segment_path("2025-01")
+        before = os.stat(segment).st_mtime_ns
+        self.store.append(date(2025, 1, 6), "Food", 5.0, "c")
+        self.store.load()
+        self.store.total()
+        self.store.rollups()
+        self.assertEqual(os.stat(segment).st_mtime_ns, before)
+        self.assertEqual(len(self.store.journal.records), 1)
+
+    def test_reads_match_checkpointed_state(self):
+        store = self.store
+        store.append(date(2025, 1, 6), "Food", 5.25, "c")
+        store.append(date(2025, 1, 20), "Travel", 7.0, "d")
+        store.append(date(2025, 3, 1), "Food", 1.5, "e")
+        self.assertTrue(store.delete("2025-02-05", 100.0, "b"))
+        self.assertTrue(store.delete("2025-01-06", 5.25, "c"))
+        self.assertIsNone(store.delete("2025-01-06", 5.25, "c"))
+        pending = self.state()
+        self.assertEqual(pending[0], 18.5)
+        self.assertNotIn("2025-02", pending[-1])
+        store.checkpoint()
+        self.assertEqual(self.state(), pending)
+
+    def test_delete_matches_category(self):
+        store = self.store
+        store.append(date(2025, 1, 5), "Travel", 10.0, "a")
+        self.assertEqual(store.delete("2025-01-05", 10.0, "a", "Travel"),
+                         (date(2025, 1, 5).toordinal(), "Travel", 10.0, "a"))
+        self.assertIsNone(store.delete("2025-01-05", 10.0, "a", "Travel"))
+        self.assertEqual(store.category_totals(), {"Food": 10.0, "Rent": 100.0})
+        store.checkpoint()
+        self.assertEqual(store.category_totals(), {"Food": 10.0, "Rent": 100.0})
+        self.assertEqual(store.delete("2025-01-05", 10.0, "a")[1], "Food")
+
+    def test_checkpoint_after_age(self):
+        self.store.checkpoint_age = 0
+        self.store.append(date(2025, 1, 6), "Food", 5.0, "c")
+        self.assertEqual(self.store.journal.records, [])
+        self.assertEqual(self.store.partitions["2025-01"]["rows"], 2)
+
+    def test_reset_replaces_journal(self):
+        store = self.store
+        store.append(date(2025, 1, 6), "Food", 5.0, "c")
+        store.append(date(2025, 1, 7), "Food", 6.0, "d")
+        store.journal.reset(store.journal.records[0][0])
+        store.append(date(2025, 1, 8), "Food", 7.0, "e")
+        self.assertFalse(os.path.exists(store.journal.path + ".tmp"))
+        with open(store.journal.path, "rb") as file:
+            lsns = [json.loads(line.partition(b" ")[2])[0] for line in file]
+        self.assertEqual(lsns, [store.journal.last_lsn - 1, store.journal.last_lsn])
+
+
+
+class TestParseExpense(unittest.TestCase):
+    def test_rejects_non_finite_amounts(self):
+        for text in ('Infinity', '-Infinity', 'NaN', '1e400', '10' * 200, 'true', '0', '-5', '"5"'):
+            with self.subTest(amount=text):
+                with self.assertRaises(ApiError) as caught:
+                    _parse_expense(json.loads(f'{{"category": "Food", "amount": {text}}}'))
+                self.assertEqual(caught.exception.status, 400)
+
+    def test_accepts_positive_amounts(self):
+        day, category, amount, description = _parse_expense(
+            {"category": "Food", "amount": 12, "date": "2025-01-05"})
+        self.assertEqual((day, category, amount, description), (date(2025, 1, 5), "Food", 12.0, ""))
+
+
+
+class TestBudgets(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "budgets.json")
+
+    def write(self, config):
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(config, file)
+
+    def load(self, config):
+        self.write(config)
+        return Budgets.load(self.path)
+
+    def test_rejects_bad_limits(self):
+        for config in ({"categories": {"Food": "50"}}, {"monthly": 0}, {"monthly": True},
+                       {"categories": {"Food": None}}, {"categories": ["Food"]},
+                       {"months": {"2025-01": {"monthly": -5}}}, {"months": {"2025-01": 5}},
+                       {"months": {"2025-13": {}}}, {"warn_at": "0.9"}, {"warn_at": 1.5}):
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    self.load(config)
+
+    def test_loaded_limits_alert(self):
+        budgets = self.load({"monthly": 100, "categories": {"Food": 50},
+                             "months": {"2025-01": {"categories": {"Food": 20}}}, "warn_at": 0.5})
+        ordinal = date(2025, 1, 5).toordinal()
+        self.assertEqual(len(budgets.add(ordinal, "Food", 30.0)), 1)
+        self.assertEqual(budgets.limits("2025-02"), (100, {"Food": 50}))
+
+    def test_check_budgets_exit_statuses(self):
+        directory = os.path.join(os.path.dirname(self.path), "expenses")
+        store = ExpenseStore(directory, None, durability="off")
+        store.append(date(2025, 1, 5), "Food", 60.0, "a")
+        store.close()
+
+        def status(period="2025-01"):
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as err:
+                code = check_budgets_command(period, budget_file=self.path, directory=directory, legacy_file=None)
+            return code, err.getvalue()
+
+        self.write({"categories": {"Food": 100}})
+        self.assertEqual(status(), (BUDGETS_OK, ""))
+        self.write({"categories": {"Food": 50}})
+        self.assertEqual(status(), (BUDGETS_EXCEEDED, ""))
+        self.assertEqual(status("2025-02")[0], BUDGETS_OK)
+        self.assertEqual(status("January")[0], BUDGETS_CONFIG_ERROR)
+        self.write({"categories": {"Food": "50"}})
+        code, err = status()
+        self.assertEqual(code, BUDGETS_CONFIG_ERROR)
+        self.assertIn("Food", err)
+
+    def test_incremental_tracking_matches_rollups(self):
+        directory = os.path.join(os.path.dirname(self.path), "expenses")
+        store = ExpenseStore(directory, None, durability="off")
+        self.addCleanup(store.close)
+        budgets = self.load({"monthly": 100})
+        budgets.track(store.rollups())
+        for day, category, amount in ((5, "Food", 30.0), (6, "Travel", 12.5), (6, "Food", 7.25)):
+            store.append(date(2025, 1, day), category, amount, "")
+            budgets.add(date(2025, 1, day).toordinal(), category, amount)
+        budgets.remove(*store.delete("2025-01-06", 12.5, "", "Travel")[:3])
+
+        def spent():
+            # In paise, leaving out what a delete brought back to nothing
+            return [{key: round(value * 100) for key, value in totals.items() if round(value * 100)}
+                    for totals in (budgets.totals, budgets.category_spent)]
+
+        incremental = spent()
+        budgets.track(store.rollups())
+        self.assertEqual(spent(), incremental)
+
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.service = ExpenseService(ExpenseStore(os.path.join(tmp.name, "expenses"), None, durability="off"))
+        self.addCleanup(self.service.close)
+        self.service.submit("add", ([(date(2025, 1, 5), "Food", 10.0, "lunch")], False))
+
+    def import_rows(self, skip):
+        rows = [(date(2025, 1, 5), "Food", 10.0, "lunch"), (date(2025, 1, 6), "Travel", 10.0, "taxi"),
+                (date(2025, 1, 9), "Food", 3.0, "tea"), (date(2025, 1, 9), "Food", 3.0, "tea")]
+        return self.service.submit("add", (rows, skip))
+
+    def test_skip_leaves_exact_copies_out(self):
+        ids, kinds = self.import_rows(True)
+        self.assertEqual(kinds, ["exact", "near", None, "exact"])
+        self.assertEqual([row_id is None for row_id in ids], [True, False, False, True])
+        self.assertEqual(self.service.store.total(), 23.0)
+        # Skipped rows are not indexed, so a second import sees the same
+        self.assertEqual(self.import_rows(True)[1], ["exact", "exact", "exact", "exact"])
+
+    def test_without_skip_everything_is_saved(self):
+        ids, kinds = self.import_rows(False)
+        self.assertEqual(kinds, ["exact", "near", None, "exact"])
+        self.assertNotIn(None, ids)
+        self.assertEqual(self.service.store.total(), 36.0)
+
+
+
+class TestExpenseService(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.service = ExpenseService(ExpenseStore(os.path.join(tmp.name, "expenses"), None, durability="group"))
+        self.addCleanup(self.service.close)
+        self.rows = [(date(2025, 1, day), "Food", float(day), f"row {day}") for day in range(1, 4)]
+
+    def stored(self):
+        return sorted(self.service.store.load().row(i)[2] for i in range(len(self.service.store.load())))
+
+    def indexed(self):
+        return sorted(self.service.index.rows.amount(i) for i in range(len(self.service.index.rows)))
+
+    def test_failed_sync_is_reported_and_writer_survives(self):
+        from unittest import mock
+
+        with mock.patch.object(self.service.store.journal, "sync", side_effect=OSError(28, "No space left")):
+            with self.assertRaises(OSError):
+                self.service.submit("add", (self.rows[:1], False))
+        ids, kinds = self.service.submit("add", (self.rows[1:2], False))
+        self.assertEqual(kinds, [None])
+        self.assertEqual(self.indexed(), self.stored())
+
+    def test_partial_bulk_add_keeps_index_and_store_in_step(self):
+        from unittest import mock
+
+        append = self.service.store.append
+        calls = []
+
+        def failing_append(*row):
+            calls.append(row)
+            if len(calls) == 2:
+                raise OSError(28, "No space left")
+            append(*row)
+
+        with mock.patch.object(self.service.store, "append", failing_append):
+            with self.assertRaises(OSError):
+                self.service.submit("add", (self.rows, False))
+        self.assertEqual(self.indexed(), self.stored())
+        self.assertEqual(self.indexed(), [1.0])
+        # The rows that were not saved can be added again without a warning
+        self.assertEqual(self.service.submit("add", (self.rows[1:], False))[1], [None, None])
+
+    def test_submit_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        apply = self.service._apply
+        self.service._apply = lambda op, payload: release.wait() and apply(op, payload)
+        self.service.TIMEOUT = 0.05
+        with self.assertRaises(ApiError) as caught:
+            self.service.submit("add", (self.rows[:1], False))
+        self.assertEqual(caught.exception.status, 503)
+
+    def test_index_lookup_by_id(self):
+        ids, _ = self.service.submit("add", (self.rows + self.rows[:1], False))
+        index = self.service.index
+        for row_id, row in zip(ids, self.rows + self.rows[:1]):
+            self.assertEqual((index.get(row_id)["id"], index.get(row_id)["amount"]), (row_id, row[2]))
+        index.remove(ids[0])
+        self.assertIsNone(index.get(ids[0]))
+        self.assertEqual(index.get(ids[3])["description"], "row 1")
+        for missing in (-1, ids[0], 10**6):
+            self.assertIsNone(index.get(missing))
+
+
+class TestHttpApi(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.server = make_server(port=0, directory=os.path.join(tmp.name, "expenses"), legacy_file=None, workers=8)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.service.close)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.conn = self.connect()
+
+    def connect(self):
+        import http.client
+
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        self.addCleanup(conn.close)
+        return conn
+
+    def call(self, method, path, body=None, conn=None, headers=None):
+        conn = conn or self.conn
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        conn.request(method, path, body=data, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def expense(self, day, amount, category="Food", description=""):
+        return {"date": f"2025-01-{day:02d}", "category": category, "amount": amount, "description": description}
+
+    def test_requests_share_a_keep_alive_connection(self):
+        self.assertEqual(self.call("POST", "/expenses", self.expense(1, 5.0))[0], 201)
+        sock = self.conn.sock
+        self.assertEqual(self.call("GET", "/expenses")[1]["total"], 1)
+        self.assertIs(self.conn.sock, sock)
+
+    def test_pagination_and_reports(self):
+        rows = [self.expense(day, float(day), "Food" if day % 2 else "Travel") for day in range(1, 8)]
+        status, body = self.call("POST", "/expenses/bulk", rows)
+        self.assertEqual((status, len(body["ids"])), (201, 7))
+        seen, offset = [], 0
+        while offset is not None:
+            page = self.call("GET", f"/expenses?limit=3&offset={offset}")[1]
+            self.assertEqual(page["total"], 7)
+            seen += [item["amount"] for item in page["items"]]
+            offset = page["next_offset"]
+        self.assertEqual(seen, [float(day) for day in range(1, 8)])
+        page = self.call("GET", "/expenses?category=Travel&start=2025-01-03&limit=1")[1]
+        self.assertEqual((page["total"], page["items"][0]["amount"], page["next_offset"]), (2, 4.0, 1))
+        self.assertEqual(self.call("GET", "/reports/monthly")[1], {"2025-01": 28.0})
+        self.assertEqual(self.call("GET", "/reports/category?end=2025-01-02")[1], {"Food": 1.0, "Travel": 2.0})
+
+    def test_duplicates_and_delete(self):
+        first = self.expense(3, 9.5, description="lunch")
+        row_id = self.call("POST", "/expenses", first)[1]["id"]
+        status, body = self.call("POST", "/expenses/bulk?duplicates=skip", [first, self.expense(4, 9.5)])
+        self.assertEqual((body["ids"][0], body["duplicates"]), (None, {"exact": [0], "near": [1]}))
+        self.assertEqual(self.call("POST", "/expenses?duplicates=skip", first), (200, {"id": None, "duplicate": "exact"}))
+        self.assertEqual(self.call("DELETE", f"/expenses/{row_id}"), (200, {"deleted": True}))
+        self.assertEqual(self.call("DELETE", f"/expenses/{row_id}")[0], 404)
+        self.assertEqual(self.call("GET", "/expenses")[1]["total"], 1)
+
+    def test_delete_removes_the_row_with_that_category(self):
+        ids = self.call("POST", "/expenses/bulk", [self.expense(2, 4.0, "Food"), self.expense(2, 4.0, "Travel")])[1]["ids"]
+        self.assertEqual(self.call("DELETE", f"/expenses/{ids[1]}")[0], 200)
+        self.assertEqual(self.server.service.store.category_totals(), {"Food": 4.0})
+        self.assertEqual(self.call("GET", "/reports/category")[1], {"Food": 4.0})
+
+    def test_bad_requests(self):
+        for method, path, body in (("POST", "/expenses", {"category": "Food", "amount": -1}),
+                                   ("POST", "/expenses/bulk", {"not": "a list"}),
+                                   ("POST", "/expenses?duplicates=maybe", self.expense(1, 1.0)),
+                                   ("GET", "/expenses?start=yesterday", None),
+                                   ("GET", "/expenses?limit=x", None)):
+            with self.subTest(path=path):
+                self.assertEqual(self.call(method, path, body)[0], 400)
+        self.assertEqual(self.call("GET", "/nowhere")[0], 404)
+        self.assertEqual(self.call("DELETE", "/expenses/abc")[0], 404)
+        for length in ("abc", "-5"):
+            with self.subTest(length=length):
+                status, body = self.call("POST", "/expenses", conn=self.connect(), headers={"Content-Length": length})
+                self.assertEqual(status, 400)
+
+    def test_concurrent_writers(self):
+        ids = []
+
+        def client(worker):
+            conn = self.connect()
+            for i in range(20):
+                ids.append(self.call("POST", "/expenses", self.expense(1 + i, 1.0, description=f"{worker}"), conn)[1]["id"])
+
+        threads = [threading.Thread(target=client, args=(worker,)) for worker in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 120)
+        self.assertEqual(self.call("GET", "/expenses?limit=1")[1]["total"], 120)
+        self.assertEqual(self.server.service.store.total(), 120.0)
+
+
+class TestLoader(unittest.TestCase):
+    ROWS = [
+        ["2025-01-05", "Food", "10.50", "lunch"],
+        ["2025-01-06", "Travel", "7", 'taxi, "airport", late'],
+        ["2025-1-7", "Food", "3.25", ""],
+        ["2025-01-08", "Food", "not a number", "bad amount"],
+        ["yesterday", "Food", "1", "bad date"],
+        ["2025-01-09", "Food", "2"],
+        ["2025-01-10", "Bills", "1e3", "rent, part 1"],
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "expenses.csv")
+        text = _rows_to_csv(self.ROWS * 40)
+        with open(self.path, "w", encoding="utf-8", newline="") as file:
+            file.write(text.rstrip("\r\n"))  # no trailing newline
+
+    @staticmethod
+    def contents(columns):
+        return [columns.row(i) for i in range(len(columns))], columns.malformed
+
+    def test_serial_load(self):
+        rows, malformed = self.contents(load_expenses(self.path, workers=1))
+        self.assertEqual(malformed, 3 * 40)
+        self.assertEqual(rows[:4], [
+            (date(2025, 1, 5).toordinal(), "Food", 10.5, "lunch"),
+            (date(2025, 1, 6).toordinal(), "Travel", 7.0, 'taxi, "airport", late'),
+            (date(2025, 1, 7).toordinal(), "Food", 3.25, ""),
+            (date(2025, 1, 10).toordinal(), "Bills", 1000.0, "rent, part 1"),
+        ])
+        self.assertEqual(len(rows), 4 * 40)
+
+    def test_ranges_end_on_line_boundaries(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        for parts in (1, 2, 7, 50, 10_000):
+            ranges = split_file(self.path, parts)
+            self.assertEqual((ranges[0][0], ranges[-1][1]), (0, len(data)))
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+                self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_chunked_parse_matches_serial(self):
+        serial = self.contents(load_expenses(self.path, workers=1))
+        for parts in (2, 7, 50, 10_000):
+            columns = ExpenseColumns()
+            for start, end in split_file(self.path, parts):
+                columns.extend(_parse_range(self.path, start, end))
+            self.assertEqual(self.contents(columns), serial, parts)
+
+    def test_parallel_load_matches_serial(self):
+        from unittest import mock
+
+        serial = self.contents(load_expenses(self.path, workers=1))
+        with mock.patch(f"{__name__}.PARALLEL_MIN_BYTES", 0):
+            self.assertEqual(self.contents(load_expenses(self.path, workers=3)), serial)
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(self.contents(load_expenses(self.path + ".gone")), ([], 0))
+
+class TestStoreLayout(unittest.TestCase):
+    LEGACY = [
+        ["2024-12-30", "Food", "12.5", "dinner"],
+        ["2025-01-02", "Travel", "40", "train"],
+        ["2025-01-15", "Food", "7.25", "lunch, late"],
+        ["2025-02-01", "Bills", "100", "rent"],
+        ["someday", "Food", "1", "no date"],
+        ["2025-02-03", "Food", "lots", "no amount"],
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.legacy = os.path.join(tmp.name, "expenses.csv")
+        with open(self.legacy, "w", encoding="utf-8", newline="") as file:
+            file.write(_rows_to_csv(self.LEGACY))
+        self.directory = os.path.join(tmp.name, "expenses")
+        self.store = ExpenseStore(self.directory, self.legacy, durability="off")
+        self.addCleanup(self.store.close)
+
+    def test_migration_splits_by_month(self):
+        self.assertFalse(os.path.exists(self.legacy))
+        self.assertTrue(os.path.exists(self.legacy + ".migrated"))
+        self.assertEqual(self.store.months(), ["2024-12", "2025-01", "2025-02"])
+        with open(self.store.segment_path("2025-01"), newline="", encoding="utf-8") as file:
+            self.assertEqual(list(csv.reader(file)), [HEADER] + self.LEGACY[1:3])
+        with open(os.path.join(self.directory, "unreadable.csv"), newline="", encoding="utf-8") as file:
+            self.assertEqual(list(csv.reader(file)), [HEADER] + self.LEGACY[4:])
+        self.assertEqual(len(self.store.load()), 4)
+
+    def test_manifest_totals(self):
+        with open(self.store.manifest_path, encoding="utf-8") as file:
+            partitions = json.load(file)["partitions"]
+        self.assertEqual({key: (entry["rows"], entry["total"]) for key, entry in partitions.items()},
+                         {"2024-12": (1, 12.5), "2025-01": (2, 47.25), "2025-02": (1, 100.0)})
+        self.assertEqual(partitions["2025-01"]["categories"], {"Travel": 40.0, "Food": 7.25})
+        self.assertEqual(self.store.total(), 159.75)
+        jan = _month_bounds("2025-01")
+        self.assertEqual(self.store.monthly_totals(jan[0] + 10, None), {"2025-01": 7.25, "2025-02": 100.0})
+        self.assertEqual(self.store.category_totals(None, jan[0] + 10), {"Food": 12.5, "Travel": 40.0})
+
+    def test_rollups_after_add_and_delete(self):
+        store = self.store
+        store.append(date(2025, 1, 20), "Food", 2.75, "tea")
+        store.append(date(2025, 3, 1), "Travel", 5.0, "bus")
+        self.assertTrue(store.delete("2025-02-01", 100.0, "rent"))
+        for _ in range(2):  # pending in the journal, then checkpointed
+            self.assertEqual(store.rollups(), {
+                "2024-12": (12.5, {"Food": 12.5}),
+                "2025-01": (50.0, {"Travel": 40.0, "Food": 10.0}),
+                "2025-03": (5.0, {"Travel": 5.0}),
+            })
+            store.checkpoint()
+        self.assertFalse(os.path.exists(store.segment_path("2025-02")))
+        reopened = ExpenseStore(self.directory, None, durability="off")
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.rollups(), store.rollups())
+
+    def test_hand_edited_segment_is_rescanned(self):
+        path = self.store.segment_path("2025-02")
+        with open(path, "a", encoding="utf-8", newline="") as file:
+            csv.writer(file).writerow(["2025-02-10", "Food", "4", "added by hand"])
+        self.assertEqual(self.store.rollups()["2025-02"], (104.0, {"Bills": 100.0, "Food": 4.0}))
+
+class TestColumns(unittest.TestCase):
+    DAY = date(2025, 1, 10).toordinal()
+
+    def columns(self, rows):
+        columns = ExpenseColumns()
+        for row in rows:
+            columns.append(*row)
+        return columns
+
+    def test_string_pool(self):
+        pool = StringPool()
+        self.assertEqual([pool.encode(text) for text in ("Food", "Bills", "Food")], [0, 1, 0])
+        self.assertEqual(len(pool), 2)
+        other = StringPool()
+        other.encode("Travel")
+        other.encode("Food")
+        self.assertEqual(pool.remap(other), [2, 0])
+        self.assertEqual(pool.strings, ["Food", "Bills", "Travel"])
+
+    def test_insert_and_delete_keep_columns_aligned(self):
+        day = self.DAY
+        columns = self.columns([(day, "Food", 1.5, "a"), (day + 2, "Bills", 20, "c")])
+        columns.insert(1, day + 1, "Travel", 3.25, "b")
+        columns.insert(0, day - 1, "Food", 0.1, "z")
+        self.assertEqual([columns.row(i) for i in range(len(columns))], [
+            (day - 1, "Food", 0.1, "z"), (day, "Food", 1.5, "a"),
+            (day + 1, "Travel", 3.25, "b"), (day + 2, "Bills", 20.0, "c"),
+        ])
+        columns.delete(2)
+        columns.delete(0)
+        self.assertEqual([columns.row(i) for i in range(len(columns))],
+                         [(day, "Food", 1.5, "a"), (day + 2, "Bills", 20.0, "c")])
+        self.assertEqual(len(columns.category_pool), 3)  # codes are never reclaimed
+        self.assertEqual(columns.display_values(1), ["2025-01-12", "Bills", "₹20.0", "c"])
+
+    def test_take_between_and_totals(self):
+        day = self.DAY
+        columns = self.columns([(day + i, ("Food", "Bills")[i % 2], i + 0.5, f"row {i}") for i in range(5)])
+        taken = columns.take([3, 0])
+        self.assertEqual([taken.row(i) for i in range(2)], [columns.row(3), columns.row(0)])
+        self.assertIs(taken.category_pool, columns.category_pool)
+        middle = columns.between(day + 1, day + 3)
+        self.assertEqual([middle.row(i)[0] for i in range(len(middle))], [day + 1, day + 2, day + 3])
+        self.assertEqual(len(columns.between(None, day)), 1)
+        self.assertEqual(columns.total(), 12.5)
+        self.assertEqual(columns.category_totals(), {"Food": 7.5, "Bills": 5.0})
+        self.assertEqual(columns.category_totals(1, 3), {"Bills": 1.5, "Food": 2.5})
+
+    def test_extend_remaps_other_pools(self):
+        day = self.DAY
+        first = self.columns([(day, "Food", 1, "x")])
+        second = self.columns([(day + 1, "Travel", 2, "y"), (day + 2, "Food", 3, "x")])
+        second.malformed = 2
+        first.extend(second)
+        self.assertEqual([first.row(i) for i in range(3)], [
+            (day, "Food", 1.0, "x"), (day + 1, "Travel", 2.0, "y"), (day + 2, "Food", 3.0, "x"),
+        ])
+        self.assertEqual(first.category_pool.strings, ["Food", "Travel"])
+        self.assertEqual(first.malformed, 2)
+
+
+class FakeTree:
+    def __init__(self):
+        self.rows = {}
+
+    def get_children(self):
+        return tuple(self.rows)
+
+    def delete(self, *iids):
+        for iid in iids:
+            del self.rows[iid]
+
+    def insert(self, parent, index, iid, values):
+        self.rows[iid] = values
+
+
+class FakeScrollbar:
+    def __init__(self):
+        self.calls = []
+
+    def set(self, first, last):
+        self.calls.append((first, last))
+
+
+class FakeTable:
+    """Just the attributes render_rows reads, so no Tk root is needed."""
+
+    def __init__(self, view, first_row, page_size):
+        self.view, self.first_row, self.page_size = view, first_row, page_size
+        self.tree, self.scrollbar = FakeTree(), FakeScrollbar()
+        self.tree.rows = {"stale": []}
+
+
+class TestRenderRows(unittest.TestCase):
+    """render_rows against stand-ins for the Treeview and scrollbar."""
+
+    def view(self, count):
+        day = date(2025, 1, 1).toordinal()
+        columns = ExpenseColumns()
+        for i in range(count):
+            columns.append(day + i, "Food", i, f"row {i}")
+        return columns
+
+    def render(self, view, first_row, page_size=10):
+        app = FakeTable(view, first_row, page_size)
+        BudgetTrackerApp.render_rows(app)
+        return app
+
+    def test_only_visible_window_is_inserted(self):
+        view = self.view(100)
+        app = self.render(view, 40)
+        self.assertEqual(list(app.tree.rows), [str(i) for i in range(40, 50)])
+        self.assertEqual(app.tree.rows["42"], view.display_values(42))
+        self.assertEqual(app.scrollbar.calls, [(0.4, 0.5)])
+
+    def test_window_is_clamped(self):
+        app = self.render(self.view(25), 100)
+        self.assertEqual(app.first_row, 15)
+        self.assertEqual(list(app.tree.rows), [str(i) for i in range(15, 25)])
+        self.assertEqual(app.scrollbar.calls, [(0.6, 1.0)])
+        app = self.render(self.view(5), -3)
+        self.assertEqual(app.first_row, 0)
+        self.assertEqual(list(app.tree.rows), [str(i) for i in range(5)])
+        self.assertEqual(app.scrollbar.calls, [(0.0, 1.0)])
+
+    def test_empty_view(self):
+        app = self.render(self.view(0), 7)
+        self.assertEqual((app.first_row, app.tree.rows), (0, {}))
+        self.assertEqual(app.scrollbar.calls, [(0.0, 1.0)])
+
+class TestCharts(unittest.TestCase):
+    @staticmethod
+    def spending(series):
+        """{key: paise} for the keys with any spending; bases may differ by zero padding."""
+        return {series.base + i: value for i, value in enumerate(series.values) if value}
+
+    def test_lttb_keeps_endpoints_and_count(self):
+        points = [(x, (x * 37) % 11) for x in range(1000)]
+        for threshold in (3, 10, 250, 999):
+            sampled = lttb(points, threshold)
+            self.assertEqual(len(sampled), threshold)
+            self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+            self.assertEqual(sampled, sorted(sampled))
+
+    def test_lttb_passes_small_inputs_through(self):
+        points = [(x, x * x) for x in range(20)]
+        for threshold in (20, 50, 2, 0):
+            sampled = lttb(points, threshold)
+            self.assertEqual(sampled, points)
+            self.assertIsNot(sampled, points)
+        self.assertEqual(lttb([], 10), [])
+
+    def test_lttb_keeps_a_spike(self):
+        points = [(x, 1.0) for x in range(500)]
+        points[277] = (277, 90.0)
+        self.assertIn((277, 90.0), lttb(points, 20))
+
+    def test_incremental_rollups_match_rebuild(self):
+        start = date(2024, 11, 20).toordinal()
+        rows = [(start + (i * 13) % 120, ("Food", "Bills", "Travel")[i % 3], i % 17 + 0.25, "")
+                for i in range(300)]
+        incremental = SpendingRollups()
+        for ordinal, category, amount, _ in reversed(rows):  # out of date order on purpose
+            incremental.add(ordinal, category, amount)
+        deleted = rows[::4] + [(start - 30, "Gifts", 5.0, "")]
+        incremental.add(start - 30, "Gifts", 5.0)
+        for ordinal, category, amount, _ in deleted:
+            incremental.add(ordinal, category, -amount)
+
+        columns = ExpenseColumns()
+        for row in rows:
+            if row not in deleted:
+                columns.append(*row)
+        rebuilt = SpendingRollups.from_columns(columns)
+        for level in SpendingRollups.LEVELS:
+            self.assertEqual(self.spending(incremental.series[level]), self.spending(rebuilt.series[level]), level)
+        self.assertEqual({category: self.spending(series) for category, series in incremental.by_category.items()
+                          if self.spending(series)},
+                         {category: self.spending(series) for category, series in rebuilt.by_category.items()})
+        lo, hi = start + 10, start + 100
+        for level in SpendingRollups.LEVELS:
+            self.assertEqual([p for p in incremental.points(level, lo, hi) if p[1]],
+                             [p for p in rebuilt.points(level, lo, hi) if p[1]], level)
+        self.assertEqual(incremental.category_totals(lo, hi), rebuilt.category_totals(lo, hi))
+        self.assertEqual(rebuilt.category_totals(lo, hi), columns.between(lo, hi).category_totals())
+
+class TestProfiler(unittest.TestCase):
+    def test_nested_phases_counters_and_dump(self):
+        from unittest import mock
+
+        profiler = Profiler()
+        clock = iter([0.0, 1.0, 3.0, 4.0, 4.5, 10.0, 20.0, 20.25])
+        with mock.patch("time.perf_counter", lambda: next(clock)):
+            with profiler.phase("load"):
+                with profiler.phase("parse"):
+                    profiler.count("rows", 5)
+                with profiler.phase("parse"):
+                    profiler.add_time("dates", 0.125, calls=4)
+                profiler.count("rows")
+            with profiler.phase("parse"):
+                pass
+        profiler.add_time("idle", 0.5)
+        profiler.count("corrupt rows skipped", 0)
+
+        report = profiler.report()
+        self.assertEqual(report["timings"], {
+            "idle": {"calls": 1, "total_ms": 500.0, "mean_ms": 500.0, "max_ms": 500.0},
+            "load": {"calls": 1, "total_ms": 10000.0, "mean_ms": 10000.0, "max_ms": 10000.0},
+            "load/parse": {"calls": 2, "total_ms": 2500.0, "mean_ms": 1250.0, "max_ms": 2000.0},
+            "load/parse/dates": {"calls": 4, "total_ms": 125.0, "mean_ms": 31.25, "max_ms": 31.25},
+            "parse": {"calls": 1, "total_ms": 250.0, "mean_ms": 250.0, "max_ms": 250.0},
+        })
+        self.assertEqual(list(report["timings"]), sorted(report["timings"]))
+        self.assertEqual(report["counters"], {"corrupt rows skipped": 0, "rows": 6})
+        self.assertEqual(report["memory"], [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.json")
+            profiler.dump(path)
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(json.load(file), report)
+        profiler.reset()
+        self.assertEqual(profiler.report(), {"timings": {}, "counters": {}, "memory": []})
+
+    def test_phase_is_recorded_when_it_raises(self):
+        profiler = Profiler()
+        with self.assertRaises(KeyError):
+            with profiler.phase("save"):
+                raise KeyError("x")
+        with profiler.phase("load"):
+            pass
+        self.assertEqual(sorted(profiler.report()["timings"]), ["load", "save"])
+
+    def test_threads_keep_their_own_stack(self):
+        profiler = Profiler()
+        inside = threading.Event()
+        done = threading.Event()
+
+        def worker():
+            with profiler.phase("request"):
+                inside.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        inside.wait(5)
+        with profiler.phase("render"):
+            pass
+        done.set()
+        thread.join()
+        self.assertEqual(sorted(profiler.report()["timings"]), ["render", "request"])
+
+def run_tests():
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+    for case in (TestStoreRestart, TestStoreReads, TestParseExpense, TestBudgets, TestBulkImport,
+                 TestExpenseService, TestHttpApi, TestLoader, TestStoreLayout, TestColumns, TestRenderRows, TestCharts, TestProfiler):
+        suite.addTests(loader.loadTestsFromTestCase(case))
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+    return 0 if result.wasSuccessful() else 1
+
+
+# --- BENCHMARK ---
+def benchmark_loader(rows=10_000_000):
+    """Time load_expenses on a generated file against the csv + strptime loop."""
+    import random
+    import tempfile
+
+    categories = ["Food", "Travel", "Bills", "Shopping", "Health", "Other"]
+    first_day = date(2015, 1, 1).toordinal()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expenses.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(HEADER)
+            for _ in range(rows):
+                writer.writerow([
+                    date.fromordinal(first_day + random.randrange(3650)).isoformat(),
+                    random.choice(categories),
+                    round(random.uniform(1, 5000), 2),
+                    "Benchmark row",
+                ])
+        mb = os.path.getsize(path) / 1e6
+        print(f"{rows:,} rows, {mb:.0f} MB")
+
+        start = time.perf_counter()
+        with open(path, encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            total = 0.0
+            for row in reader:
+                datetime.strptime(row[0], "%Y-%m-%d")
+                total += float(row[2])
+        baseline = time.perf_counter() - start
+        print(f"csv + strptime:      {baseline:7.2f}s  {rows / baseline:12,.0f} rows/s")
+
+        for workers in range(1, (os.cpu_count() or 1) + 1):
+            start = time.perf_counter()
+            data = load_expenses(path, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert len(data) == rows and data.malformed == 0
+            print(
+                f"load_expenses x{workers:<3}  {elapsed:7.2f}s  {rows / elapsed:12,.0f} rows/s  "
+                f"({baseline / elapsed:.1f}x)"
+            )
+
+
+def benchmark_memory(rows=1_000_000):
+    """tracemalloc bytes per row: lists of strings plus display values vs ExpenseColumns."""
+    import random
+    import tempfile
+    import tracemalloc
+
+    categories = ["Food", "Travel", "Bills", "Shopping", "Health", "Other"]
+    descriptions = [f"{word} {n}" for word in ("Lunch", "Taxi", "Rent", "Gift", "Pharmacy") for n in range(40)]
+    first_day = date(2015, 1, 1).toordinal()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expenses.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(HEADER)
+            for i in range(rows):
+                # Mostly recurring descriptions, one in ten unique
+                description = f"Invoice {i}" if i % 10 == 0 else random.choice(descriptions)
+                writer.writerow([date.fromordinal(first_day + random.randrange(3650)).isoformat(),
+                                 random.choice(categories), round(random.uniform(1, 5000), 2), description])
+
+        tracemalloc.start()
+        with open(path, encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            loaded = list(reader)
+        # What load_data used to hand Tk: a formatted values list per row
+        values = [[row[0], row[1], f"₹{row[2]}", row[3]] for row in loaded]
+        before = tracemalloc.get_traced_memory()[0]
+        del loaded, values
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        data = load_expenses(path, workers=1)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    print(f"{rows:,} rows, {len(data.description_pool):,} distinct descriptions")
+    print(f"lists of strings + display values: {before / rows:7.1f} bytes/row  ({before / 1e6:,.0f} MB)")
+    print(f"ExpenseColumns:                    {after / rows:7.1f} bytes/row  ({after / 1e6:,.0f} MB)")
+
+
+def benchmark_chart(rows=1_000_000, width=680):
+    """Per-redraw query cost: rollups + lttb vs re-aggregating the rows, over 10 years."""
+    import random
+
+    categories = ["Food", "Travel", "Bills", "Shopping", "Health", "Other"]
+    first_day = date(2015, 1, 1).toordinal()
+    days = 3650
+    columns = ExpenseColumns()
+    for _ in range(rows):
+        columns.append(first_day + random.randrange(days), random.choice(categories),
+                       round(random.uniform(1, 5000), 2), "")
+
+    start = time.perf_counter()
+    rollups = SpendingRollups.from_columns(columns)
+    print(f"{rows:,} rows over 10 years: rollups built in {(time.perf_counter() - start) * 1e3:.0f}ms (once)")
+
+    def from_rows(lo, hi):
+        # What a chart without rollups does on every pan/zoom step
+        daily = {}
+        part = columns.between(lo, hi)
+        for ordinal, paise in zip(part.ordinals, part.paise):
+            daily[ordinal] = daily.get(ordinal, 0) + paise
+        return lttb(sorted((o, p / 100) for o, p in daily.items()), width), part.category_totals()
+
+    def from_rollups(lo, hi):
+        level = rollups.pick_level(lo, hi, width * 4)
+        return lttb(rollups.points(level, lo, hi), width), rollups.category_totals(lo, hi)
+
+    last_day = first_day + days - 1
+    for label, lo in (("10 years", first_day), ("1 year", last_day - 365), ("1 month", last_day - 30)):
+        timings = {}
+        for name, query in (("rows", from_rows), ("rollups", from_rollups)):
+            began = time.perf_counter()
+            points, _ = query(lo, last_day)
+            timings[name] = (time.perf_counter() - began) * 1e3
+        print(f"{label:>8}: {len(points):4} points, rows {timings['rows']:8.1f}ms, "
+              f"rollups + lttb {timings['rollups']:6.2f}ms")
+    began = time.perf_counter()
+    full = lttb(rollups.points("daily", first_day, last_day), width)
+    print(f"lttb of all {days:,} daily points to {len(full)}: {(time.perf_counter() - began) * 1e3:.2f}ms "
+          f"(frame budget 16.7ms)")
+
+
+def benchmark_dedup(rows=1_000_000):
+    """Screen an import of ``rows`` rows against a store of as many, as the bulk endpoint does."""
+    import random
+    import tracemalloc
+
+    categories = ["Food", "Travel", "Bills", "Shopping", "Health", "Other"]
+    descriptions = [f"{word} {n}" for word in ("Lunch", "Taxi", "Rent", "Gift", "Pharmacy") for n in range(40)]
+    first_day = date(2015, 1, 1).toordinal()
+
+    def generate(n):
+        columns = ExpenseColumns()
+        for _ in range(n):
+            columns.append(first_day + random.randrange(3650), random.choice(categories),
+                           round(random.uniform(1, 5000), 2), random.choice(descriptions))
+        return columns
+
+    stored = generate(rows)
+    # A re-imported bank export: a tenth exact copies, a tenth a day off
+    incoming = generate(rows)
+    for i in random.sample(range(rows), rows // 5):
+        ordinal, category, amount, description = stored.row(i)
+        if i % 2:
+            ordinal += 1
+            category, description = incoming.category(i), incoming.description(i)
+        incoming.ordinals[i] = ordinal
+        incoming.paise[i] = round(amount * 100)
+        incoming.category_codes[i] = incoming.category_pool.encode(category)
+        incoming.description_codes[i] = incoming.description_pool.encode(description)
+
+    tracemalloc.start()
+    index = DuplicateIndex.from_columns(stored)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    start = time.perf_counter()
+    index = DuplicateIndex.from_columns(stored)
+    built = time.perf_counter() - start
+    print(f"index over {rows:,} stored rows: {built:.2f}s, {size / rows:.0f} bytes/row")
+
+    # As POST /expenses/bulk hands them to ExpenseService._apply
+    imported = [(date.fromordinal(ordinal), category, amount, description)
+                for ordinal, category, amount, description in map(incoming.row, range(rows))]
+    start = time.perf_counter()
+    exact, near = index.screen(_columns_from_rows(imported))
+    elapsed = time.perf_counter() - start
+    print(f"screen {rows:,} imported rows: {elapsed:.2f}s  {rows / elapsed:12,.0f} rows/s  "
+          f"({len(exact):,} exact, {len(near):,} near)")
+
+    start = time.perf_counter()
+    for i in range(10_000):
+        index.check(*incoming.row(i))
+    elapsed = time.perf_counter() - start
+    print(f"check one row (add_expense):   {elapsed / 10_000 * 1e6:.2f}µs")
+
+    # Without an index every imported row is a scan of the store
+    sample = 20
+    start = time.perf_counter()
+    for i in range(sample):
+        ordinal, paise = incoming.ordinals[i], incoming.paise[i]
+        any(abs(o - ordinal) <= 1 and p == paise for o, p in zip(stored.ordinals, stored.paise))
+    per_row = (time.perf_counter() - start) / sample
+    print(f"scan per row:                  {per_row * 1e3:.1f}ms  "
+          f"(~{per_row * rows / 3600:,.1f} hours for the import)")
+
+
+def benchmark_journal(inserts=2_000):
+    """Inserts per second for each durability policy against the old append path."""
+    import tempfile
+
+    day = date.today()
+
+    def legacy(path, n):
+        for i in range(n):
+            with open(path, mode="a", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerow([day.isoformat(), "Food", 1.0, f"row {i}"])
+
+    def report(label, n, elapsed):
+        print(f"{label:<28} {n / elapsed:12,.0f} inserts/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        legacy(os.path.join(tmp, "legacy.csv"), inserts)
+        report("open/append/close (no fsync)", inserts, time.perf_counter() - start)
+
+        for policy in Journal.POLICIES:
+            store = ExpenseStore(os.path.join(tmp, policy), None, durability=policy,
+                                 checkpoint_every=inserts * 100)
+            start = time.perf_counter()
+            for i in range(inserts):
+                store.append(day, "Food", 1.0, f"row {i}")
+            report(f"{policy}, 1 writer", inserts, time.perf_counter() - start)
+
+            threads = [
+                threading.Thread(target=lambda: [store.append(day, "Food", 1.0, "threaded")
+                                                 for _ in range(inserts // 8)])
+                for _ in range(8)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report(f"{policy}, 8 writers", inserts // 8 * 8, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with store.batch():
+                for i in range(inserts):
+                    store.append(day, "Food", 1.0, f"batched {i}")
+            report(f"{policy}, batch()", inserts, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            store.close()
+            print(f"{'':<28} checkpoint of {store.checkpoint_lsn:,} records: {time.perf_counter() - start:.2f}s")
+
+
+def benchmark_server(requests=20_000, clients=16, rows=100_000):
+    """Drive a local server over keep-alive connections; report req/s and latency."""
+    import http.client
+    import random
+    import tempfile
+
+    categories = ["Food", "Travel", "Bills", "Shopping", "Health", "Other"]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ExpenseStore(tmp, None, durability="off")
+        first_day = date(2020, 1, 1).toordinal()
+        with store.batch():
+            for _ in range(rows):
+                day = date.fromordinal(first_day + random.randrange(2000))
+                store.append(day, random.choice(categories), round(random.uniform(1, 5000), 2), "seed")
+        store.close()
+
+        server = make_server(port=0, directory=tmp, legacy_file=None, workers=clients)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        latencies = []
+
+        def client(n):
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            mine = []
+            for _ in range(n):
+                roll = random.random()
+                if roll < 0.1:
+                    body = json.dumps({"category": random.choice(categories), "amount": 12.5, "description": "load"})
+                    method, path = "POST", "/expenses"
+                elif roll < 0.2:
+                    body, method, path = None, "GET", "/reports/category?start=2021-01-01&end=2021-06-30"
+                else:
+                    body, method = None, "GET"
+                    path = f"/expenses?start=2021-01-01&limit=50&offset={random.randrange(5_000)}"
+                start = time.perf_counter()
+                conn.request(method, path, body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                mine.append(time.perf_counter() - start)
+                assert response.status in (200, 201), response.status
+            conn.close()
+            latencies.extend(mine)
+
+        threads = [threading.Thread(target=client, args=(requests // clients,)) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        server.service.close()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e3
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e3
+    print(f"{len(latencies):,} requests from {clients} keep-alive clients over {rows:,} rows")
+    print(f"{len(latencies) / elapsed:,.0f} req/s  p50 {p50:.2f}ms  p99 {p99:.2f}ms")
+
+
 if __name__ == "__main__":
+    if "--run-tests" in sys.argv:
+        sys.exit(run_tests())
+
+    if "--profile" in sys.argv:
+        # python main.py --profile [FILE] [--trace-memory] ...: timings and counters as JSON on exit
+        import atexit
+
+        args = sys.argv[sys.argv.index("--profile") + 1:]
+        profile_path = args[0] if args and not args[0].startswith("--") else "profile.json"
+        PROFILE.set_trace_memory("--trace-memory" in sys.argv)
+        sys.argv = [arg for arg in sys.argv if arg not in ("--profile", profile_path, "--trace-memory")]
+        atexit.register(PROFILE.dump, profile_path)
+
+    if "--benchmark" in sys.argv:
+        args = sys.argv[sys.argv.index("--benchmark") + 1:]
+        if args[:1] == ["journal"]:
+            benchmark_journal(int(args[1]) if len(args) > 1 else 2_000)
+        elif args[:1] == ["memory"]:
+            benchmark_memory(int(args[1]) if len(args) > 1 else 1_000_000)
+        elif args[:1] == ["dedup"]:
+            benchmark_dedup(int(args[1]) if len(args) > 1 else 1_000_000)
+        elif args[:1] == ["chart"]:
+            benchmark_chart(int(args[1]) if len(args) > 1 else 1_000_000)
+        elif args[:1] == ["server"]:
+            benchmark_server(int(args[1]) if len(args) > 1 else 20_000)
+        else:
+            benchmark_loader(int(args[0]) if args else 10_000_000)
+        sys.exit(0)
+
+    if "--check-budgets" in sys.argv:
+        # Headless: python main.py --check-budgets ["This Month" | "This Year" | YYYY-MM ...]
+        args = sys.argv[sys.argv.index("--check-budgets") + 1:]
+        # Exits 0 within budget, 1 over budget, 2 for a bad budgets file or period
+        sys.exit(check_budgets_command(args[0] if args else "This Month"))
+
+    if "--serve" in sys.argv:
+        # Headless: python main.py --serve [PORT]
+        args = sys.argv[sys.argv.index("--serve") + 1:]
+        serve(port=int(args[0]) if args else 8765)
+        sys.exit(0)
+
+    if tk is None:
+        print("tkinter is not available; run with --serve for the HTTP API.")
+        sys.exit(1)
+
     root = tk.Tk()
     style = ttk.Style(root)
     style.theme_use('clam')
     app = BudgetTrackerApp(root)
+
+    def on_close():
+        # Fold the journal into the segments so the next start has nothing to replay
+        store = getattr(app, "store", None)
+        if store is not None:
+            store.close()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
     root.mainloop()
\ No newline at end of file
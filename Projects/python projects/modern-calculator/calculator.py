@@ -1,20 +1,23 @@
 from __future__ import annotations
 
 import ast
+import bisect
+import collections
+import importlib.util
+import itertools
+import json
 import operator
 import math
+import os
 import sys
+import time
 from typing import Any, Dict, Callable, Optional
 
-# Optional Tkinter GUI
-try:
-    import tkinter as tk
-    from tkinter import ttk
-    _GUI_AVAILABLE = True
-except Exception:
-    tk = None  # type: ignore
-    ttk = None  # type: ignore
-    _GUI_AVAILABLE = False
+# Optional Tkinter GUI, imported by _load_gui() so the CLI paths never pay
+# for Tk.
+tk = None  # type: ignore
+ttk = None  # type: ignore
+_GUI_AVAILABLE = importlib.util.find_spec("tkinter") is not None
 
 
 # ---------------------------
@@ -125,124 +128,325 @@ def evaluate_expression(expr: str) -> float:
     return float(_eval_node(parsed))
 
 
+# ---------------------------
+# History
+# ---------------------------
+
+_HISTORY_CAPACITY = 500
+_HISTORY_MAX_BYTES = 1 << 20
+
+
+class HistoryEntry:
+    __slots__ = ("seq", "expr", "result")
+
+    def __init__(self, seq: int, expr: str, result: str):
+        self.seq = seq
+        self.expr = expr
+        self.result = result
+
+    def __repr__(self) -> str:
+        return f"HistoryEntry({self.expr!r} = {self.result!r})"
+
+
+class History:
+    """Bounded calculation history backed by an append-only log.
+
+    Memory holds the newest ``capacity`` entries in a ring buffer, indexed
+    for prefix search (a sorted list) and substring search (trigrams).
+    Every entry is appended to ``path`` as a JSON line; when the log would
+    pass ``max_bytes`` it is rotated to ``path + ".1"``. Nothing is read
+    from disk until the history is first used.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: int = _HISTORY_CAPACITY,
+        max_bytes: int = _HISTORY_MAX_BYTES,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._ring: collections.deque[HistoryEntry] = collections.deque()
+        self._by_seq: Dict[int, HistoryEntry] = {}
+        self._sorted: list[tuple[str, int]] = []
+        self._trigrams: Dict[str, set[int]] = {}
+        self._next_seq = 0
+        self._loaded = path is None
+        self._unloaded: list[tuple[str, str]] = []
+        self._unloaded_on_disk = 0
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        pending, self._unloaded = self._unloaded, []
+        on_disk, self._unloaded_on_disk = self._unloaded_on_disk, 0
+        lines: list[str] = []
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path, "r", encoding="utf-8") as handle:
+                    lines.extend(handle.read().splitlines())
+            except OSError:
+                continue
+        # Entries appended before the load are already at the end of the log.
+        if on_disk:
+            lines = lines[: len(lines) - on_disk]
+        for line in lines[-self.capacity :]:
+            try:
+                expr, result = json.loads(line)
+            except (ValueError, TypeError):
+                continue  # a torn or hand-edited line
+            self._remember(str(expr), str(result))
+        for expr, result in pending:
+            self._remember(expr, result)
+
+    def _remember(self, expr: str, result: str) -> HistoryEntry:
+        entry = HistoryEntry(self._next_seq, expr, result)
+        self._next_seq += 1
+        self._ring.append(entry)
+        self._by_seq[entry.seq] = entry
+        bisect.insort(self._sorted, (expr, entry.seq))
+        for gram in self._grams(expr):
+            self._trigrams.setdefault(gram, set()).add(entry.seq)
+        while len(self._ring) > self.capacity:
+            self._forget(self._ring.popleft())
+        return entry
+
+    def _forget(self, entry: HistoryEntry) -> None:
+        del self._by_seq[entry.seq]
+        del self._sorted[bisect.bisect_left(self._sorted, (entry.expr, entry.seq))]
+        for gram in self._grams(entry.expr):
+            seqs = self._trigrams[gram]
+            seqs.discard(entry.seq)
+            if not seqs:
+                del self._trigrams[gram]
+
+    @staticmethod
+    def _grams(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def append(self, expr: str, result: str) -> None:
+        if self._loaded:
+            self._remember(expr, result)
+        else:
+            self._unloaded.append((expr, result))
+            if len(self._unloaded) > self.capacity:
+                del self._unloaded[0]
+        if self.path is None:
+            return
+        line = json.dumps([expr, result], ensure_ascii=False) + "\n"
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(line)
+            if not self._loaded:
+                self._unloaded_on_disk += 1
+        except OSError:
+            pass  # history is a convenience; never block a calculation on it
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._ring)
+
+    def entries(self) -> list[HistoryEntry]:
+        """Oldest first."""
+        self._ensure_loaded()
+        return list(self._ring)
+
+    def recall(self, back: int = 1) -> Optional[str]:
+        """The stored result ``back`` entries ago (1 = latest), not re-evaluated."""
+        self._ensure_loaded()
+        if not 1 <= back <= len(self._ring):
+            return None
+        return self._ring[-back].result
+
+    def search(self, text: str, prefix: bool = False, limit: int = 50) -> list[HistoryEntry]:
+        """Entries whose expression starts with / contains ``text``, newest first."""
+        self._ensure_loaded()
+        if prefix:
+            start = bisect.bisect_left(self._sorted, (text, -1))
+            seqs = []
+            for expr, seq in itertools.islice(self._sorted, start, None):
+                if not expr.startswith(text):
+                    break
+                seqs.append(seq)
+        elif len(text) >= 3:
+            grams = sorted(self._grams(text), key=lambda g: len(self._trigrams.get(g, ())))
+            candidates = set(self._trigrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates &= self._trigrams.get(gram, set())
+            seqs = [seq for seq in candidates if text in self._by_seq[seq].expr]
+        else:
+            seqs = [entry.seq for entry in self._ring if text in entry.expr]
+        seqs.sort(reverse=True)
+        return [self._by_seq[seq] for seq in seqs[:limit]]
+
+
+def _default_history_path(name: str) -> Optional[str]:
+    path = os.environ.get("CALCULATOR_HISTORY")
+    if path is not None:
+        return path or None  # empty disables persistence
+    return os.path.join(os.path.expanduser("~"), name)
+
+
 # ---------------------------
 # Modern GUI
 # ---------------------------
 
-if _GUI_AVAILABLE:
+_FRAME_MS = 16  # ~60 repaints per second at most
+_KEY_CHARS = frozenset("0123456789*/+-().")
+
+_COLORS = {
+    "bg_dark": "#1e1e2e",
+    "bg_display": "#2a2a3e",
+    "fg_text": "#e0e0e0",
+    "fg_dim": "#888899",
+    "btn_number": "#3a3a4e",
+    "btn_operator": "#4a4a6e",
+    "btn_function": "#5a5a7e",
+    "btn_equals": "#6366f1",
+    "btn_clear": "#ef4444",
+    "btn_hover": "#505065",
+}
+
+
+def _button_style(bg: str, fg: str, font: tuple, **extra: str) -> Dict[str, Any]:
+    style = {"bg": bg, "fg": fg, "font": font, "bd": 0, "activebackground": _COLORS["btn_hover"], "cursor": "hand2"}
+    style.update(extra)
+    return style
+
+
+# Widget options per button kind, computed once rather than per button
+_BUTTON_STYLES: Dict[str, Dict[str, Any]] = {
+    "Number": _button_style(_COLORS["btn_number"], _COLORS["fg_text"], ("Segoe UI", 13)),
+    "Operator": _button_style(_COLORS["btn_operator"], "#fbbf24", ("Segoe UI", 14, "bold")),
+    "Function": _button_style(_COLORS["btn_function"], "#a78bfa", ("Segoe UI", 11)),
+    "Equals": _button_style(_COLORS["btn_equals"], "#ffffff", ("Segoe UI", 16, "bold")),
+    "Clear": _button_style(_COLORS["btn_clear"], "#ffffff", ("Segoe UI", 12, "bold")),
+    "Scientific": _button_style(
+        _COLORS["btn_function"], "#a78bfa", ("Segoe UI", 11),
+        activebackground="#6a6a8e", activeforeground="#c4b5fd",
+    ),
+}
+
+_SCI_BUTTONS = (("sin", "sin("), ("cos", "cos("), ("tan", "tan("), ("√", "sqrt("))
+
+_MAIN_BUTTONS = (
+    ("C", "C", "Clear"), ("(", "(", "Function"), (")", ")", "Function"), ("÷", "/", "Operator"),
+    ("7", "7", "Number"), ("8", "8", "Number"), ("9", "9", "Number"), ("×", "*", "Operator"),
+    ("4", "4", "Number"), ("5", "5", "Number"), ("6", "6", "Number"), ("−", "-", "Operator"),
+    ("1", "1", "Number"), ("2", "2", "Number"), ("3", "3", "Number"), ("+", "+", "Operator"),
+    ("±", "neg", "Function"), ("0", "0", "Number"), (".", ".", "Number"), ("=", "equal", "Equals"),
+)
+
+# Set in the environment by the startup benchmark in ../calculator.py: print
+# "ready" once the first frame is idle, then quit.
+_STARTUP_PROBE = "CALCULATOR_STARTUP_PROBE"
+
+
+def _load_gui() -> bool:
+    global tk, ttk, _GUI_AVAILABLE
+    if tk is not None:
+        return True
+    if not _GUI_AVAILABLE:
+        return False
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+    except Exception:
+        _GUI_AVAILABLE = False
+        return False
+    _define_gui()
+    return True
+
+
+def _probe_startup(root: Any) -> None:
+    if os.environ.get(_STARTUP_PROBE):
+
+        def ready() -> None:
+            print("ready", flush=True)
+            root.destroy()
+
+        root.after_idle(ready)
+
+
+def _define_gui() -> None:
+    global ModernCalculatorUI, _history_window
+
+    def _history_window(
+        master: tk.Misc, history: History, on_pick: Callable[[str], None]
+    ) -> tk.Toplevel:
+        """Searchable list of past calculations; picking one hands back its result.
+
+        Typing filters by substring; a leading ``^`` matches prefixes instead.
+        """
+        window = tk.Toplevel(master)
+        window.title("History")
+        query = tk.StringVar()
+        entry = ttk.Entry(window, textvariable=query)
+        entry.pack(fill=tk.X, padx=8, pady=8)
+        listbox = tk.Listbox(window, width=40, height=15)
+        listbox.pack(expand=True, fill=tk.BOTH, padx=8, pady=(0, 8))
+        shown: list[HistoryEntry] = []
+
+        def refresh(*_: Any) -> None:
+            text = query.get()
+            if text.startswith("^"):
+                shown[:] = history.search(text[1:], prefix=True)
+            else:
+                shown[:] = history.search(text)
+            listbox.delete(0, tk.END)
+            for item in shown:
+                listbox.insert(tk.END, f"{item.expr} = {item.result}")
+
+        def pick(_: Any = None) -> None:
+            selection = listbox.curselection()
+            index = selection[0] if selection else 0
+            if index < len(shown):
+                on_pick(shown[index].result)
+            window.destroy()
+
+        query.trace_add("write", refresh)
+        entry.bind("<Return>", pick)
+        listbox.bind("<Return>", pick)
+        listbox.bind("<Double-Button-1>", pick)
+        window.bind("<Escape>", lambda _: window.destroy())
+        refresh()
+        entry.focus_set()
+        return window
 
     class ModernCalculatorUI(ttk.Frame):
         def __init__(self, master: tk.Tk | tk.Widget):
             super().__init__(master, padding=0)
             self.master = master
-            self._setup_colors()
+            self._input: list[tuple[str, str]] = []
+            self._frame_job: Optional[str] = None
+            self._expr_text = ""
+            self._display_text = "0"
+            self.repaints = 0
             self._make_style()
             self.pack(expand=True, fill=tk.BOTH)
             self._create_widgets()
-            self.history: list[str] = []
+            self.history = History(_default_history_path(".modern_calculator_history"))
+            self._recall_back = 0
             self.current_expr = ""
 
-        def _setup_colors(self) -> None:
-            """Modern color scheme with dark theme"""
-            self.bg_dark = "#1e1e2e"
-            self.bg_display = "#2a2a3e"
-            self.fg_text = "#e0e0e0"
-            self.fg_dim = "#888899"
-            self.btn_number = "#3a3a4e"
-            self.btn_operator = "#4a4a6e"
-            self.btn_function = "#5a5a7e"
-            self.btn_equals = "#6366f1"
-            self.btn_clear = "#ef4444"
-            self.btn_hover = "#505065"
-            
         def _make_style(self) -> None:
-            style = ttk.Style()
-            
-            # Configure root background
-            self.master.configure(bg=self.bg_dark)
+            # Buttons are plain tk widgets styled from _BUTTON_STYLES; only the
+            # frame goes through ttk.
+            self.master.configure(bg=_COLORS["bg_dark"])
+            ttk.Style().configure("Dark.TFrame", background=_COLORS["bg_dark"])
             self.configure(style="Dark.TFrame")
-            
-            style.configure("Dark.TFrame", background=self.bg_dark)
-            
-            # Modern button styles with flat design
-            style.configure(
-                "Modern.TButton",
-                background=self.btn_number,
-                foreground=self.fg_text,
-                borderwidth=0,
-                focuscolor='none',
-                font=("Segoe UI", 13, "normal"),
-                padding=(16, 16)
-            )
-            
-            style.map("Modern.TButton",
-                background=[("active", self.btn_hover)],
-                foreground=[("active", "#ffffff")]
-            )
-            
-            # Operator buttons
-            style.configure(
-                "Operator.TButton",
-                background=self.btn_operator,
-                foreground="#fbbf24",
-                font=("Segoe UI", 14, "bold"),
-                padding=(16, 16)
-            )
-            
-            style.map("Operator.TButton",
-                background=[("active", "#5a5a7e")],
-                foreground=[("active", "#fcd34d")]
-            )
-            
-            # Function buttons
-            style.configure(
-                "Function.TButton",
-                background=self.btn_function,
-                foreground="#a78bfa",
-                font=("Segoe UI", 11),
-                padding=(12, 12)
-            )
-            
-            style.map("Function.TButton",
-                background=[("active", "#6a6a8e")],
-                foreground=[("active", "#c4b5fd")]
-            )
-            
-            # Equals button
-            style.configure(
-                "Equals.TButton",
-                background=self.btn_equals,
-                foreground="#ffffff",
-                font=("Segoe UI", 16, "bold"),
-                padding=(16, 16)
-            )
-            
-            style.map("Equals.TButton",
-                background=[("active", "#4f46e5")],
-                foreground=[("active", "#ffffff")]
-            )
-            
-            # Clear button
-            style.configure(
-                "Clear.TButton",
-                background=self.btn_clear,
-                foreground="#ffffff",
-                font=("Segoe UI", 12, "bold"),
-                padding=(16, 16)
-            )
-            
-            style.map("Clear.TButton",
-                background=[("active", "#dc2626")],
-                foreground=[("active", "#ffffff")]
-            )
 
         def _create_widgets(self) -> None:
             # Main container with dark background
-            main_container = tk.Frame(self, bg=self.bg_dark)
+            main_container = tk.Frame(self, bg=_COLORS["bg_dark"])
             main_container.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
             
             # Display area with modern styling
-            display_frame = tk.Frame(main_container, bg=self.bg_display, 
+            display_frame = tk.Frame(main_container, bg=_COLORS["bg_display"], 
                                     highlightthickness=0)
             display_frame.pack(fill=tk.X, pady=(0, 20))
             
@@ -251,8 +455,8 @@ if _GUI_AVAILABLE:
             expr_label = tk.Label(
                 display_frame,
                 textvariable=self.expr_var,
-                bg=self.bg_display,
-                fg=self.fg_dim,
+                bg=_COLORS["bg_display"],
+                fg=_COLORS["fg_dim"],
                 font=("Segoe UI", 12),
                 anchor="e"
             )
@@ -263,8 +467,8 @@ if _GUI_AVAILABLE:
             result_label = tk.Label(
                 display_frame,
                 textvariable=self.display_var,
-                bg=self.bg_display,
-                fg=self.fg_text,
+                bg=_COLORS["bg_display"],
+                fg=_COLORS["fg_text"],
                 font=("Segoe UI", 32, "bold"),
                 anchor="e"
             )
@@ -272,106 +476,21 @@ if _GUI_AVAILABLE:
             
             # Bind keyboard shortcuts to the main window
             self.master.bind("<Key>", self._on_keypress)
+            self.master.bind("<Control-h>", self._open_history)
+            self.master.bind("<Control-v>", self._on_paste)
             self.master.focus_set()
             
             # Button grid with modern layout
-            button_frame = tk.Frame(main_container, bg=self.bg_dark)
+            self.button_frame = button_frame = tk.Frame(main_container, bg=_COLORS["bg_dark"])
             button_frame.pack(expand=True, fill=tk.BOTH)
             
-            # Scientific function row
-            sci_buttons = [
-                ("sin", "sin(", "Function.TButton"),
-                ("cos", "cos(", "Function.TButton"),
-                ("tan", "tan(", "Function.TButton"),
-                ("√", "sqrt(", "Function.TButton"),
-            ]
-            
-            for col, (label, action, style) in enumerate(sci_buttons):
-                btn = tk.Button(
-                    button_frame,
-                    text=label,
-                    command=lambda a=action: self._on_press(a),
-                    bg=self.btn_function,
-                    fg="#a78bfa",
-                    font=("Segoe UI", 11),
-                    bd=0,
-                    activebackground="#6a6a8e",
-                    activeforeground="#c4b5fd",
-                    cursor="hand2"
-                )
-                btn.grid(row=0, column=col, sticky="nsew", padx=3, pady=3)
-            
-            # Main calculator buttons
-            buttons = [
-                ("C", "C", "Clear.TButton"),
-                ("(", "(", "Function.TButton"),
-                (")", ")", "Function.TButton"),
-                ("÷", "/", "Operator.TButton"),
-                
-                ("7", "7", "Modern.TButton"),
-                ("8", "8", "Modern.TButton"),
-                ("9", "9", "Modern.TButton"),
-                ("×", "*", "Operator.TButton"),
-                
-                ("4", "4", "Modern.TButton"),
-                ("5", "5", "Modern.TButton"),
-                ("6", "6", "Modern.TButton"),
-                ("−", "-", "Operator.TButton"),
-                
-                ("1", "1", "Modern.TButton"),
-                ("2", "2", "Modern.TButton"),
-                ("3", "3", "Modern.TButton"),
-                ("+", "+", "Operator.TButton"),
-                
-                ("±", "neg", "Function.TButton"),
-                ("0", "0", "Modern.TButton"),
-                (".", ".", "Modern.TButton"),
-                ("=", "equal", "Equals.TButton"),
-            ]
-            
-            r, c = 1, 0
-            for label, action, style in buttons:
-                if style == "Modern.TButton":
-                    bg = self.btn_number
-                    fg = self.fg_text
-                    font = ("Segoe UI", 13)
-                elif style == "Operator.TButton":
-                    bg = self.btn_operator
-                    fg = "#fbbf24"
-                    font = ("Segoe UI", 14, "bold")
-                elif style == "Function.TButton":
-                    bg = self.btn_function
-                    fg = "#a78bfa"
-                    font = ("Segoe UI", 11)
-                elif style == "Equals.TButton":
-                    bg = self.btn_equals
-                    fg = "#ffffff"
-                    font = ("Segoe UI", 16, "bold")
-                elif style == "Clear.TButton":
-                    bg = self.btn_clear
-                    fg = "#ffffff"
-                    font = ("Segoe UI", 12, "bold")
-                else:
-                    bg = self.btn_number
-                    fg = self.fg_text
-                    font = ("Segoe UI", 13)
-                
-                btn = tk.Button(
+            for index, (label, action, style) in enumerate(_MAIN_BUTTONS):
+                tk.Button(
                     button_frame,
                     text=label,
                     command=lambda a=action: self._on_press(a),
-                    bg=bg,
-                    fg=fg,
-                    font=font,
-                    bd=0,
-                    activebackground=self.btn_hover,
-                    cursor="hand2"
-                )
-                btn.grid(row=r, column=c, sticky="nsew", padx=3, pady=3)
-                c += 1
-                if c > 3:
-                    c = 0
-                    r += 1
+                    **_BUTTON_STYLES[style],
+                ).grid(row=1 + index // 4, column=index % 4, sticky="nsew", padx=3, pady=3)
             
             # Configure grid weights for responsive layout
             for i in range(6):
@@ -379,11 +498,94 @@ if _GUI_AVAILABLE:
             for i in range(4):
                 button_frame.columnconfigure(i, weight=1)
 
+            # The scientific row is filled in once the first frame is up
+            self.after_idle(lambda: self.after(1, self._build_scientific_row))
+
+        def _build_scientific_row(self) -> None:
+            for col, (label, action) in enumerate(_SCI_BUTTONS):
+                tk.Button(
+                    self.button_frame,
+                    text=label,
+                    command=lambda a=action: self._on_press(a),
+                    **_BUTTON_STYLES["Scientific"],
+                ).grid(row=0, column=col, sticky="nsew", padx=3, pady=3)
+
+        # Input is queued and applied once per frame: holding a key or
+        # pasting a long expression costs one repaint per frame instead of
+        # one per event.
+        def _set_text(self, expr: Optional[str] = None, display: Optional[str] = None) -> None:
+            if expr is not None:
+                self._expr_text = expr
+            if display is not None:
+                self._display_text = display
+            self._schedule_frame()
+
+        def _schedule_frame(self) -> None:
+            if self._frame_job is None:
+                self._frame_job = self.after(_FRAME_MS, self._run_frame)
+
+        def _run_frame(self) -> None:
+            self._frame_job = None
+            self._drain_input()
+            self._repaint()
+
+        def _repaint(self) -> None:
+            # StringVar.set redraws even when the value is unchanged
+            if self.expr_var.get() != self._expr_text:
+                self.expr_var.set(self._expr_text)
+            if self.display_var.get() != self._display_text:
+                self.display_var.set(self._display_text)
+            self.repaints += 1
+
+        def _drain_input(self) -> None:
+            if not self._input:
+                return
+            pending, self._input = self._input, []
+            typed: list[str] = []
+            for key, char in pending:
+                if key == "<paste>" or char in _KEY_CHARS:
+                    typed.extend(c for c in char if c in _KEY_CHARS)
+                    self._recall_back = 0
+                    continue
+                if key == "BackSpace" and typed:
+                    typed.pop()
+                    continue
+                # Everything else acts on the expression typed so far, and
+                # may leave it alone (Shift, Tab), so show it first
+                if typed:
+                    self.current_expr += "".join(typed)
+                    typed = []
+                    self._set_text(expr=self.current_expr)
+                self._apply_key(key)
+            if typed:
+                self.current_expr += "".join(typed)
+                self._set_text(expr=self.current_expr)
+
+        def _apply_key(self, key: str) -> None:
+            if key in ("Return", "KP_Enter"):
+                self._on_equal()
+            elif key == "Escape":
+                self._on_press("C")
+            elif key in ("Up", "Down"):
+                # Step through earlier results without re-evaluating
+                back = self._recall_back + (1 if key == "Up" else -1)
+                result = self.history.recall(back)
+                if result is not None:
+                    self._recall_back = back
+                    self.current_expr = result
+                    self._set_text(expr=result)
+                return
+            elif key == "BackSpace" and self.current_expr:
+                self.current_expr = self.current_expr[:-1]
+                self._set_text(expr=self.current_expr)
+            self._recall_back = 0
+
         def _on_press(self, action: str) -> None:
+            # Buttons act after any keystrokes still queued
+            self._drain_input()
             if action == "C":
                 self.current_expr = ""
-                self.expr_var.set("")
-                self.display_var.set("0")
+                self._set_text(expr="", display="0")
                 return
                 
             if action == "neg":
@@ -396,7 +598,7 @@ if _GUI_AVAILABLE:
                             self.current_expr = parts + num[1:]
                         else:
                             self.current_expr = parts + "-" + num
-                        self.expr_var.set(self.current_expr)
+                        self._set_text(expr=self.current_expr)
                 return
                 
             if action == "equal":
@@ -405,44 +607,20 @@ if _GUI_AVAILABLE:
                 
             # Add to expression
             self.current_expr += action
-            self.expr_var.set(self.current_expr)
+            self._set_text(expr=self.current_expr)
 
         def _on_keypress(self, event: tk.Event) -> Optional[str]:
-            key = event.keysym
-            char = event.char
-
-            if key in ("Return", "KP_Enter"):
-                self._on_equal()
-                return "break"
-
-            if key == "Escape":
-                self._on_press("C")
-                return "break"
-
-            if key == "BackSpace":
-                if self.current_expr:
-                    self.current_expr = self.current_expr[:-1]
-                    self.expr_var.set(self.current_expr)
-                return "break"
+            self._input.append((event.keysym, event.char))
+            self._schedule_frame()
+            return "break"
 
-            # Map keys to calculator functions
-            key_map = {
-                '*': '*',
-                '/': '/',
-                '+': '+',
-                '-': '-',
-                '(': '(',
-                ')': ')',
-                '.': '.',
-            }
-            
-            if char in "0123456789":
-                self._on_press(char)
-                return "break"
-            elif char in key_map:
-                self._on_press(key_map[char])
+        def _on_paste(self, _event: Any = None) -> str:
+            try:
+                text = self.clipboard_get()
+            except tk.TclError:
                 return "break"
-
+            self._input.append(("<paste>", text))
+            self._schedule_frame()
             return "break"
 
         def _on_equal(self) -> None:
@@ -452,17 +630,24 @@ if _GUI_AVAILABLE:
             try:
                 result = evaluate_expression(self.current_expr)
                 out = str(int(result)) if result.is_integer() else f"{result:.8f}".rstrip('0').rstrip('.')
-                self.history.append(f"{self.current_expr} = {out}")
-                self.display_var.set(out)
+                self.history.append(self.current_expr, out)
                 self.current_expr = out
-                self.expr_var.set("")
+                self._set_text(expr="", display=out)
             except CalcError:
                 self._show_error()
 
+        def _open_history(self, _event: Any = None) -> str:
+            _history_window(self.master, self.history, self._insert_result)
+            return "break"
+
+        def _insert_result(self, result: str) -> None:
+            self._drain_input()
+            self.current_expr += result
+            self._set_text(expr=self.current_expr)
+
         def _show_error(self) -> None:
-            self.display_var.set("Error")
-            self.expr_var.set("")
-            self.after(1500, lambda: self.display_var.set("0"))
+            self._set_text(expr="", display="Error")
+            self.after(1500, lambda: self._set_text(display="0"))
             self.current_expr = ""
 
 
@@ -522,6 +707,68 @@ def cli_repl(non_interactive_fallback: Optional[list[str]] = None) -> None:
     print("No interactive stdin available and no expressions provided.")
 
 
+# ---------------------------
+# Benchmarks
+# ---------------------------
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _bench_input(events: int = 10_000) -> int:
+    """Replay synthetic keystrokes: per-event redraw vs the per-frame pipeline."""
+    if not _load_gui():
+        print("tkinter is required for this benchmark")
+        return 1
+    os.environ["CALCULATOR_HISTORY"] = ""  # keep the replay out of the real history
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"No display ({e}); run under Xvfb, e.g. xvfb-run python calculator.py --benchmark")
+        return 1
+    ui = ModernCalculatorUI(root)
+    root.update()
+    Event = collections.namedtuple("Event", "keysym char")
+    keys = [Event(c, c) for c in itertools.islice(itertools.cycle("12+34*(5-6)/7."), events)]
+
+    def per_event(event: Any) -> None:
+        # What _on_keypress used to do: update the expression and its label on every key
+        ui.current_expr += event.char
+        ui.expr_var.set(ui.current_expr)
+
+    def replay(handler: Callable[[Any], Any]) -> list[float]:
+        ui.current_expr = ""
+        ui.expr_var.set("")
+        latencies = []
+        for i, event in enumerate(keys):
+            start = time.perf_counter()
+            handler(event)
+            latencies.append(time.perf_counter() - start)
+            if i % 20 == 19:
+                root.update()  # let frames run as they would during fast typing
+        root.update()
+        return latencies
+
+    for label, handler in (("per-event redraw", per_event), ("coalesced", ui._on_keypress)):
+        ui.repaints = 0
+        start = time.perf_counter()
+        latencies = replay(handler)
+        if handler is ui._on_keypress:
+            root.after(_FRAME_MS * 2)
+            root.update()
+        elapsed = time.perf_counter() - start
+        head, tail = latencies[:1000], latencies[-1000:]
+        repaints = ui.repaints if handler is ui._on_keypress else events
+        print(
+            f"{label:<17} first 1k p50 {_percentile(head, 0.5) * 1e6:6.1f}us p99 {_percentile(head, 0.99) * 1e6:7.1f}us | "
+            f"last 1k p50 {_percentile(tail, 0.5) * 1e6:6.1f}us p99 {_percentile(tail, 0.99) * 1e6:7.1f}us | "
+            f"{repaints:,} repaints, {elapsed:.2f}s total"
+        )
+    root.destroy()
+    return 0
+
+
 # ---------------------------
 # Tests
 # ---------------------------
@@ -577,9 +824,109 @@ class TestEvaluateExpression(unittest.TestCase):
         self.assertEqual(evaluate_expression("abs(-7)"), 7.0)
 
 
+class TestHistory(unittest.TestCase):
+    def test_bounded_and_persisted(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history")
+            history = History(path, capacity=2)
+            for expr, out in (("1+1", "2"), ("2+2", "4"), ("3+3", "6")):
+                history.append(expr, out)
+            self.assertEqual(len(history), 2)
+            reopened = History(path, capacity=2)
+            self.assertEqual(reopened.recall(1), "6")
+            self.assertEqual([e.expr for e in reopened.search("+", prefix=False)], ["3+3", "2+2"])
+
+
+class TestButtonTables(unittest.TestCase):
+    def test_every_button_has_a_style(self):
+        self.assertEqual(len(_MAIN_BUTTONS), 20)
+        for _label, _action, style in _MAIN_BUTTONS:
+            self.assertIn(style, _BUTTON_STYLES)
+
+
+@unittest.skipUnless(_GUI_AVAILABLE, "tkinter is not installed")
+class TestInputQueue(unittest.TestCase):
+    """The per-frame input pipeline, driven without a Tk window."""
+
+    def setUp(self):
+        _load_gui()
+        methods = ("_drain_input", "_apply_key", "_on_press", "_on_equal", "_set_text")
+        ui = type("HeadlessUI", (), {name: getattr(ModernCalculatorUI, name) for name in methods})()
+        ui._input = []
+        ui._expr_text = ""
+        ui._display_text = "0"
+        ui._recall_back = 0
+        ui.current_expr = ""
+        ui.history = History(None)
+        ui.frames = 0
+
+        def schedule() -> None:
+            ui.frames += 1
+
+        ui._schedule_frame = schedule
+        self.ui = ui
+
+    def feed(self, *events: tuple[str, str]) -> None:
+        self.ui._input.extend(events)
+        self.ui._drain_input()
+
+    def keys(self, text: str) -> list[tuple[str, str]]:
+        return [(c, c) for c in text]
+
+    def test_queued_keys_are_applied_in_one_frame(self):
+        self.feed(*self.keys("12+34"))
+        self.assertEqual(self.ui.current_expr, "12+34")
+        self.assertEqual(self.ui._expr_text, "12+34")
+        self.assertEqual(self.ui.frames, 1)
+        self.assertEqual(self.ui._input, [])
+
+    def test_paste_keeps_only_calculator_characters(self):
+        self.feed(("<paste>", "2 * (3 + x4)\n"), ("5", "5"))
+        self.assertEqual(self.ui.current_expr, "2*(3+4)5")
+
+    def test_backspace_coalesces_with_queued_keys(self):
+        self.feed(*self.keys("123"), ("BackSpace", "\b"), ("BackSpace", "\b"), *self.keys("9"))
+        self.assertEqual(self.ui.current_expr, "19")
+        self.assertEqual(self.ui.frames, 1)
+        # With nothing queued it edits the expression already typed
+        self.feed(("BackSpace", "\b"), ("BackSpace", "\b"), ("BackSpace", "\b"), *self.keys("7"))
+        self.assertEqual(self.ui.current_expr, "7")
+
+    def test_keys_after_return_start_from_the_result(self):
+        self.feed(*self.keys("6*7"), ("Return", "\r"), *self.keys("+1"))
+        self.assertEqual(self.ui.current_expr, "42+1")
+        self.assertEqual(self.ui._display_text, "42")
+        self.feed(("Escape", "\x1b"))
+        self.assertEqual((self.ui.current_expr, self.ui._display_text), ("", "0"))
+
+    def test_up_recalls_history_and_typing_resets_it(self):
+        self.ui.history.append("1+1", "2")
+        self.ui.history.append("2+2", "4")
+        self.feed(("Up", ""), ("Up", ""))
+        self.assertEqual(self.ui.current_expr, "2")
+        self.feed(*self.keys("0"), ("Up", ""))
+        self.assertEqual(self.ui.current_expr, "4")
+
+    def test_typing_before_a_non_editing_key_is_shown(self):
+        for key in ("Shift_L", "Tab", "Left", "Up"):
+            with self.subTest(key=key):
+                self.setUp()
+                self.feed(*self.keys("12"), (key, ""))
+                self.assertEqual((self.ui.current_expr, self.ui._expr_text), ("12", "12"))
+
+    def test_button_press_drains_queued_keys_first(self):
+        self.ui._input.extend(self.keys("12"))
+        self.ui._on_press("+")
+        self.assertEqual(self.ui.current_expr, "12+")
+
+
 def run_tests() -> int:
     loader = unittest.TestLoader()
-    suite = loader.loadTestsFromTestCase(TestEvaluateExpression)
+    suite = unittest.TestSuite()
+    for case in (TestEvaluateExpression, TestHistory, TestButtonTables, TestInputQueue):
+        suite.addTests(loader.loadTestsFromTestCase(case))
     result = unittest.TextTestRunner(verbosity=2).run(suite)
     return 0 if result.wasSuccessful() else 1
 
@@ -594,6 +941,9 @@ def main(argv: list[str] | None = None) -> int:
     if "--run-tests" in argv:
         return run_tests()
 
+    if "--benchmark" in argv:
+        return _bench_input()
+
     if "--eval" in argv:
         try:
             expr = argv[argv.index("--eval") + 1]
@@ -613,12 +963,13 @@ def main(argv: list[str] | None = None) -> int:
         cli_repl(fallback or None)
         return 0
 
-    if _GUI_AVAILABLE and "--no-gui" not in argv:
+    if "--no-gui" not in argv and _load_gui():
         root = tk.Tk()
         root.title("Modern Calculator")
         root.geometry("440x680")
         root.resizable(False, False)
         ModernCalculatorUI(root)
+        _probe_startup(root)
         try:
             root.mainloop()
         except KeyboardInterrupt: